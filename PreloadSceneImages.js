@@ -31,6 +31,12 @@
  * @desc Preload images for common events only when they are called?
  * @default true
  *
+ * @param manifestFile
+ * @type string
+ * @desc Precomputed per-map/common event image lists in the data folder
+ * (rpgm_strip.py -m); events are scanned when it's missing.
+ * @default PreloadManifest.json
+ *
  * @help
  * ============================================================================
  * Introduction
@@ -73,6 +79,12 @@
  *	the cached resources. This allows for efficient reuse if the player
  *	returns to a previously visited map.
  *
+ * 6. **Preload Manifest:** If `manifestFile` exists in the data folder
+ *	(generated by `tools/rpgm_strip.py -m`), image lists of maps and common
+ *	events are taken from it instead of scanning the events on each load.
+ *	The images of the common events a map reaches are loaded when they are
+ *	called, or with the map when `preloadCommonEventsOnDemand` is off.
+ *
  * ============================================================================
  * Parameters
  * ============================================================================
@@ -91,6 +103,10 @@
  *   batch size can be faster, but may cause noticeable pauses.  Experiment
  *   with different values to find the best balance for your game.
  *
+ * * **manifestFile:**  Name of the preload manifest in the data folder made
+ *   by `rpgm_strip.py -m`. Regenerate it after changing maps or common
+ *   events; leave empty to always scan the events.
+ *
  * ============================================================================
  * Compatibility
  * ============================================================================
@@ -113,6 +129,7 @@
  * ============================================================================
  *
  * Version 1.0.0: Initial release.
+ * Version 1.1.0: Optional precomputed preload manifest.
  *
  */
 
@@ -134,6 +151,7 @@ const debugMode = getBoolean(parameters['debugMode'], false);
 const loadBatchSIze = parseInt(parameters['loadBatchSize']) || 5;
 const unloadBatchSize = parseInt(parameters['unloadBatchSize']) || 10;
 const preloadCEOnDemand = getBoolean(parameters['preloadCommonEventsOnDemand'], true);
+const manifestFile = parameters['manifestFile'] === undefined ? 'PreloadManifest.json' : parameters['manifestFile'];
 
 var _previousMapId = -1;
 var _isPreloading = false;
@@ -141,11 +159,50 @@ var _loadedResourcesForMap = new Set();
 var _requestedFiles= {};
 var _loadedCommonEvents = new Map();
 var _recentMapsWithResources = []; // Queue to track recent maps and their resources
+var _manifest = null;
 
 function log(message) {
 	if (debugMode) console.log(`[${PLUGIN_NAME}] ${message}`);
 }
 
+function loadManifest() {
+	if (!manifestFile) return;
+	const xhr = new XMLHttpRequest();
+	xhr.open('GET', 'data/' + manifestFile);
+	xhr.overrideMimeType('application/json');
+	xhr.onload = function() {
+		if (xhr.status >= 400) return;
+		try {
+			_manifest = JSON.parse(xhr.responseText);
+			log(`Loaded preload manifest ${manifestFile}`);
+		} catch (e) {
+			console.error(`[${PLUGIN_NAME}] Invalid preload manifest ${manifestFile}`, e);
+		}
+	};
+	xhr.onerror = function() {}; // optional file, events get scanned instead
+	xhr.send();
+}
+
+function manifestPaths(group, id) {
+	if (!_manifest || !_manifest[group]) return null;
+	const paths = _manifest[group][id];
+	return paths ? paths.slice() : null;
+}
+
+// Images of a map from the manifest; those of the common events it reaches are
+// only added when they aren't preloaded on demand
+function manifestMapPaths(mapId) {
+	const paths = manifestPaths('maps', mapId);
+	if (!paths || preloadCEOnDemand || !_manifest.mapCommonEvents) return paths;
+	const allPaths = new Set(paths);
+	for (const commonEventId of _manifest.mapCommonEvents[mapId] || []) {
+		(manifestPaths('commonEvents', commonEventId) || []).forEach(path => allPaths.add(path));
+	}
+	return Array.from(allPaths);
+}
+
+if (preloadImages) loadManifest();
+
 function fileExists(path) {
 	try { return fs.existsSync(path); } catch (e) { return false; }
 }
@@ -254,7 +311,9 @@ function preloadCommonEvent(commonEventId, preloadImages) {
 	if (commonEventId !== -1 && !_loadedCommonEvents.has(commonEventId)) {
 		const commonEvent = $dataCommonEvents[commonEventId];
 		if (commonEvent) {
-			const commonEventResources = extractImagePathsFromCommands(commonEvent.list);
+			const listedResources = manifestPaths('commonEvents', commonEventId);
+			const commonEventResources = listedResources ? new Set(listedResources) :
+				extractImagePathsFromCommands(commonEvent.list);
 			if (!commonEventResources.size) return;
 			if (!preloadImages) {
 				_loadedCommonEvents.set(commonEventId, new Set(commonEventResources));
@@ -676,7 +735,7 @@ Scene_Map.prototype.onMapLoaded = function () {
 	log(`Map loaded: ${mapId}`);
 
 	const mapData = $dataMap;
-	const newResourcePaths = extractImagePaths(mapData);
+	const newResourcePaths = manifestMapPaths(mapId) || extractImagePaths(mapData);
 	trackMapResources(mapId, newResourcePaths);
 
 	log(`Resources to preload: ${newResourcePaths.join(', ')}`);
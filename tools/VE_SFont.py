@@ -1,18 +1,94 @@
 import os
-from PIL import Image, ImageDraw, ImageFont
+import json
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageFont, ImageFilter
+
+ASCII_CHARACTERS = "!\"#$%&'()+,-./0123456789:;<=>?ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+KANA_CHARACTERS = (''.join(map(chr, range(0x3041, 0x3097))) + ''.join(map(chr, range(0x30A1, 0x30FB)))
+                   + 'ー、。「」『』・！？（）〜…')
+CJK_CHARACTERS = ''.join(map(chr, range(0x4E00, 0xA000)))  # CJK Unified Ideographs
+MAX_TEXTURE_SIZE = 4096  # WebGL MAX_TEXTURE_SIZE supported by practically all devices
+CHARSETS = {'ascii': ASCII_CHARACTERS, 'kana': KANA_CHARACTERS, 'cjk': CJK_CHARACTERS}
+
+# (font path, font size, outline width, char) -> (glyph mask, outline mask), kept per process
+_glyph_masks = {}
+
+def measure_glyphs(font, characters):
+    """
+    Measures every (unique) character once: returns {char: (width, bbox)}.
+    """
+    metrics = {}
+    for char in dict.fromkeys(characters):
+        bbox = font.getbbox(char)
+        metrics[char] = (bbox[2] - bbox[0] + 2, bbox)  # Add small padding
+    return metrics
+
+def glyph_masks(font, font_path, font_size, char, bbox, width, height, outline_width=1):
+    """
+    Rasterises a character once into an alpha mask of its cell (plus the outline
+    margin) and dilates it into the outline mask; the masks are reused for every
+    colour variant of the font.
+    """
+    key = (font_path, font_size, outline_width, char)
+    if key not in _glyph_masks:
+        m = outline_width
+        mask = Image.new("L", (width + 2 * m, height + 2 * m), 0)
+        ImageDraw.Draw(mask).text((m - bbox[0] + 1, m), char, font=font, fill=255)
+        outline = mask.filter(ImageFilter.MaxFilter(2 * m + 1)) if m else None
+        _glyph_masks[key] = (mask, outline)
+    return _glyph_masks[key]
+
+def compose_glyph(sheet, x, y, mask, outline, font_color, outline_color):
+    """
+    Draws the outline and the glyph masks onto the sheet with (x, y) as the top left
+    corner of the masks, clipping whatever falls off the sheet.
+    """
+    def layer(color, alpha):
+        return Image.merge("RGBA", [*Image.new("RGB", alpha.size, tuple(color[:3])).split(), alpha])
+
+    cell = layer(font_color, mask)
+    if outline is not None:
+        cell = Image.alpha_composite(layer(outline_color, outline), cell)
+    sx, sy = max(-x, 0), max(-y, 0)
+    sheet.alpha_composite(cell, (x + sx, y + sy), (sx, sy))
+
+def pack_glyphs(widths, height, spacing, max_width, max_height):
+    """
+    Packs equally high glyphs into rows (shelves) of up to max_width pixels and the
+    rows into pages of up to max_height pixels.
+    Returns {char: (page, x, y)} and the [(width, height)] of the pages.
+    """
+    positions = {}
+    pages = []
+    x = y = 0
+    for char, width in widths.items():
+        if x and x + width > max_width:
+            x, y = 0, y + height + spacing
+        if not pages or y + height > max_height:
+            pages.append([0, 0])
+            x = y = 0
+        positions[char] = (len(pages) - 1, x, y)
+        x += width + spacing
+        pages[-1][0] = max(pages[-1][0], x - spacing)
+        pages[-1][1] = y + height
+    return positions, [tuple(page) for page in pages]
 
 def generate_sfont(
-    font_path, 
-    font_size, 
-    output_path, 
-    characters= "!\"#$%&'()+,-./0123456789:;<=>?ABCDEFGHIJKLMNOPQRSTUVWXYZ[\]^_`abcdefghijklmnopqrstuvwxyz{|}~", 
+    font_path,
+    font_size,
+    output_path,
+    characters=ASCII_CHARACTERS,
     marker_color=(255, 0, 255),  # Pink marker color
     font_color=(255, 255, 255),  # Font color (white)
     outline_color=(0, 0, 0),     # Outline color (black)
-    spacing=5                    # Spacing between characters
+    spacing=5,                   # Spacing between characters
+    layout='strip',              # 'strip' for VE_SFont or 'packed' for a multi-row/multi-page atlas
+    max_texture_size=MAX_TEXTURE_SIZE,
+    outline_width=1              # Outline thickness (0 for none)
 ):
     """
     Generates a bitmap sprite font (SFont) with pink markers only in spacing areas.
+    The packed layout has no markers, the glyph rectangles are in the JSON metadata.
     """
     # Load the font
     try:
@@ -23,96 +99,127 @@ def generate_sfont(
 
     # Get font metrics
     ascent, descent = font.getmetrics()
-    
+
     # First pass: measure all characters
-    total_width = 0
-    char_metrics = []
-    
-    for char in characters:
-        bbox = font.getbbox(char)
-        width = bbox[2] - bbox[0] + 2  # Add small padding
-        total_width += width + spacing
-        char_metrics.append({
-            'width': width,
-            'bbox': bbox
-        })
+    char_metrics = measure_glyphs(font, characters)
 
     # Calculate total height needed
     total_height = ascent + descent + 4  # Add padding for outline
 
-    # Create the sprite sheet image with transparency
-    sheet = Image.new("RGBA", (total_width + 1, total_height + 1), (0, 0, 0, 0))  # +1 for marker row
-    draw = ImageDraw.Draw(sheet)
+    if layout == 'packed':
+        positions, page_sizes = pack_glyphs({char: width for char, (width, _) in char_metrics.items()},
+                                            total_height, spacing, max_texture_size, max_texture_size)
+        top = 0
+    else:
+        positions, x_offset = {}, 0
+        for char, (width, _) in char_metrics.items():
+            positions[char] = (0, x_offset, 0)
+            x_offset += width + spacing
+        page_sizes = [(x_offset + 1, total_height)]
+        top = 1  # marker row
+        if x_offset + 1 > max_texture_size:
+            print(f"Warning: the strip is {x_offset + 1}px wide, over {max_texture_size}px (use the packed layout)")
 
-    # Set the skip color in the top-left pixel (0,0)
-    sheet.putpixel((0, 0), marker_color)
-
-    def draw_text_with_outline(draw, x, y, text, font, outline_color, text_color):
-        # Draw outline
-        for adj_x in [-1, 1]:
-            for adj_y in [-1, 1]:
-                draw.text((x + adj_x, y + adj_y), text, font=font, fill=outline_color)
-        # Draw text
-        draw.text((x, y), text, font=font, fill=text_color)
+    # Create the sprite sheets with transparency
+    sheets = [Image.new("RGBA", (width, height + top), (0, 0, 0, 0)) for width, height in page_sizes]
 
     # Generate metadata
-    metadata = {}
-    x_offset = 0
-
-    # Calculate baseline position
-    baseline_y = ascent + 1  # +1 for marker row
-
-    for i, char in enumerate(characters):
-        metrics = char_metrics[i]
-        width = metrics['width']
-        bbox = metrics['bbox']
-        
-        # Draw the character with outline
-        draw_text_with_outline(
-            draw,
-            x_offset - bbox[0] + 1,  # Add small left padding
-            baseline_y - ascent,     # Align to baseline
-            char,
-            font,
-            outline_color,
-            font_color
-        )
-
-        # Mark only the spacing with pink
-        for x in range(x_offset + width, x_offset + width + spacing):
-            if x < total_width:
-                sheet.putpixel((x, 0), marker_color)
-
-        # Store metadata
-        metadata[char] = {
+    glyphs = {}
+    for char, (width, bbox) in char_metrics.items():
+        page, x_offset, y_offset = positions[char]
+
+        # Draw the character with outline (small left padding is in the mask)
+        mask, outline = glyph_masks(font, font_path, font_size, char, bbox, width, total_height, outline_width)
+        compose_glyph(sheets[page], x_offset - outline_width, y_offset + top - outline_width,
+                      mask, outline, font_color, outline_color)
+
+        glyphs[char] = {
+            "page": page,
             "x": x_offset,
-            "y": 1,
+            "y": y_offset + top,
             "width": width,
             "height": total_height
         }
 
-        x_offset += width + spacing
+    if layout != 'packed':
+        # Set the skip color in the top-left pixel (0,0) and mark only the spacing with pink
+        sheet = sheets[0]
+        sheet.putpixel((0, 0), marker_color)
+        for char, (width, _) in char_metrics.items():
+            x = positions[char][1] + width
+            sheet.paste(marker_color, (x, 0, min(x + spacing, sheet.width - 1), 1))
 
-    # Save the sprite sheet
+    # Save the sprite sheets
     os.makedirs(output_path, exist_ok=True)
-    sprite_sheet_path = os.path.join(output_path, "sfont.png")
-    sheet.save(sprite_sheet_path)
-    print(f"Sprite sheet saved to: {sprite_sheet_path}")
+    page_names = ["sfont.png"] if len(sheets) == 1 else [f"sfont_{i}.png" for i in range(len(sheets))]
+    for sheet, name in zip(sheets, page_names):
+        sprite_sheet_path = os.path.join(output_path, name)
+        sheet.save(sprite_sheet_path)
+        print(f"Sprite sheet saved to: {sprite_sheet_path}")
 
     # Save the metadata
-    metadata_path = os.path.join(output_path, "sfont_metadata.txt")
-    with open(metadata_path, "w") as meta_file:
-        for char, data in metadata.items():
-            meta_file.write(f"{char}: {data}\n")
+    metadata_path = os.path.join(output_path, "sfont_metadata.json")
+    with open(metadata_path, "w", encoding="utf-8") as meta_file:
+        json.dump({
+            "font": os.path.basename(font_path),
+            "size": font_size,
+            "layout": layout,
+            "lineHeight": total_height,
+            "ascent": ascent,
+            "pages": page_names,
+            "glyphs": glyphs
+        }, meta_file, ensure_ascii=False)
     print(f"Metadata saved to: {metadata_path}")
 
+def parse_color(text):
+    return tuple(int(text[i:i + 2], 16) for i in (0, 2, 4))
+
+def render_variants(font_path, font_size, schemes, output_path, outline_width=1, **options):
+    """
+    Renders all colour schemes of one font and size in a worker process, so the
+    glyph masks are rasterised only once for them.
+    """
+    stem = os.path.splitext(os.path.basename(font_path))[0]
+    for font_color, outline_color in schemes:
+        name = f"{stem}_{font_size}_{font_color}" + (f"_{outline_color}" if outline_color else "")
+        generate_sfont(font_path, font_size, os.path.join(output_path, name),
+                       font_color=parse_color(font_color),
+                       outline_color=parse_color(outline_color or '000000'),
+                       outline_width=outline_width if outline_color else 0,
+                       **options)
+    return font_path, font_size
+
 if __name__ == "__main__":
-    generate_sfont(
-        font_path="arial.ttf",   # Path to your .ttf font file
-        font_size=26,            # Font size
-        output_path="output",    # Output directory
-        marker_color=(255, 0, 255),  # Pink marker color
-        font_color=(255, 255, 255),  # White text
-        outline_color=(0, 0, 0),     # Black outline
-        spacing=8                # Spacing between characters
-    )
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Renders raster fonts (SFont) for every combination of the fonts, sizes and colour schemes.')
+    parser.add_argument('fonts', nargs='*', default=['arial.ttf'], help='Paths to .ttf/.otf fonts (default: arial.ttf)')
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[26], help='Font sizes (default: 26)')
+    parser.add_argument('-c', '--colors', nargs='+', default=['ffffff/000000'], metavar='FONT[/OUTLINE]',
+                        help='Colour schemes as hex font colour and optional outline colour (default: ffffff/000000)')
+    parser.add_argument('-t', '--charset', nargs='+', choices=list(CHARSETS), default=['ascii'], help='Character sets (default: ascii)')
+    parser.add_argument('-f', '--chars-file', help='Text file with additional characters')
+    parser.add_argument('-l', '--layout', choices=['strip', 'packed'], default='strip', help='Glyph layout (default: strip for VE_SFont)')
+    parser.add_argument('-p', '--spacing', type=int, default=8, help='Spacing between characters (default: 8)')
+    parser.add_argument('-w', '--outline-width', type=int, default=1, help='Outline thickness (default: 1)')
+    parser.add_argument('-o', '--output-path', default='output', help='Output directory (default: output)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    characters = ''.join(CHARSETS[name] for name in args.charset)
+    if args.chars_file:
+        with open(args.chars_file, 'r', encoding='utf-8-sig') as f:
+            characters += ''.join(f.read().split())
+    schemes = []
+    for scheme in args.colors:
+        colors = [color.strip().lstrip('#') for color in scheme.lower().split('/')]
+        schemes.append((colors[0], colors[1] if len(colors) > 1 else None))
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(render_variants, font_path, font_size, schemes, args.output_path,
+                                   characters=characters, spacing=args.spacing, layout=args.layout,
+                                   outline_width=args.outline_width)
+                   for font_path in args.fonts for font_size in args.sizes]
+        for future in futures:
+            font_path, font_size = future.result()
+            print(f"Done: {font_path} at {font_size}px")
@@ -2,6 +2,7 @@
 # This script collapses multi-line messages in RPGM MV games into single liners
 # for ease of translating (it also merges any followup empty 401's).
 import sys, os, glob, re, json
+from rpgm_timing import TIMINGS, pop_arguments, instrumented
 
 DEBUG = False
 BACKUP = False
@@ -60,30 +61,40 @@ def parse_rpgmmv_list(old_list):
 
     return is_any_modified
 
+def collapse_data(jsonf, jsonob):
+    """ Collapses the messages of a parsed map or common events file in place. """
+    is_modified = False
+    if 'Map' in jsonf:
+        if 'events' not in jsonob: return False
+        for event in jsonob['events']:
+            if not event: continue
+            for page in event['pages']:
+                if not page or 'list' not in page: continue
+                is_modified |= parse_rpgmmv_list(page['list'])
+    elif 'CommonEvents' in jsonf:
+        for page in jsonob:
+            if not page or 'list' not in page: continue
+            is_modified |= parse_rpgmmv_list(page['list'])
+    return is_modified
+
 def main():
-    json_fn = search_data_files(os.path.join(os.getcwd(), 'www\data'), '*.json')
+    json_fn = search_data_files(os.path.join(os.getcwd(), 'www', 'data'), '*.json')
     for jsonf in json_fn:
-        is_modified = False
-        with open(jsonf, 'r', encoding='utf-8-sig') as f:
-            jsonob = json.load(f)
-            if 'Map' in jsonf:
-                if 'events' not in jsonob: continue
-                for event in jsonob['events']:
-                    if not event: continue
-                    for page in event['pages']:
-                        if not page or 'list' not in page: continue
-                        is_modified |= parse_rpgmmv_list(page['list'])
-            elif 'CommonEvents' in jsonf:
-                for page in jsonob:
-                    if not page or 'list' not in page: continue
-                    is_modified |= parse_rpgmmv_list(page['list'])
+        with open(jsonf, 'r', encoding='utf-8-sig') as f, TIMINGS.phase('read'):
+            jsonob = TIMINGS.load_json(f.read())
+            TIMINGS.count('files read')
+        with TIMINGS.phase('collapse'):
+            is_modified = collapse_data(jsonf, jsonob)
 
         if not DEBUG and is_modified:
             print('Fixing string length of', os.path.basename(jsonf) + '...')
             if BACKUP:
                 bakname = jsonf.replace('.json', '.old')
                 if not os.path.exists(bakname): os.rename(jsonf, bakname)
-            with open(jsonf, 'w', encoding='utf-8-sig') as f:
-                f.write(json.dumps(jsonob, ensure_ascii=False))
+            with open(jsonf, 'w', encoding='utf-8-sig') as f, TIMINGS.phase('write'):
+                TIMINGS.count('chars written', f.write(json.dumps(jsonob, ensure_ascii=False)))
+                TIMINGS.count('files written')
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    with instrumented(pop_arguments()):
+        main()
\ No newline at end of file
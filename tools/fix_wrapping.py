@@ -1,23 +1,175 @@
 # -*- coding: utf-8 -*-
 # This script merges consequent lines of a single message boxes of RPGM MV game
 # and splits them again based on their character lengths.
-import sys, os, glob, re, json
+import sys, os, glob, re, json, hashlib
+from rpgm_timing import TIMINGS, add_arguments, instrumented
 
 DEBUG = False
 BACKUP = False
-DATA_FOLDER = 'www\\data'
+PORTABLE_MEASURE = False
+DATA_FOLDER = os.path.join('www', 'data')
+PROFILES_FILE = 'wrap_profiles.json'
 
 PUNCTUATION_EN = ".,!?;:"
 MAXIMAL_LENGTH = 60
 MAXIMAL_PX_WIDTH = 800
 PAD_CHARACTER = '\u3000'
-IGNORE_FIRST_LINE = r'^(?:[\w_-]+$|\\\w(?:\[[^\]]+\])?)$|^\s*[^\u300C].{,'+f'{MAXIMAL_LENGTH-5}'+'}$' #[^\n]{,15}|
+# Formatted with the profile's first quote character and maximal length
+IGNORE_FIRST_LINE = r'^(?:[\w_-]+$|\\\w(?:\[[^\]]+\])?)$|^\s*[^{quote}].{{,{length}}}$' #[^\n]{{,15}}|
 REMOVE_MULTI_SPACES = r'(?<=[-=\+…\.,:;!\?\w\d])[ \u3000]{1,2}(?=[\w\d])'
 WRAP_TRAILING_WORDS_RE = r'(?:a|the|if|of|in|at|to|on)'
 JAPANESE_PUCTUATION = r'[（）＠≪≫◆〜…『』「」【】❤]'
 FIRST_QUOTE_CHAR = '「'
 LAST_QUOTE_CHAR = '」'
 
+# Short words that shouldn't be left dangling at the end of a line, per language
+TRAILING_WORDS = {
+    'en': ['a', 'the', 'if', 'of', 'in', 'at', 'to', 'on'],
+    'fr': ['le', 'la', 'les', 'un', 'une', 'de', 'du', 'des', 'à', 'et'],
+    'de': ['der', 'die', 'das', 'ein', 'eine', 'zu', 'in', 'an', 'auf'],
+    'es': ['el', 'la', 'los', 'las', 'un', 'una', 'de', 'en', 'a', 'y'],
+    'ru': ['в', 'на', 'и', 'с', 'к', 'о', 'по', 'не'],
+}
+
+# RPGM message window layout defaults (MV: Window_Message/Window_Base)
+WINDOW_WIDTH = 816
+WINDOW_PADDING = 18
+FACE_WIDTH = 144
+FACE_MARGIN = 24
+ICON_WIDTH = 32
+VARIABLE_DIGITS = 4 # \V[n] values are unknown beforehand, this many digits are assumed
+# Plugins that override the message window or screen width: (name, parameter)
+WIDTH_PLUGIN_PARAMS = [
+    ('YEP_MessageCore', 'Default Width'),
+    ('Community_Basic', 'screenWidth'),
+    ('YEP_CoreEngine', 'Screen Width'),
+]
+
+class WrapProfile(object):
+    """ Per-game wrapping settings with all the regexes compiled once. """
+    def __init__(self, name='default', max_length=MAXIMAL_LENGTH, max_px_width=None,
+            window_width=None, window_padding=WINDOW_PADDING, face_width=FACE_WIDTH,
+            face_margin=FACE_MARGIN, font="MS Gothic", font_size=24, icon_width=ICON_WIDTH,
+            variable_digits=VARIABLE_DIGITS,
+            languages=('en',), trailing_words=None, ignore_first_line=None,
+            remove_multi_spaces=REMOVE_MULTI_SPACES, first_quote_char=FIRST_QUOTE_CHAR,
+            last_quote_char=LAST_QUOTE_CHAR, pad_character=PAD_CHARACTER):
+        self.name = name
+        self.max_length = max_length
+        self.window_width = window_width
+        self.window_padding = window_padding
+        self.face_width = face_width
+        self.face_margin = face_margin
+        self.font = font
+        self.font_size = font_size
+        self.icon_width = icon_width
+        self.variable_digits = variable_digits
+        self.languages = list(languages)
+        self.first_quote_char = first_quote_char
+        self.last_quote_char = last_quote_char
+        self.pad_character = pad_character
+        # A fixed max_px_width is used as is; a known window width also gives
+        # a narrower limit for the messages shown with a face graphic
+        if max_px_width is None:
+            max_px_width = self.text_area_width() if window_width else MAXIMAL_PX_WIDTH
+        self.max_px_width = max_px_width
+        self.max_face_px_width = self.text_area_width(True) if window_width else max_px_width
+
+        if trailing_words is None:
+            trailing_words = []
+            for lang in self.languages:
+                trailing_words += [w for w in TRAILING_WORDS.get(lang, []) if w not in trailing_words]
+        if trailing_words:
+            self.wrap_trailing_words_re = re.compile('(?:' + '|'.join(map(re.escape, trailing_words)) + ')')
+        else:
+            self.wrap_trailing_words_re = re.compile(WRAP_TRAILING_WORDS_RE)
+        if ignore_first_line is None:
+            ignore_first_line = IGNORE_FIRST_LINE.format(quote=re.escape(first_quote_char), length=max_length-5)
+        self.ignore_first_line_re = re.compile(ignore_first_line)
+        self.remove_multi_spaces_re = re.compile(remove_multi_spaces)
+        self.signature = repr((self.max_length, self.max_px_width, self.max_face_px_width,
+            font, font_size, icon_width, variable_digits, self.wrap_trailing_words_re.pattern,
+            self.remove_multi_spaces_re.pattern))
+
+    def text_area_width(self, with_face=False):
+        """ Width of the message window contents minus the face graphic if any. """
+        width = self.window_width - self.window_padding * 2
+        if with_face:
+            width -= self.face_width + self.face_margin
+        return width
+
+    @classmethod
+    def from_dict(cls, name, settings):
+        known = cls.__init__.__code__.co_varnames[1:cls.__init__.__code__.co_argcount]
+        unknown = [k for k in settings if k not in known]
+        if unknown:
+            print(f"Unknown settings in wrapping profile {name}: {', '.join(unknown)}")
+        return cls(name=name, **{k: v for k, v in settings.items() if k in known and k != 'name'})
+
+DEFAULT_PROFILE = WrapProfile()
+_profiles_cache = {}
+
+def load_profiles(path=PROFILES_FILE):
+    """ Loads and compiles all the profiles from a JSON file (once per run):
+        { "default": {...}, "<game folder name>": {"window_width": 1280, ...}, ... }
+    """
+    path = os.path.abspath(path)
+    if path in _profiles_cache:
+        return _profiles_cache[path]
+    profiles = {}
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            for name, settings in json.load(f).items():
+                profiles[name] = settings
+    _profiles_cache[path] = profiles
+    return profiles
+
+def read_game_width(game_dir, data_folder=DATA_FOLDER):
+    """ Tries to get the message window width from the game's own settings. """
+    data_dir = os.path.join(game_dir, data_folder)
+    try:
+        with open(os.path.join(data_dir, 'System.json'), 'r', encoding='utf-8-sig') as f:
+            width = json.load(f).get('advanced', {}).get('uiAreaWidth')  # MZ only
+            if width: return int(width)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(data_dir, '..', 'js', 'plugins.js'), 'r', encoding='utf-8-sig') as f:
+            plugins_js = f.read()
+    except OSError:
+        return None
+    plugins_js = plugins_js[plugins_js.find('['):plugins_js.rfind(']') + 1]
+    try:
+        plugins = {p['name']: p for p in json.loads(plugins_js) if p and p.get('status')}
+    except ValueError:
+        return None
+    for plugin, param in WIDTH_PLUGIN_PARAMS:
+        value = plugins.get(plugin, {}).get('parameters', {}).get(param, '')
+        if value.isdigit():
+            return int(value)
+    return None
+
+_game_profiles = {}
+
+def get_profile(game_dir, profiles_path=PROFILES_FILE, profile_name=None):
+    """ Selects a compiled profile for a game: by explicit name, then by game
+        folder name, then "default"; the window width is read from the game
+        when the profile doesn't specify it.
+    """
+    key = (os.path.abspath(game_dir), profiles_path, profile_name)
+    if key in _game_profiles:
+        return _game_profiles[key]
+    profiles = load_profiles(profiles_path)
+    name = profile_name or os.path.basename(os.path.abspath(game_dir))
+    if name not in profiles:
+        name = 'default'
+    settings = dict(profiles.get(name, {}))
+    if 'max_px_width' not in settings and 'window_width' not in settings:
+        settings['window_width'] = read_game_width(game_dir)
+    profile = WrapProfile.from_dict(name, settings) if any(settings.values()) else DEFAULT_PROFILE
+    _game_profiles[key] = profile
+    return profile
+
 import ctypes # for Windows only
 class SIZE(ctypes.Structure):
     _fields_ = [("cx", ctypes.c_long), ("cy", ctypes.c_long)]
@@ -49,16 +201,235 @@ class Measure(object):
         ctypes.windll.gdi32.GetTextExtentPoint32W(self.hdc, text, len(text), ctypes.byref(size))
         return size.cx#, size.cy)
 
+class PortableMeasure(object):
+    """ Approximate widths through Pillow for systems without GDI: the profile font if
+        FreeType finds it, otherwise Pillow's default font. The character advances are
+        summed without kerning like GetTextExtentPoint32 does. Only for testing and
+        benchmarks, the lines won't match what the game draws.
+    """
+    def __init__(self, font="MS Gothic", size=24):
+        from PIL import ImageFont
+        self.advances = {}
+        try:
+            self.font = ImageFont.truetype(font, size)
+        except OSError:
+            try:
+                self.font = ImageFont.load_default(size)
+            except TypeError: # Pillow < 10.1
+                self.font = ImageFont.load_default()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def width(self, text):
+        width = 0.0
+        for ch in text:
+            advance = self.advances.get(ch)
+            if advance is None:
+                advance = self.advances[ch] = self.font.getlength(ch)
+            width += advance
+        return int(width + 0.5)
+
+# Message control codes as parsed by Window_Base.obtainEscapeCode (MV/MZ)
+RE_CONTROL_CODE = re.compile(r'\\(?:([$.|^!><{}\\])|([A-Za-z]+)(?:\[([^\]]*)\])?)')
+
+CACHE_SIZE = 100000  # entries kept by the token and width caches before they are emptied
+
+_token_cache = {}
+
+def tokenize_message(text):
+    """ Splits a message into text runs and control codes (cached per text), the last
+        item of codes and escaped characters is the original text:
+        [('text', 'Hi '), ('code', 'N', '1', '\\n[1]'), ('text', '\\', '\\\\'), ...]
+    """
+    tokens = _token_cache.get(text)
+    if tokens is not None:
+        return tokens
+    tokens = []
+    pos = 0
+    for match in RE_CONTROL_CODE.finditer(text):
+        if match.start() > pos:
+            tokens.append(('text', text[pos:match.start()]))
+        if match.group(1):
+            code = match.group(1)
+            tokens.append(('text', '\\', match.group(0)) if code == '\\' else ('code', code, None, match.group(0)))
+        else:
+            tokens.append(('code', match.group(2).upper(), match.group(3), match.group(0)))
+        pos = match.end()
+    if pos < len(text):
+        tokens.append(('text', text[pos:]))
+    tokens = tuple(tokens)
+    if len(_token_cache) >= CACHE_SIZE:
+        _token_cache.clear()
+    _token_cache[text] = tokens
+    return tokens
+
+def split_message_chars(text):
+    """ Splits a message into characters keeping control codes and escapes whole. """
+    chars = []
+    for token in tokenize_message(text):
+        if token[0] == 'text' and len(token) == 2:
+            chars += list(token[1])
+        else:
+            chars.append(token[-1])
+    return chars
+
+def load_game_names(game_dir, data_folder=DATA_FOLDER):
+    """ Reads actor names (for \\N[n]/\\P[n]) and the currency unit (for \\G). """
+    data_dir = os.path.join(game_dir, data_folder)
+    actor_names = {}
+    currency_unit = ''
+    try:
+        with open(os.path.join(data_dir, 'Actors.json'), 'r', encoding='utf-8-sig') as f:
+            actor_names = {a['id']: a['name'] for a in json.load(f) if a}
+    except (OSError, ValueError, KeyError):
+        pass
+    try:
+        with open(os.path.join(data_dir, 'System.json'), 'r', encoding='utf-8-sig') as f:
+            currency_unit = json.load(f).get('currencyUnit', '')
+    except (OSError, ValueError):
+        pass
+    return actor_names, currency_unit
+
+class MessageMeasure(object):
+    """ Measures messages by their rendered width: control codes take the space
+        of what they draw (icons, actor names, font size changes) or none.
+        Widths are cached per distinct text, so repeated dialogue costs a lookup.
+        Each measured text starts at the profile's font size.
+    """
+    def __init__(self, profile=DEFAULT_PROFILE, actor_names=None, currency_unit=''):
+        self.profile = profile
+        self.actor_names = actor_names or {}
+        self.longest_name = max(self.actor_names.values(), key=len, default='')
+        self.currency_unit = currency_unit
+        self.measure_class = PortableMeasure if PORTABLE_MEASURE else Measure
+        self.measures = {}
+        self.run_widths = {}
+        self.widths = {}
+        self.count = 0
+
+    def __enter__(self):
+        self.count += 1
+        return self
+
+    def __exit__(self, *args):
+        self.count -= 1
+        if self.count == 0:
+            for m in self.measures.values():
+                m.__exit__()
+            self.measures = {}
+
+    def run_width(self, text, size):
+        key = (size, text)
+        width = self.run_widths.get(key)
+        if width is None:
+            m = self.measures.get(size)
+            if m is None:
+                m = self.measures[size] = self.measure_class(self.profile.font, size).__enter__()
+            TIMINGS.count('font measurements')
+            if len(self.run_widths) >= CACHE_SIZE:
+                self.run_widths.clear()
+            width = self.run_widths[key] = m.width(text)
+        return width
+
+    def width(self, text):
+        TIMINGS.count('measure calls')
+        width = self.widths.get(text)
+        if width is not None:
+            return width
+        size = self.profile.font_size
+        x = 0
+        for token in tokenize_message(text):
+            if token[0] == 'text':
+                x += self.run_width(token[1], size)
+                continue
+            code, param = token[1], token[2]
+            if code == 'I':
+                x += self.profile.icon_width + 4
+            elif code in ('N', 'P'):
+                name = self.actor_names.get(int(param), '') if code == 'N' and param and param.isdigit() else ''
+                x += self.run_width(name or self.longest_name, size)
+            elif code == 'V':
+                x += self.run_width('0' * self.profile.variable_digits, size)
+            elif code == 'G':
+                x += self.run_width(self.currency_unit, size)
+            elif code == '{':
+                if size <= 96: size += 12
+            elif code == '}':
+                if size >= 24: size -= 12
+            elif code == 'FS':
+                size = int(param) if param and param.isdigit() else self.profile.font_size
+            elif code == 'PX' and param and param.isdigit():
+                x = int(param)
+        if len(self.widths) >= CACHE_SIZE:
+            self.widths.clear()
+        self.widths[text] = x
+        return x
+
+class WrapCache(object):
+    """ Content-addressed cache of collapsed message text -> wrapped lines.
+        Keys include everything the result depends on (profile settings, names
+        used by the measurer and the width limit), so one cache file can be
+        shared between games and re-runs only wrap the new or changed texts.
+    """
+    VERSION = 1
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.hits = self.misses = 0
+        self.is_changed = False
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') == self.VERSION:
+                    self.entries = data.get('entries', {})
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable wrapping cache {path}: {e}")
+
+    @staticmethod
+    def namespace(profile, measure):
+        names = repr((sorted(measure.actor_names.items()), measure.currency_unit, measure.measure_class.__name__)) if measure else ''
+        return profile.signature + '\0' + names
+
+    def key(self, namespace, max_width, text):
+        return hashlib.sha1(f'{namespace}\0{max_width}\0{text}'.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        lines = self.entries.get(key)
+        if lines is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(lines)
+
+    def put(self, key, lines):
+        self.entries[key] = list(lines)
+        self.is_changed = True
+
+    def save(self):
+        if not self.path or not self.is_changed:
+            return
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'entries': self.entries}, f, ensure_ascii=False)
+        self.is_changed = False
+
 def search_resource(path, name):
     files = glob.glob(os.path.join(path, "**", name), recursive = True)
     return files if len(files) else []
 
-def cut_line_px(text, max_width=MAXIMAL_PX_WIDTH, spacer=' ', outer_m=None):
+def cut_line_px(text, max_width=None, spacer=' ', outer_m=None, profile=DEFAULT_PROFILE):
+    if max_width is None: max_width = profile.max_px_width
+    trailing_re = profile.wrap_trailing_words_re
     tmp_str = ''
     tmp_arr = []
-    words = text.split(spacer) if spacer else list(text)
+    words = text.split(spacer) if spacer else split_message_chars(text)
     if spacer is None: spacer = ''
-    with (Measure() if outer_m is None else outer_m) as m:
+    with (MessageMeasure(profile) if outer_m is None else outer_m) as m:
         j = 0
         for i, word in enumerate(words):
             next_text = tmp_str + spacer + word
@@ -66,7 +437,7 @@ def cut_line_px(text, max_width=MAXIMAL_PX_WIDTH, spacer=' ', outer_m=None):
             if spacer and m.width(word) > max_width:
                 if j > 0:
                     tmp_arr.append(tmp_str)
-                tmp_arr += cut_line_px(next_text if j > 0 else word, max_width, spacer=None, outer_m=m)
+                tmp_arr += cut_line_px(next_text if j > 0 else word, max_width, spacer=None, outer_m=m, profile=profile)
                 tmp_str = tmp_arr.pop()
                 if is_last:
                     tmp_arr.append(tmp_str)
@@ -81,7 +452,7 @@ def cut_line_px(text, max_width=MAXIMAL_PX_WIDTH, spacer=' ', outer_m=None):
                     tmp_arr.append(next_text + spacer)
             elif cur_width > max_width or (
                     i < len(words) - 1 and (
-                        re.search(WRAP_TRAILING_WORDS_RE, words[i+1])) and (
+                        trailing_re.search(words[i+1])) and (
                         cur_width + m.width(spacer + words[i+1]) > max_width)):
                 tmp_arr.append(tmp_str)
                 tmp_str = word + spacer
@@ -91,7 +462,8 @@ def cut_line_px(text, max_width=MAXIMAL_PX_WIDTH, spacer=' ', outer_m=None):
                 j += 1
     return tmp_arr
 
-def cut_line_chars(text, interval=MAXIMAL_LENGTH, mind_chr=' '):
+def cut_line_chars(text, interval=None, mind_chr=' ', profile=DEFAULT_PROFILE):
+    if interval is None: interval = profile.max_length
     tmp_str = text
     tmp_str_len = len(tmp_str)
     mnd_chr_len = len(mind_chr)
@@ -104,7 +476,7 @@ def cut_line_chars(text, interval=MAXIMAL_LENGTH, mind_chr=' '):
             if where_rspace < 2 or tmp_str[interval-1] in PUNCTUATION_EN:
                 where_rspace = interval
             where = min(interval, where_rspace)
-            shortend = re.search(WRAP_TRAILING_WORDS_RE, tmp_str[:where])
+            shortend = profile.wrap_trailing_words_re.search(tmp_str[:where])
             if shortend and where > len(shortend[0]) + 6:
                 where -= len(shortend[0]) #ignore short words at the end
             tmp = tmp_str[:where]
@@ -129,11 +501,27 @@ def cut_line_chars(text, interval=MAXIMAL_LENGTH, mind_chr=' '):
 def make401(text, indent=0):
     return {"code":401,"indent":indent,"parameters":[text]}
 
-def parse_list(old_list):
+def wrap_text(text, max_width, profile=DEFAULT_PROFILE, measure=None, cache=None, namespace=None):
+    if cache is None:
+        return cut_line_px(text, max_width, outer_m=measure, profile=profile)
+    if namespace is None:
+        namespace = cache.namespace(profile, measure)
+    key = cache.key(namespace, max_width, text)
+    lines = cache.get(key)
+    if lines is None:
+        lines = cut_line_px(text, max_width, outer_m=measure, profile=profile)
+        cache.put(key, lines)
+    return lines
+
+def parse_list(old_list, profile=DEFAULT_PROFILE, measure=None, cache=None, namespace=None):
     z = 0
     is_any_modified = False
     found_quote = False
+    max_width = profile.max_px_width
     while z < len(old_list):
+        if old_list[z].get('code') == 101:
+            has_face = bool(old_list[z]['parameters'] and old_list[z]['parameters'][0])
+            max_width = profile.max_face_px_width if has_face else profile.max_px_width
         if 'parameters' not in old_list[z] or len(old_list[z]['parameters']) > 1:
             z += 1
             continue # unknown stuff
@@ -142,12 +530,12 @@ def parse_list(old_list):
         text = ''
         while i < 4 and old_list[z+i]['code'] in (401,):
             if not old_list[z+i]['parameters'][0] or len(old_list[z+i]['parameters']) > 1 or (
-                (i == 0 and re.search(IGNORE_FIRST_LINE, old_list[z+i]['parameters'][0]))):
+                (i == 0 and profile.ignore_first_line_re.search(old_list[z+i]['parameters'][0]))):
                 break
             tmp = old_list[z+i]['parameters'][0]
-            found_quote = FIRST_QUOTE_CHAR in tmp[:2]
+            found_quote = profile.first_quote_char in tmp[:2]
             text += tmp.rstrip(' ') + ' '
-            if len(tmp) > MAXIMAL_LENGTH:
+            if len(tmp) > profile.max_length:
                 is_modified = True
             i += 1
 
@@ -155,14 +543,14 @@ def parse_list(old_list):
             indent = old_list[z]['indent']
             for j in range(i):
                 old_list.pop(z)
-            new_lines = cut_line_px(re.sub(REMOVE_MULTI_SPACES, ' ', text))
+            new_lines = wrap_text(profile.remove_multi_spaces_re.sub(' ', text), max_width, profile, measure, cache, namespace)
             first = True
-            if new_lines[-1] == LAST_QUOTE_CHAR:
-                new_lines[-2] += LAST_QUOTE_CHAR
+            if new_lines[-1] == profile.last_quote_char:
+                new_lines[-2] += profile.last_quote_char
                 del new_lines[-1]
             for l in new_lines:
                 if not first:
-                    old_list.insert(z, make401(PAD_CHARACTER + l if found_quote else l, indent))
+                    old_list.insert(z, make401(profile.pad_character + l if found_quote else l, indent))
                 else:
                     first = False
                     old_list.insert(z, make401(l, indent))
@@ -175,34 +563,79 @@ def parse_list(old_list):
 
     return is_any_modified
 
+def fix_game(game_dir, profile, cache=None):
+    json_fn = search_resource(os.path.join(game_dir, DATA_FOLDER), '*.json')
+    with TIMINGS.phase('load names'):
+        game_names = load_game_names(game_dir)
+    with MessageMeasure(profile, *game_names) as measure:
+        namespace = cache.namespace(profile, measure) if cache else None
+        for jsonf in json_fn:
+            fix_file(jsonf, profile, measure, cache, namespace)
+
+def wrap_data(jsonf, jsonob, profile, measure=None, cache=None, namespace=None):
+    """ Wraps the messages of a parsed map or common events file in place; namespace
+        is cache.namespace(profile, measure), computed once per game by the callers.
+    """
+    is_modified = False
+    if cache is not None and namespace is None:
+        namespace = cache.namespace(profile, measure)
+    if 'Map' in jsonf:
+        if 'events' not in jsonob: return False
+        for event in jsonob['events']:
+            if not event: continue
+            for page in event['pages']:
+                if not page or 'list' not in page: continue
+                is_modified |= parse_list(page['list'], profile, measure, cache, namespace)
+    elif 'CommonEvents' in jsonf:
+        for page in jsonob:
+            if not page or 'list' not in page: continue
+            is_modified |= parse_list(page['list'], profile, measure, cache, namespace)
+    return is_modified
+
+def fix_file(jsonf, profile, measure=None, cache=None, namespace=None):
+    with open(jsonf, 'r', encoding='utf-8-sig') as f, TIMINGS.phase('read'):
+        try:
+            jsonob = TIMINGS.load_json(f.read())
+            TIMINGS.count('files read')
+        except Exception as e:
+            print(f"Error parsing file {jsonf}: {e}")
+            return False
+    with TIMINGS.phase('wrap'):
+        is_modified = wrap_data(jsonf, jsonob, profile, measure, cache, namespace)
+
+    if not DEBUG and is_modified:
+        print('Fixing string length of', os.path.basename(jsonf) + '...')
+        if BACKUP:
+            bakname = jsonf.replace('.json', '.old')
+            if not os.path.exists(bakname): os.rename(jsonf, bakname)
+        with open(jsonf, 'w', encoding='utf-8-sig') as f, TIMINGS.phase('write'):
+            TIMINGS.count('chars written', f.write(json.dumps(jsonob, ensure_ascii=False)))
+            TIMINGS.count('files written')
+    return is_modified
+
 def main():
-    json_fn = search_resource(os.path.join(os.getcwd(), DATA_FOLDER), '*.json')
-    for jsonf in json_fn:
-        is_modified = False
-        with open(jsonf, 'r', encoding='utf-8-sig') as f:
-            try:
-                jsonob = json.load(f)
-            except Exception as e:
-                print(f"Error parsing file {jsonf}: {e}")
-                continue
-            if 'Map' in jsonf:
-                if 'events' not in jsonob: continue
-                for event in jsonob['events']:
-                    if not event: continue
-                    for page in event['pages']:
-                        if not page or 'list' not in page: continue
-                        is_modified |= parse_list(page['list'])
-            elif 'CommonEvents' in jsonf:
-                for page in jsonob:
-                    if not page or 'list' not in page: continue
-                    is_modified |= parse_list(page['list'])
-
-        if not DEBUG and is_modified:
-            print('Fixing string length of', os.path.basename(jsonf) + '...')
-            if BACKUP:
-                bakname = jsonf.replace('.json', '.old')
-                if not os.path.exists(bakname): os.rename(jsonf, bakname)
-            with open(jsonf, 'w', encoding='utf-8-sig') as f:
-                f.write(json.dumps(jsonob, ensure_ascii=False))
-
-main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Re-wraps multi-line messages of RPGM MV/MZ games.')
+    parser.add_argument('game_dirs', nargs='*', default=[os.getcwd()], help='Game directories (default: current)')
+    parser.add_argument('-p', '--profiles', default=PROFILES_FILE, help=f'Wrapping profiles JSON file (default: {PROFILES_FILE})')
+    parser.add_argument('-n', '--profile-name', help='Use this profile for every game instead of matching by folder name')
+    parser.add_argument('-c', '--cache', help='Keep wrapped messages in this file between runs')
+    parser.add_argument('--portable-measure', action='store_true', help='Measure with Pillow instead of Windows GDI (approximate, for tests and benchmarks)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    global PORTABLE_MEASURE
+    PORTABLE_MEASURE = args.portable_measure
+    with instrumented(args):
+        cache = WrapCache(args.cache)
+        for game_dir in args.game_dirs:
+            profile = get_profile(game_dir, args.profiles, args.profile_name)
+            print(f'Wrapping {game_dir} with profile "{profile.name}" ({profile.max_px_width}px)...')
+            fix_game(game_dir, profile, cache)
+        cache.save()
+        TIMINGS.count('wrap cache hits', cache.hits)
+        TIMINGS.count('wrap cache misses', cache.misses)
+        if DEBUG:
+            print(f'Wrapping cache: {cache.hits} hits, {cache.misses} misses')
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# This script times the tools on a synthetic project (see rpgm_synth.py): every phase runs
+# as a separate process on a fresh copy of the project and its wall/CPU time, peak memory
+# and files/sec are appended to a JSON history, compared with the previous run.
+import os, sys, json, time, shutil, platform, tempfile, subprocess
+
+from rpgm_synth import Settings, generate_project
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_FILE = 'bench_results.json'
+ENCRYPTED_EXTENSIONS = ('.rpgmvp', '.rpgmvo', '.rpgmvm', '.png_', '.ogg_', '.m4a_')
+PLAIN_EXTENSIONS = ('.png', '.ogg', '.m4a')
+
+# fix_wrapping measures text with Windows GDI; elsewhere it runs with the approximate Pillow
+# measurer, so its times are only comparable between runs with the same measurer
+WRAP_MEASURE = 'gdi' if sys.platform == 'win32' else 'portable'
+
+def count_files(root, extensions):
+    return sum(1 for _, _, files in os.walk(root) for f in files if f.lower().endswith(extensions))
+
+# phase: (project variant, command run in the game dir, counted files)
+PHASES = {
+    'rpgm_dec': ('encrypted', ['rpgm_dec.py', '{game}'], lambda root: count_files(root, ENCRYPTED_EXTENSIONS)),
+    'rpgm_enc': ('plain', ['rpgm_enc.py', '{game}'], lambda root: count_files(root, PLAIN_EXTENSIONS)),
+    'rpgm_strip': ('encrypted', ['rpgm_strip.py', '-i', '{root}', '-t'], lambda root: count_files(root, ENCRYPTED_EXTENSIONS)),
+    'fix_wrapping': ('plain', ['fix_wrapping.py', '{game}'] + (['--portable-measure'] if WRAP_MEASURE == 'portable' else []), lambda root: count_files(os.path.join(root, 'data'), ('.json',))),
+    'collapse_wrapping': ('plain', ['collapse_wrapping.py'], lambda root: count_files(os.path.join(root, 'data'), ('.json',))),
+}
+
+# Runs a tool as __main__ and reports its peak RSS: on Linux the ru_maxrss of a child
+# also counts the parent's memory from before exec, VmHWM belongs to the new process only
+BOOTSTRAP = """import os, sys, runpy, atexit
+def report():
+    try:
+        with open('/proc/self/status') as f:
+            sys.stderr.write('\\n' + PEAK_RSS_CUE + next(l.split()[1] for l in f if l.startswith('VmHWM')) + '\\n')
+    except (OSError, StopIteration):
+        pass
+atexit.register(report)
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+PEAK_RSS_CUE = '__peak_rss_kb__ '
+
+def run_process(args, cwd):
+    """ Runs a Python script (args[0]) and returns (return code, wall time, CPU time, peak RSS in KB, stderr). """
+    start = time.perf_counter()
+    bootstrap = f"PEAK_RSS_CUE = {PEAK_RSS_CUE!r}\n" + BOOTSTRAP
+    proc = subprocess.Popen([sys.executable, '-c', bootstrap] + args, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if hasattr(os, 'wait4'):
+        stderr = proc.stderr.read()
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        cpu = usage.ru_utime + usage.ru_stime
+        peak_rss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    else:  # no per-process resource usage on Windows
+        stderr = proc.communicate()[1]
+        cpu = peak_rss = None
+    stderr = stderr.decode('utf-8', 'replace')
+    if PEAK_RSS_CUE in stderr:
+        stderr, _, value = stderr.rpartition(PEAK_RSS_CUE)
+        peak_rss = int(value)
+    return proc.returncode, time.perf_counter() - start, cpu, peak_rss, stderr
+
+def run_benchmark(settings, phases=PHASES, repeat=1, work_dir=None):
+    """ Returns {phase: result} with the best wall time of `repeat` runs. """
+    work_dir = work_dir or tempfile.mkdtemp(prefix='rpgm_bench_')
+    templates = {}
+    results = {}
+    try:
+        for name in phases:
+            variant, command, counter = PHASES[name]
+            if variant not in templates:
+                variant_settings = Settings(**dict(settings.to_dict(), encrypted=(variant == 'encrypted')))
+                templates[variant] = os.path.join(work_dir, variant)
+                generate_project(templates[variant], variant_settings)
+            best = None
+            for _ in range(repeat):
+                game = os.path.join(work_dir, 'run')
+                shutil.rmtree(game, ignore_errors=True)
+                shutil.copytree(templates[variant], game)
+                root = game if settings.mz else os.path.join(game, 'www')
+                files = counter(root)
+                args = [os.path.join(TOOLS_DIR, command[0])] + [a.format(game=game, root=root) for a in command[1:]]
+                code, wall, cpu, peak_rss, stderr = run_process(args, game)
+                result = {'returncode': code, 'wall_s': round(wall, 4), 'cpu_s': cpu and round(cpu, 4),
+                          'peak_rss_kb': peak_rss, 'files': files, 'files_per_s': round(files / wall, 1) if wall else None}
+                if code:
+                    result['error'] = stderr.strip().splitlines()[-1:]
+                if best is None or wall < best['wall_s']:
+                    best = result
+            results[name] = best
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+def load_history(path):
+    if os.path.isfile(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return []
+
+def print_results(results, previous=None):
+    print(f"{'phase':<20}{'wall s':>10}{'cpu s':>10}{'RSS MB':>10}{'files/s':>12}{'vs last':>10}")
+    for name, r in results.items():
+        change = ''
+        old = (previous or {}).get(name)
+        if old and old.get('wall_s'):
+            change = f"{(r['wall_s'] / old['wall_s'] - 1) * 100:+.1f}%"
+        rss = f"{r['peak_rss_kb'] / 1024:.1f}" if r['peak_rss_kb'] else '-'
+        cpu = f"{r['cpu_s']:.3f}" if r['cpu_s'] is not None else '-'
+        status = '' if not r['returncode'] else f"  FAILED: {' '.join(r.get('error', []))}"
+        print(f"{name:<20}{r['wall_s']:>10.3f}{cpu:>10}{rss:>10}{r['files_per_s'] or 0:>12.1f}{change:>10}{status}")
+
+if __name__ == '__main__':
+    import argparse
+
+    defaults = Settings()
+    parser = argparse.ArgumentParser(description='Benchmarks the RPGM tools on a synthetic project.')
+    parser.add_argument('-o', '--output', default=RESULTS_FILE, help=f'JSON file the results are appended to (default: {RESULTS_FILE})')
+    parser.add_argument('-p', '--phases', nargs='+', choices=list(PHASES), default=list(PHASES), help='Phases to run (default: all)')
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Runs per phase, the best one is kept (default: 1)')
+    parser.add_argument('-s', '--scale', type=float, default=1.0, help='Multiplies the number of maps, events, common events and assets (default: 1)')
+    parser.add_argument('--seed', type=int, default=defaults.seed, help=f'Random seed of the project (default: {defaults.seed})')
+    parser.add_argument('--mz', action='store_true', help='Generate an MZ project')
+    args = parser.parse_args()
+
+    scaled = {name: max(1, int(getattr(defaults, name) * args.scale)) for name in ('maps', 'events', 'common_events', 'images', 'audio')}
+    settings = Settings(**dict(defaults.to_dict(), seed=args.seed, mz=args.mz, **scaled))
+    results = run_benchmark(settings, args.phases, args.repeat)
+
+    history = load_history(args.output)
+    previous = next((run['phases'] for run in reversed(history)
+                     if run['settings'] == settings.to_dict() and run.get('wrap_measure') == WRAP_MEASURE), None)
+    print_results(results, previous)
+    if 'fix_wrapping' in results and WRAP_MEASURE != 'gdi':
+        print("Note: fix_wrapping measured text with Pillow instead of Windows GDI, its time is only comparable to other non-Windows runs.")
+    history.append({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                    'platform': platform.platform(), 'wrap_measure': WRAP_MEASURE, 'settings': settings.to_dict(), 'phases': results})
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=1)
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+# This script runs the localisation build steps (rpgm_dec, collapse_wrapping/fix_wrapping,
+# rpgm_strip, rpgm_enc) as stages of one process: the game is scanned once, every data
+# file is read and parsed once into a cache shared by the stages and written once at the
+# end, decrypted assets are encrypted again from memory, and stages working on different
+# things (assets vs. data files) run concurrently.
+import os, io, re, sys, json, time, codecs, threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import rpgm_dec, rpgm_enc, rpgm_strip, fix_wrapping, collapse_wrapping
+from rpgm_timing import TIMINGS, Progress, add_arguments, instrumented
+
+REMOVED_FOLDER = 'removed'
+ASSET_FOLDERS = ('img', 'audio')
+RE_EVENT_FILE = re.compile(r'(?:Map\d+|CommonEvents)\.json$')
+
+# stage: (what it reads, what it writes) - 'assets' are the files in img/audio, 'data' the
+# data/*.json files; a stage waits for the earlier stages it conflicts with
+STAGES = {
+    'decrypt': ((), ('assets',)),
+    'collapse': (('data',), ('data',)),
+    'wrap': (('data',), ('data',)),
+    'strip': (('data', 'assets'), ('assets',)),
+    'encrypt': (('assets',), ('assets',)),
+}
+DEFAULT_STAGES = ['decrypt', 'wrap', 'strip', 'encrypt']
+PLAIN_BUDGET_MB = 256  # decrypted assets kept in memory for the encrypt stage, the rest is read again
+
+class StageStats:
+    """ Times and I/O counters of a stage; counters are updated from worker threads. """
+    def __init__(self, name):
+        self.name = name
+        self.start = self.wall = 0.0
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def get(self, name):
+        return self.counters.get(name, 0)
+
+class Project:
+    """ The single scan of a game shared by the stages: relative paths ('/' separated)
+        of all files under the game root, the parsed data files and the plain content
+        of decrypted assets waiting for the encrypt stage (up to plain_budget bytes).
+    """
+    def __init__(self, game_dir, plain_budget=0):
+        self.game_dir = os.path.abspath(game_dir)
+        www_dir = os.path.join(self.game_dir, 'www')
+        self.root = www_dir if os.path.isdir(os.path.join(www_dir, 'data')) else self.game_dir
+        self.plain_budget = plain_budget
+        self.plain_bytes = 0
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()  # set when a stage fails, the others stop early
+        self.files = set()
+        for path, dirs, files in os.walk(self.root):
+            rel = os.path.relpath(path, self.root).replace(os.sep, '/')
+            if rel == '.':
+                dirs[:] = [d for d in dirs if d != REMOVED_FOLDER]
+            prefix = '' if rel == '.' else rel + '/'
+            self.files.update(prefix + f for f in files)
+        # the data files don't change while the asset stages add and move files concurrently
+        self.data_names = sorted(rel[5:] for rel in self.files if rel.startswith('data/') and rel.endswith('.json'))
+        self.data = {}
+        self.boms = {}
+        self.sizes = {}
+        self.dirty = {}
+        self.plain = {}
+        self.stats = StageStats('scan')
+        system = self.load_json('System.json', self.stats) if 'System.json' in self.data_names else {}
+        key = system.get('encryptionKey')
+        self.key = bytearray.fromhex(key) if key else bytearray()
+        self.mz = 'advanced' in system
+
+    def path(self, rel):
+        return os.path.join(self.root, *rel.split('/'))
+
+    def keep_plain(self, rel, data):
+        """ Keeps decrypted content for the encrypt stage while it fits the budget. """
+        with self.lock:
+            if self.plain_bytes + len(data) > self.plain_budget:
+                return False
+            self.plain[rel] = data
+            self.plain_bytes += len(data)
+            return True
+
+    def take_plain(self, rel):
+        """ Returns (and forgets) the kept content of a file or None. """
+        with self.lock:
+            data = self.plain.pop(rel, None)
+            if data is not None:
+                self.plain_bytes -= len(data)
+            return data
+
+    def data_files(self, pattern):
+        return [name for name in self.data_names if pattern.match(name)]
+
+    def load_json(self, name, stats):
+        """ Returns the parsed data/<name>, only the first stage asking for it reads it. """
+        if name in self.data:
+            stats.count('JSON parses saved')
+            stats.count('bytes read saved', self.sizes[name])
+            return self.data[name]
+        with open(self.path('data/' + name), 'rb') as f:
+            raw = f.read()
+        stats.count('files read')
+        stats.count('bytes read', len(raw))
+        self.boms[name] = raw.startswith(codecs.BOM_UTF8)
+        self.sizes[name] = len(raw)
+        self.data[name] = TIMINGS.load_json(raw.decode('utf-8-sig'))
+        return self.data[name]
+
+    def mark_dirty(self, name, stats):
+        if name in self.dirty:
+            stats.count('JSON writes saved')
+        self.dirty[name] = True
+
+    def save_data(self, stats):
+        """ Writes every modified data file once, keeping its BOM (or lack of it). """
+        for name in sorted(self.dirty):
+            text = json.dumps(self.data[name], ensure_ascii=False)
+            with open(self.path('data/' + name), 'w', encoding='utf-8-sig' if self.boms[name] else 'utf-8') as f:
+                f.write(text)
+            stats.count('files written')
+            stats.count('bytes written', len(text.encode('utf-8')))
+        self.dirty = {}
+
+def run_decrypt(project, stats, options):
+    progress = Progress()
+
+    def decrypt(rel):
+        if project.cancelled.is_set():
+            return
+        progress.update(rel)
+        plain_rel = rpgm_dec.decryptFilename(rel)
+        with open(project.path(rel), 'rb') as f:
+            data = f.read()
+        stats.count('files read')
+        stats.count('bytes read', len(data))
+        plain = rpgm_dec.decryptBytes(data, project.key, plain_rel.endswith('.png'))
+        if plain_rel.endswith('.png') and not rpgm_dec.is_valid_png(io.BytesIO(plain)):
+            print(f"Unparsable PNG data in {rel}")
+            return
+        with open(project.path(plain_rel), 'wb') as f:
+            f.write(plain)
+        stats.count('files written')
+        stats.count('bytes written', len(plain))
+        with project.lock:
+            project.files.add(plain_rel)
+        if project.plain_budget and not project.keep_plain(plain_rel, plain):
+            stats.count('files over memory budget')
+
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        list(executor.map(decrypt, sorted(rel for rel in project.files if rpgm_dec.isEncryptedFile(rel))))
+    progress.done()
+
+def event_files(project, stats):
+    for name in project.data_files(RE_EVENT_FILE):
+        if project.cancelled.is_set():
+            return
+        yield name, project.load_json(name, stats)
+
+def run_collapse(project, stats, options):
+    for name, jsonob in event_files(project, stats):
+        if collapse_wrapping.collapse_data(name, jsonob):
+            project.mark_dirty(name, stats)
+
+def run_wrap(project, stats, options):
+    profile = fix_wrapping.get_profile(project.game_dir, options.profiles, options.profile_name)
+    actors = project.load_json('Actors.json', stats) if 'Actors.json' in project.data_names else []
+    system = project.load_json('System.json', stats) if 'System.json' in project.data_names else {}
+    actor_names = {a['id']: a['name'] for a in actors if a}
+    cache = fix_wrapping.WrapCache(options.cache)
+    with fix_wrapping.MessageMeasure(profile, actor_names, system.get('currencyUnit', '')) as measure:
+        namespace = cache.namespace(profile, measure)
+        for name, jsonob in event_files(project, stats):
+            if fix_wrapping.wrap_data(name, jsonob, profile, measure, cache, namespace):
+                project.mark_dirty(name, stats)
+    cache.save()
+
+def run_strip(project, stats, options):
+    root = Path(project.root)
+    map_files = [root / 'data' / name for name in project.data_files(re.compile(r'Map\d+\.json$'))]
+    if not rpgm_strip.parse_project(root / 'data', options.check_scripts, options.reachable_only,
+                                    lambda path: project.load_json(path.name, stats), map_files):
+        raise RuntimeError('parsing the data files failed')
+
+    # {(kind, folder): {stem: [relative paths]}} of the known resource folders
+    on_disk = {}
+    known = {'img': rpgm_strip.image_keep_map, 'audio': rpgm_strip.audio_keep_map}
+    for rel in project.files:
+        parts = rel.split('/')
+        if len(parts) == 3 and parts[0] in known and parts[1] in known[parts[0]]:
+            stem = os.path.splitext(parts[2])[0]
+            on_disk.setdefault((parts[0], parts[1]), {}).setdefault(stem, []).append(rel)
+    for folder in options.exclude_folders:
+        on_disk.pop(('img', folder), None)
+        on_disk.pop(('audio', folder), None)
+
+    unused = {'img': {}, 'audio': {}}
+    for (kind, folder), stems in on_disk.items():
+        unused[kind][folder] = set(stems) - known[kind][folder]
+    if options.check_scripts:
+        js_files = [Path(project.path(rel)) for rel in sorted(project.files) if rel.startswith('js/') and rel.endswith('.js')]
+        rpgm_strip.scan_js_files(root, unused['img'], unused['audio'], js_files)
+
+    for kind, folders in unused.items():
+        for folder, stems in folders.items():
+            for stem in sorted(stems):
+                if project.cancelled.is_set():
+                    return
+                for rel in on_disk[(kind, folder)][stem]:
+                    new_path = os.path.join(project.root, REMOVED_FOLDER, *rel.split('/'))
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                    os.replace(project.path(rel), new_path)
+                    project.files.discard(rel)
+                    project.take_plain(rel)
+                    stats.count('files moved')
+
+def run_encrypt(project, stats, options):
+    if len(project.key) < 2:
+        raise RuntimeError('no encryption key in System.json')
+    output_dir = os.path.join(project.game_dir, options.output) if options.output else project.game_dir
+    progress = Progress()
+
+    def encrypt(rel):
+        if project.cancelled.is_set():
+            return
+        progress.update(rel)
+        plain = project.take_plain(rel)
+        if plain is None:
+            with open(project.path(rel), 'rb') as f:
+                plain = f.read()
+            stats.count('files read')
+            stats.count('bytes read', len(plain))
+        else:
+            stats.count('bytes read saved', len(plain))
+        enc_rel = rpgm_enc.makeFilename(rel, project.mz) or rel + '_'
+        enc_path = os.path.join(output_dir, os.path.relpath(project.path(enc_rel), project.game_dir))
+        rpgm_enc.makeDirs(enc_path)
+        data = rpgm_enc.encryptBytes(plain, project.key)
+        with open(enc_path, 'wb') as f:
+            f.write(data)
+        stats.count('files written')
+        stats.count('bytes written', len(data))
+
+    files = sorted(rel for rel in project.files if rel.split('/')[0] in ASSET_FOLDERS and rpgm_enc.isEncryptableFile(rel))
+    with ThreadPoolExecutor(max_workers=options.jobs) as executor:
+        list(executor.map(encrypt, files))
+    progress.done()
+
+STAGE_FUNCTIONS = {
+    'decrypt': run_decrypt,
+    'collapse': run_collapse,
+    'wrap': run_wrap,
+    'strip': run_strip,
+    'encrypt': run_encrypt,
+}
+
+def stage_dependencies(stages):
+    """ Returns {stage: [earlier stages it has to wait for]}: the ones writing what it
+        reads or writes and the ones reading what it writes.
+    """
+    deps = {}
+    for j, name in enumerate(stages):
+        reads, writes = map(set, STAGES[name])
+        deps[name] = [earlier for earlier in stages[:j]
+                      if set(STAGES[earlier][1]) & (reads | writes) or set(STAGES[earlier][0]) & writes]
+    return deps
+
+def run_pipeline(game_dir, stages, options):
+    """ Runs the stages over one scan of the game; returns the project with the stats.
+        When a stage fails the others are stopped and the data files are not written.
+    """
+    start = time.perf_counter()
+    project = Project(game_dir, options.memory * 1048576 if 'encrypt' in stages else 0)
+    project.stats.wall = time.perf_counter() - start
+    project.stage_stats = {name: StageStats(name) for name in stages}
+    deps = stage_dependencies(stages)
+
+    def run_stage(name, waits):
+        for future in waits:
+            future.result()
+        stats = project.stage_stats[name]
+        if project.cancelled.is_set():
+            stopped.append(name)
+            return
+        stats.start = time.perf_counter() - start
+        try:
+            with TIMINGS.phase(name):
+                STAGE_FUNCTIONS[name](project, stats, options)
+        except Exception as e:
+            project.cancelled.set()
+            errors.append(f"{name} stage failed: {type(e).__name__}: {e}")
+            return
+        stats.wall = time.perf_counter() - start - stats.start
+        if project.cancelled.is_set():
+            stopped.append(name)
+
+    errors, stopped = [], []
+    futures = {}
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        for name in stages:
+            futures[name] = executor.submit(run_stage, name, [futures[dep] for dep in deps[name]])
+    if errors:
+        raise RuntimeError('; '.join(errors) + (f" (stopped: {', '.join(sorted(stopped, key=stages.index))})" if stopped else '')
+                           + ', the data files were not written')
+
+    stats = project.write_stats = StageStats('write data')
+    stats.start = time.perf_counter() - start
+    project.save_data(stats)
+    stats.wall = time.perf_counter() - start - stats.start
+    project.total = time.perf_counter() - start
+    return project
+
+def print_summary(project, stages):
+    """ Per-stage times and I/O; "saved" is what the stage didn't read or parse again
+        because an earlier stage already had it in memory.
+    """
+    all_stats = [project.stats] + [project.stage_stats[name] for name in stages] + [project.write_stats]
+    mb = lambda value: f"{value / 1048576:.1f}"
+    print(f"{'stage':<12}{'start s':>9}{'wall s':>9}{'read':>7}{'MB':>8}{'written':>9}{'MB':>8}"
+          f"{'parses saved':>14}{'MB saved':>10}")
+    for s in all_stats:
+        print(f"{s.name:<12}{s.start:>9.3f}{s.wall:>9.3f}{s.get('files read'):>7}{mb(s.get('bytes read')):>8}"
+              f"{s.get('files written'):>9}{mb(s.get('bytes written')):>8}{s.get('JSON parses saved'):>14}"
+              f"{mb(s.get('bytes read saved')):>10}")
+    saved_writes = sum(s.get('JSON writes saved') for s in all_stats)
+    moved = sum(s.get('files moved') for s in all_stats)
+    over_budget = sum(s.get('files over memory budget') for s in all_stats)
+    sequential = sum(s.wall for s in all_stats)
+    print(f"total {project.total:.3f}s ({sequential:.3f}s of stage time), {len(stages) - 1} tree walks and "
+          f"{saved_writes} data file writes saved, {moved} unused files moved"
+          + (f", {over_budget} decrypted files over the memory budget" if over_budget else ''))
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Runs decrypt/collapse/wrap/strip/encrypt over an RPG Maker MV/MZ game in one pass.')
+    parser.add_argument('game_dir', help='Game directory (with www for MV)')
+    parser.add_argument('-s', '--stages', nargs='+', choices=list(STAGES), default=DEFAULT_STAGES,
+                        help=f'Stages in the order of the build (default: {" ".join(DEFAULT_STAGES)})')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Threads for decrypting/encrypting files')
+    parser.add_argument('-m', '--memory', type=int, default=PLAIN_BUDGET_MB,
+                        help=f'MB of decrypted files kept in memory for the encrypt stage, the others are read again (default: {PLAIN_BUDGET_MB})')
+    parser.add_argument('-o', '--output', help='Write encrypted files to this folder of the game directory instead of next to the plain ones')
+    parser.add_argument('-e', '--exclude-folders', nargs='+', default=[], help='Resource folders the strip stage leaves alone')
+    parser.add_argument('-c', '--check-scripts-not', action='store_true', help="Don't check script commands and .js files for resources")
+    parser.add_argument('-r', '--reachable-only', action='store_true', help="Strip resources of common events nothing can reach")
+    parser.add_argument('-p', '--profiles', default=fix_wrapping.PROFILES_FILE, help=f'Wrapping profiles JSON file (default: {fix_wrapping.PROFILES_FILE})')
+    parser.add_argument('-n', '--profile-name', help='Wrapping profile to use instead of matching by folder name')
+    parser.add_argument('--cache', help='Keep wrapped messages in this file between runs')
+    parser.add_argument('--portable-measure', action='store_true', help='Measure with Pillow instead of Windows GDI (always used off Windows)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    args.check_scripts = not args.check_scripts_not
+    stages = list(dict.fromkeys(args.stages))
+    fix_wrapping.PORTABLE_MEASURE = args.portable_measure or sys.platform != 'win32'
+
+    with instrumented(args):
+        project = run_pipeline(args.game_dir, stages, args)
+    print_summary(project, stages)
+
+if __name__ == '__main__':
+    try:
+        main()
+    except (OSError, RuntimeError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
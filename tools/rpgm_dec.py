@@ -1,11 +1,12 @@
 # -*- coding: utf-8 -*-
-import re, time, os, io, sys, binascii
+import re, os, io, sys, binascii
 import hashlib
 from PIL import Image
+from rpgm_timing import TIMINGS, Progress, pop_arguments, instrumented
 
-pathSysJSON = "www\\data\\System.json"
-pathSysJSON1 = "data\\System.json"
-pathRpgProject = "www\\Game.rpgproject"
+pathSysJSON = os.path.join("www", "data", "System.json")
+pathSysJSON1 = os.path.join("data", "System.json")
+pathRpgProject = os.path.join("www", "Game.rpgproject")
 
 RE_ENC_KEY_CUE = re.compile(r'encryptionKey"\s*:\s*"([^"]+)"')
 ARTENC_HEADER = b'ART\0ENCRYPTER100FREE\0VERSION\0\0\0\0'
@@ -33,9 +34,6 @@ def xor(source, key):
     l = len(key)
     return bytearray(((source[i] ^ key[i % l]) for i in range(0, len(source))))
 
-def short_path(fn, begin=32, end=32):
-    return fn[:begin] + "..." + fn[-end:];
-
 def findKey(sysJsonPath):
     key = ''
     if not os.path.exists(sysJsonPath):
@@ -71,6 +69,14 @@ def is_valid_png(bytes_data):
     except:
         return False
 
+def decryptBytes(data, key, is_png=False):
+    """ Returns the plain content of the whole encrypted file data. """
+    if data[:16] == ARTENC_HEADER[:16]:
+        return bytes(decrypt_ae(data[32:64], key)) + data[64:]
+    if key:
+        return bytes(xor(data[16:32], key)) + data[32:]
+    return (PNG_HEADER if is_png else data[16:32]) + data[32:]
+
 def decryptFile(encryptedFilename, key, root_path = None, output_path=""): 
     dfn = decryptFilename(encryptedFilename)
     is_png = dfn.endswith(".png")
@@ -94,93 +100,69 @@ def decryptFile(encryptedFilename, key, root_path = None, output_path=""):
                 #file_header = b''
             if file_header:
                 file_bytes = io.BytesIO(file_header + f.read())
+                TIMINGS.count('files read')
+                TIMINGS.count('bytes read', f.tell())
                 if is_png:
                     if is_valid_png(file_bytes):
-                        with open(dfn,"wb") as fo:
-                            fo.write(file_bytes.getbuffer())
+                        TIMINGS.write_bytes(dfn, file_bytes.getbuffer())
                     else:
                         print(f"Unparsable PNG data in {encryptedFilename}")
                 else:
-                    with open(dfn,"wb") as fo:
-                        fo.write(file_bytes.getbuffer())
-
-# main
-command_line = (len(sys.argv) > 1)
-if not command_line:
-    import tkinter
-    from tkinter import filedialog, messagebox, ttk
-
-    window = tkinter.Tk()
-    window.title('RPG Maker MV/MZ File Decryptor')
-    window.geometry("500x100")
-    window.resizable(0, 0)
-    window.eval('tk::PlaceWindow %s center' % window.winfo_toplevel())
-    progressbar = ttk.Progressbar(window, orient ="horizontal", length = 460, mode ="indeterminate")
-    progressbar.pack(fill='x', padx=15, pady=15)
-    v = tkinter.StringVar()
-    v.set("Ready...")
-    label = tkinter.Label(window, textvariable=v)
-    label.pack(expand=True)
-
-    root_dir = filedialog.askdirectory(title="Please select game directory (with the main executable)").replace("/", os.sep) + os.sep
-    noWWW = False
-    wwwpath = os.path.join(root_dir, pathSysJSON)
-    nowwwpath = os.path.join(root_dir, pathSysJSON1)
-    if root_dir and (os.path.exists(wwwpath) or os.path.exists(nowwwpath)):
+                    TIMINGS.write_bytes(dfn, file_bytes.getbuffer())
+
+def main():
+    options = pop_arguments()
+    command_line = (len(sys.argv) > 1)
+    if not command_line:
+        from tkinter import filedialog
+        from rpgm_gui import ProgressWindow
+
+        window = ProgressWindow('RPG Maker MV/MZ File Decryptor')
+        root_dir = filedialog.askdirectory(title="Please select game directory (with the main executable)").replace("/", os.sep) + os.sep
+        noWWW = False
+        wwwpath = os.path.join(root_dir, pathSysJSON)
+        nowwwpath = os.path.join(root_dir, pathSysJSON1)
+        if root_dir and (os.path.exists(wwwpath) or os.path.exists(nowwwpath)):
+            key = findKey(wwwpath)
+            if len(key) < 2:
+                key = findKey(nowwwpath)
+                noWWW = True
+            if len(key) < 2:
+                window.show_error(f"ERROR: Could not find decryption key! Paths:\n{wwwpath},\n{nowwwpath}.")
+            else:
+                www_dir = root_dir if noWWW else os.path.join(root_dir, "www")
+                files = [os.path.join(path, f) for path, dirs, files in os.walk(www_dir) for f in files]
+                window.start([fn for fn in files if isEncryptedFile(fn)], lambda fn: decryptFile(fn, key), "Decrypting",
+                             "DONE! Game has been decrypted... Set hasEncryptedImages and hasEncryptedAudio\n to false in System.json to use unpacked files.")
+        else:
+            window.show_error("ERROR: Could not find System.json.\nCheck if the game directory is correct: " + root_dir.replace('/','\\'))
+    else:
+        noWWW = False
+        root_dir = sys.argv[1].strip('"')
+        wwwpath = os.path.join(root_dir, pathSysJSON)
+        nowwwpath = os.path.join(root_dir, pathSysJSON1)
+        outpath = sys.argv[2].strip('"') if len(sys.argv) > 2 else None
+        print('RPG Maker MV File Decryptor')
+        print(f"Path is {os.path.abspath(root_dir)}")
         key = findKey(wwwpath)
         if len(key) < 2:
             key = findKey(nowwwpath)
             noWWW = True
         if len(key) < 2:
-            progressbar.destroy()
-            v.set(f"ERROR: Could not find decryption key! Paths:\n{wwwpath},\n{nowwwpath}.")
-            window.update()
-        else:
-            www_dir = root_dir if noWWW else os.path.join(root_dir, "www")
-            for path, dirs, files in os.walk(www_dir):
-                progressbar["value"] = 0
-                for f in files:
-                    progressbar["maximum"] = len(files)
-                    fn = os.path.join(path,f)
-                    truncated = short_path(fn) if len(fn) > 67 else fn
-                    progressbar.step(1)
-                    window.update()
-                    if isEncryptedFile(fn):
-                        v.set("Decrypting: " + truncated.replace('/','\\'))
-                        decryptFile(fn, key)
-            progressbar.destroy()
-            v.set("DONE! Game has been decrypted... Set hasEncryptedImages and hasEncryptedAudio\n to false in System.json to use unpacked files.")
-            window.update()
-    else:
-        progressbar.destroy()
-        v.set("ERROR: Could not find System.json.\nCheck if the game directory is correct: " + root_dir.replace('/','\\'))
-        window.update()
-
-    time.sleep(5)
-else:
-    noWWW = False
-    root_dir = sys.argv[1].strip('"')
-    wwwpath = os.path.join(root_dir, pathSysJSON)
-    nowwwpath = os.path.join(root_dir, pathSysJSON1)
-    outpath = sys.argv[2].strip('"') if len(sys.argv) > 2 else None
-    print('RPG Maker MV File Decryptor')
-    print(f"Path is {os.path.abspath(root_dir)}")
-    key = findKey(wwwpath)
-    if len(key) < 2:
-        key = findKey(nowwwpath)
-        noWWW = True
-    if len(key) < 2:
-        print("ERROR: Could not find decryption key in System.json, using default PNG header.")
-    print("Processing files...")
-    www_dir = root_dir if noWWW else os.path.join(root_dir, "www")
-    for path, dirs, files in os.walk(www_dir):
-        for f in files:
-            fn = os.path.join(path, f)
-            if isEncryptedFile(fn):
-                truncated = short_path(fn) if len(fn) > 67 else fn
-                print(" " * 80 + '\r', end='', flush=True)
-                print(" " + truncated.replace('/','\\') + '\r', end='', flush=True)
-                decryptFile(fn, key)
-
-    print(" " * 80 + '\r', end='', flush=True)
-    print("DONE! Game has been decrypted...")
+            print("ERROR: Could not find decryption key in System.json, using default PNG header.")
+        print("Processing files...")
+        www_dir = root_dir if noWWW else os.path.join(root_dir, "www")
+        with instrumented(options):
+            progress = Progress()
+            with TIMINGS.phase('decrypt'):
+                for path, dirs, files in os.walk(www_dir):
+                    for f in files:
+                        fn = os.path.join(path, f)
+                        if isEncryptedFile(fn):
+                            progress.update(fn)
+                            decryptFile(fn, key)
+            progress.done()
+            print("DONE! Game has been decrypted...")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+# This script finds duplicate images/audio in RPGM MV/MZ games by their (decrypted)
+# content and optionally replaces the copies with hard links.
+import os, errno, hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from rpgm_strip import iter_rpgm_files, logger
+from rpgm_dec import findKey, decryptBytes, ARTENC_HEADER
+from rpgm_timing import TIMINGS, add_arguments, instrumented
+
+ENCRYPTED_EXTENSIONS = ('.rpgmvp', '.png_', '.rpgmvo', '.ogg_', '.rpgmvm', '.m4a_')
+ENC_HEADER_LENGTH = 16
+MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+def plain_size(path, size):
+    """ Size of the content decryptBytes returns: the header is 16 bytes, or 32 for
+        Art Encrypter files (only the first 16 bytes are read to tell them apart).
+    """
+    if path.suffix.lower() not in ENCRYPTED_EXTENSIONS:
+        return size
+    with open(path, 'rb') as f:
+        header = f.read(ENC_HEADER_LENGTH)
+    return size - (2 * ENC_HEADER_LENGTH if header == ARTENC_HEADER[:ENC_HEADER_LENGTH] else ENC_HEADER_LENGTH)
+
+def content_hash(path, key):
+    """ Hashes of the plain content and of the raw file; the file is read once. """
+    raw = path.read_bytes()
+    raw_digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    ext = path.suffix.lower()
+    if ext not in ENCRYPTED_EXTENSIONS:
+        return raw_digest, raw_digest
+    data = decryptBytes(raw, key, ext in ('.rpgmvp', '.png_'))
+    return hashlib.blake2b(data, digest_size=16).hexdigest(), raw_digest
+
+def find_duplicates(project_path, key=b'', workers=MAX_WORKERS):
+    """ Returns lists of paths with identical content, biggest waste first, and
+        {path: hash of the raw file} of their files. Files are grouped by size and
+        only same-size candidates get hashed.
+    """
+    by_size = {}
+    with TIMINGS.phase('scan'):
+        for _, _, path in iter_rpgm_files(project_path, all_folders=True, recursive=True):
+            st = path.stat()
+            by_size.setdefault(plain_size(path, st.st_size), []).append(path)
+    candidates = [p for paths in by_size.values() if len(paths) > 1 for p in paths]
+    TIMINGS.count('files scanned', sum(map(len, by_size.values())))
+    logger.debug(f"Hashing {len(candidates)} same-size candidates...")
+
+    by_hash = {}
+    raw_digests = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor, TIMINGS.phase('hash'):
+        for path, (digest, raw_digest) in zip(candidates, executor.map(lambda p: content_hash(p, key), candidates)):
+            by_hash.setdefault(digest, []).append(path)
+            raw_digests[path] = raw_digest
+            TIMINGS.count('files read')
+    groups = [sorted(paths) for paths in by_hash.values() if len(paths) > 1]
+    groups.sort(key=lambda paths: -wasted_bytes(paths))
+    return groups, {path: raw_digests[path] for paths in groups for path in paths}
+
+def wasted_bytes(paths):
+    """ Bytes taken by the copies that aren't already hard links to the first file. """
+    inodes = set()
+    total = 0
+    for path in paths:
+        st = path.stat()
+        if (st.st_dev, st.st_ino) in inodes: continue
+        if inodes: total += st.st_size
+        inodes.add((st.st_dev, st.st_ino))
+    return total
+
+def link_duplicates(paths, raw_digests):
+    """ Replaces byte-identical copies (same raw_digests entry) with hard links to
+        the first file of the same extension; returns the number of bytes freed.
+    """
+    freed = 0
+    originals = {}
+    for path in paths:
+        ext = path.suffix.lower()
+        original = originals.setdefault(ext, path)
+        if original is path: continue
+        st, orig_st = path.stat(), original.stat()
+        if (st.st_dev, st.st_ino) == (orig_st.st_dev, orig_st.st_ino):
+            continue
+        if st.st_size != orig_st.st_size or raw_digests[path] != raw_digests[original]:
+            continue # same content, different encryption
+        tmp_path = path.with_name(path.name + '.dedup')
+        try:
+            os.link(original, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            reason = 'different filesystems' if e.errno == errno.EXDEV else 'no hard links on this filesystem' if e.errno in (errno.EPERM, errno.ENOTSUP) else e.strerror
+            print(f"Can't link {path} to {original}: {reason}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            continue
+        freed += st.st_size
+    return freed
+
+if __name__ == '__main__':
+    import argparse, json
+
+    parser = argparse.ArgumentParser(description='Finds duplicate images/audio of an RPG Maker game by content.')
+    parser.add_argument('-i', '--input-directory', type=Path, default='www', help='Path to the RPG Maker project directory (default: www)')
+    parser.add_argument('-l', '--hard-link', action='store_true', help='Replace identical copies with hard links')
+    parser.add_argument('-j', '--json', action='store_true', help='Print the duplicate groups as JSON')
+    parser.add_argument('-w', '--workers', type=int, default=MAX_WORKERS, help=f'Reading threads (default: {MAX_WORKERS})')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented(args):
+        key = findKey(str(args.input_directory / 'data' / 'System.json'))
+        groups, raw_digests = find_duplicates(args.input_directory, key, args.workers)
+        total_wasted = sum(wasted_bytes(paths) for paths in groups)
+        if args.json:
+            print(json.dumps([{'wasted': wasted_bytes(paths), 'files': [str(p) for p in paths]} for paths in groups], indent=2))
+        else:
+            for paths in groups:
+                print(f'==== {wasted_bytes(paths)} bytes wasted ====')
+                for path in paths:
+                    print(path.relative_to(args.input_directory.absolute()))
+            print(f'{len(groups)} duplicate groups, {total_wasted} bytes wasted.')
+        if args.hard_link:
+            with TIMINGS.phase('link'):
+                freed = sum(link_duplicates(paths, raw_digests) for paths in groups)
+            print(f'Hard-linked duplicates, {freed} bytes freed.')
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Progress window of the GUI mode of rpgm_dec/rpgm_enc: the files are processed by a pool
+# of worker threads that report through a queue, the Tk main loop polls the queue at a
+# fixed rate, so the window stays responsive and redraws don't slow the work down.
+import os, time, queue, threading
+from concurrent.futures import ThreadPoolExecutor
+import tkinter
+from tkinter import ttk
+
+POLL_INTERVAL_MS = 100
+CLOSE_DELAY_MS = 5000
+WORKERS = min(8, (os.cpu_count() or 1) + 4)
+
+def short_path(fn, begin=32, end=32):
+    return fn[:begin] + "..." + fn[-end:] if len(fn) > begin + end + 3 else fn
+
+def format_eta(seconds):
+    seconds = int(seconds + 0.5)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}" if seconds >= 3600 else f"{seconds // 60}:{seconds % 60:02}"
+
+class ProgressWindow(object):
+    """ Window with a progress bar over the real number of files, the current file,
+        the ETA and a Cancel button.
+    """
+    def __init__(self, title, workers=WORKERS):
+        self.workers = workers
+        self.window = tkinter.Tk()
+        self.window.title(title)
+        self.window.geometry("500x130")
+        self.window.resizable(0, 0)
+        self.window.eval('tk::PlaceWindow %s center' % self.window.winfo_toplevel())
+        self.progressbar = ttk.Progressbar(self.window, orient="horizontal", length=460, mode="determinate")
+        self.progressbar.pack(fill='x', padx=15, pady=(15, 5))
+        self.text = tkinter.StringVar()
+        self.text.set("Ready...")
+        tkinter.Label(self.window, textvariable=self.text).pack(expand=True)
+        self.button = ttk.Button(self.window, text="Cancel", command=self.cancel)
+        self.button.pack(pady=(0, 10))
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        self.cancelled = threading.Event()
+        self.queue = queue.Queue()
+        self.total = self.done = self.errors = 0
+        self.current = ''
+        self.start_time = None
+
+    def start(self, items, work, verb, done_text):
+        """ Runs work(item) for all items in the worker threads. """
+        self.items = list(items)
+        self.work = work
+        self.verb = verb
+        self.done_text = done_text
+        self.total = len(self.items)
+        self.progressbar["maximum"] = max(self.total, 1)
+        self.start_time = time.perf_counter()
+        threading.Thread(target=self.run_workers, daemon=True).start()
+        self.window.after(POLL_INTERVAL_MS, self.poll)
+        self.window.mainloop()
+
+    def run_workers(self):
+        def run(item):
+            if self.cancelled.is_set():
+                return
+            try:
+                self.work(item)
+                self.queue.put((item, None))
+            except Exception as e:
+                self.queue.put((item, e))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(run, self.items))
+        self.queue.put(None)
+
+    def poll(self):
+        finished = False
+        try:
+            while True:
+                message = self.queue.get_nowait()
+                if message is None:
+                    finished = True
+                    break
+                item, error = message
+                self.done += 1
+                self.current = item
+                if error is not None:
+                    self.errors += 1
+                    print(f"Error processing {item}: {error}")
+        except queue.Empty:
+            pass
+        self.progressbar["value"] = self.done
+        if finished:
+            self.finish()
+            return
+        if self.cancelled.is_set():
+            self.text.set("Cancelling...")
+        elif self.done:
+            elapsed = time.perf_counter() - self.start_time
+            eta = format_eta(elapsed / self.done * (self.total - self.done))
+            self.text.set(f"{self.verb}: {short_path(self.current).replace('/', os.sep)}\n"
+                          f"{self.done} of {self.total} files, {eta} left")
+        self.window.after(POLL_INTERVAL_MS, self.poll)
+
+    def finish(self, text=None):
+        """ Shows the result (or the given error) and closes the window after a while. """
+        if text is None:
+            if self.cancelled.is_set():
+                text = f"Cancelled after {self.done} of {self.total} files."
+            else:
+                text = self.done_text + (f"\n{self.errors} files failed, see the console." if self.errors else "")
+        self.progressbar.destroy()
+        self.button.config(text="Close", command=self.window.destroy, state="normal")
+        self.text.set(text)
+        self.window.after(CLOSE_DELAY_MS, self.window.destroy)
+
+    def show_error(self, text):
+        self.finish(text)
+        self.window.mainloop()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.button.config(state="disabled")
+        self.text.set("Cancelling...")
+
+    def close(self):
+        self.cancelled.set()
+        self.window.destroy()
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# This script removes unused icons from IconSet.png of RPGM MV/MZ games: the used icons are
+# moved up into the free slots and iconIndex/\I[n] references in the data files are rewritten.
+import os, io, re, glob, shutil, codecs
+import numpy as np
+from PIL import Image
+
+from show_icon_id import IconSheet, ICONS_PER_ROW, RE_ICON_CODE, RE_ICON_INDEX, collect_icon_refs, read_icon_geometry
+from rpgm_dec import findKey, decryptBytes
+from rpgm_enc import encryptBytes
+from rpgm_timing import TIMINGS, add_arguments, instrumented
+
+ICONSET_NAMES = ('IconSet.png', 'IconSet.rpgmvp', 'IconSet.png_')
+# buff/debuff icons are drawn from fixed indices (Game_BattlerBase.ICON_BUFF_START/ICON_DEBUFF_START)
+RESERVED_ICONS = range(64)
+RE_PLUGIN_ICON = re.compile(r'\\*"[^"]*Icon[^"]*\\*"\s*:\s*\\*"(\d+)\\*"', re.IGNORECASE)
+# <Icon: n> note tags, drawIcon(n)/iconIndex = n in scripts and plugin commands like "ShowIcon n"
+RE_SCRIPT_ICON = re.compile(r'icon\w*\s*(?:[:=]\s*|\(\s*|\s+)(\d+)', re.IGNORECASE)
+BACKUP_SUFFIX = '.bak'
+
+def find_iconset(game_dir):
+    for name in ICONSET_NAMES:
+        path = os.path.join(game_dir, 'img', 'system', name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def read_iconset(path, key):
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = None
+    if not path.endswith('.png'):
+        header, data = data[:16], decryptBytes(data, key, True)
+    with Image.open(io.BytesIO(data)) as im:
+        return im.convert('RGBA'), header
+
+def write_iconset(path, im, key, header=None):
+    buf = io.BytesIO()
+    im.save(buf, 'PNG', optimize=True)
+    data = buf.getvalue()
+    with open(path, 'wb') as f:
+        f.write(data if header is None else encryptBytes(data, key, header))
+
+def plugin_icons(game_dir):
+    """ Icon numbers in plugin parameters with "Icon" in their name and hard-coded in the
+        plugin sources; plugins can't be rewritten, so these icons keep their places.
+    """
+    icons = set()
+    try:
+        with open(os.path.join(game_dir, 'js', 'plugins.js'), 'r', encoding='utf-8-sig') as f:
+            plugins_js = f.read()
+        icons.update(int(n) for n in RE_PLUGIN_ICON.findall(plugins_js))
+        icons.update(int(n) for n in re.findall(r'\\+I\[(\d+)\]', plugins_js, re.IGNORECASE))
+    except OSError:
+        pass
+    for path in glob.glob(os.path.join(game_dir, 'js', 'plugins', '*.js')):
+        with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+            source = f.read()
+        icons.update(int(n) for n in RE_SCRIPT_ICON.findall(source))
+        icons.update(int(n) for n in re.findall(r'\\+I\[(\d+)\]', source, re.IGNORECASE))
+    return icons
+
+def script_icons(data_dir):
+    """ Icon numbers in note tags, Script and Plugin Command parameters of the data files;
+        their syntax is up to the plugins, so they aren't remapped but keep their places.
+    """
+    icons = set()
+    for name in sorted(os.listdir(data_dir)):
+        if not name.endswith('.json'): continue
+        with open(os.path.join(data_dir, name), 'r', encoding='utf-8-sig') as f:
+            icons.update(int(n) for n in RE_SCRIPT_ICON.findall(f.read()))
+    return icons
+
+def build_mapping(used, fixed, icon_count):
+    """ Maps used icon indices to compacted ones: fixed icons stay, the others fill the
+        lowest free slots in their original order.
+    """
+    fixed = {i for i in fixed if i < icon_count}
+    mapping = {i: i for i in fixed}
+    free = (i for i in range(icon_count) if i not in fixed)
+    for index in sorted(i for i in used if i not in fixed and i < icon_count):
+        mapping[index] = next(free)
+    return mapping
+
+def compact_sheet(icons, mapping):
+    """ New sheet image with the icons at their mapped places. """
+    rows = max(mapping.values(), default=0) // ICONS_PER_ROW + 1
+    tiles = np.zeros((rows * ICONS_PER_ROW, icons.icon_height, icons.icon_width, 4), dtype=np.uint8)
+    old, new = np.array(list(mapping.keys()), dtype=np.int64), np.array(list(mapping.values()), dtype=np.int64)
+    tiles[new] = icons.tiles[old]
+    grid = tiles.reshape(rows, ICONS_PER_ROW, icons.icon_height, icons.icon_width, 4).swapaxes(1, 2)
+    return Image.fromarray(grid.reshape(rows * icons.icon_height, ICONS_PER_ROW * icons.icon_width, 4), 'RGBA')
+
+def remap_text(text, mapping):
+    text = RE_ICON_INDEX.sub(lambda m: m.group(1) + str(mapping.get(int(m.group(2)), m.group(2))), text)
+    return RE_ICON_CODE.sub(lambda m: m.group(0).replace(m.group(1), str(mapping.get(int(m.group(1)), m.group(1)))), text)
+
+def remap_data(data_dir, mapping, dry_run=False, backups=None):
+    """ Rewrites iconIndex values and \\I[n] codes in place, keeping the BOM of the
+        files (or lack of it); returns the changed files. The old contents are kept
+        in .bak files whose paths are added to the backups list.
+    """
+    changed = []
+    for name in sorted(os.listdir(data_dir)):
+        if not name.endswith('.json'): continue
+        path = os.path.join(data_dir, name)
+        raw = TIMINGS.read_bytes(path)
+        text = raw.decode('utf-8-sig')
+        new_text = remap_text(text, mapping)
+        if new_text != text:
+            changed.append(name)
+            if not dry_run:
+                with open(path + BACKUP_SUFFIX, 'wb') as f:
+                    f.write(raw)
+                if backups is not None:
+                    backups.append(path)
+                with open(path, 'w', encoding='utf-8-sig' if raw.startswith(codecs.BOM_UTF8) else 'utf-8') as f:
+                    TIMINGS.count('chars written', f.write(new_text))
+                TIMINGS.count('files written')
+    return changed
+
+def restore_backups(paths):
+    for path in paths:
+        if os.path.isfile(path + BACKUP_SUFFIX):
+            os.replace(path + BACKUP_SUFFIX, path)
+
+def remove_backups(paths):
+    for path in paths:
+        if os.path.isfile(path + BACKUP_SUFFIX):
+            os.remove(path + BACKUP_SUFFIX)
+
+def verify(icons, new_icons, mapping, new_refs):
+    """ Returns a list of problems: moved icons must keep their pixels and the data
+        files must reference exactly the mapped indices.
+    """
+    problems = []
+    old, new = np.array(list(mapping.keys()), dtype=np.int64), np.array(list(mapping.values()), dtype=np.int64)
+    inside = new < len(new_icons)
+    if not inside.all():
+        problems.append(f"Icons outside of the new sheet: {old[~inside].tolist()}")
+    differs = old[inside][(icons.tiles[old[inside]] != new_icons.tiles[new[inside]]).any(axis=(1, 2, 3))]
+    if len(differs):
+        problems.append(f"Icons with changed pixels: {differs.tolist()}")
+    unexpected = set(new_refs) - set(mapping.values())
+    if unexpected:
+        problems.append(f"References to unmapped icons: {sorted(unexpected)}")
+    return problems
+
+def compact_icons(game_dir, keep=(), dry_run=False):
+    iconset_path = find_iconset(game_dir)
+    if not iconset_path:
+        print(f"ERROR: No IconSet in {os.path.join(game_dir, 'img', 'system')}")
+        return False
+    data_dir = os.path.join(game_dir, 'data')
+    key = findKey(os.path.join(data_dir, 'System.json'))
+    with TIMINGS.phase('read sheet'):
+        sheet, header = read_iconset(iconset_path, key)
+        icons = IconSheet(sheet, *read_icon_geometry(data_dir))
+
+    with TIMINGS.phase('collect refs'):
+        refs = collect_icon_refs(data_dir)
+    used = {i for i in refs if 0 <= i < len(icons)}
+    from_plugins, from_scripts = plugin_icons(game_dir), script_icons(data_dir)
+    fixed = set(RESERVED_ICONS) | from_plugins | from_scripts | set(keep)
+    for source, found in (('plugins', from_plugins), ('note tags/scripts', from_scripts)):
+        found = sorted(i for i in found if i not in RESERVED_ICONS and i < len(icons))
+        if found:
+            print(f"Kept in place, used by {source}: {found}")
+    with TIMINGS.phase('compact'):
+        mapping = build_mapping(used, fixed, len(icons))
+        new_sheet = compact_sheet(icons, mapping)
+        new_icons = IconSheet(new_sheet, icons.icon_width, icons.icon_height)
+    moved = sum(1 for old, new in mapping.items() if old != new)
+    print(f"Used icons: {len(used)} of {len(icons)}, moved: {moved}")
+    print(f"Sheet: {sheet.width}x{sheet.height} -> {new_sheet.width}x{new_sheet.height}")
+    out_of_range = sorted(i for i in refs if not 0 <= i < len(icons))
+    if out_of_range:
+        print(f"Left as is, outside of the sheet: {out_of_range}")
+    if not moved and new_sheet.height >= sheet.height:
+        print("Nothing to compact.")
+        return True
+
+    # the old files are kept as .bak until the result is verified
+    backups = [iconset_path]
+    try:
+        with TIMINGS.phase('remap data'):
+            if not dry_run:
+                shutil.copy2(iconset_path, iconset_path + BACKUP_SUFFIX)
+            changed = remap_data(data_dir, mapping, dry_run, backups)
+        print(f"Data files to rewrite: {', '.join(changed) or 'none'}")
+        if dry_run:
+            return True
+        with TIMINGS.phase('write sheet'):
+            write_iconset(iconset_path, new_sheet, key, header)
+
+        with TIMINGS.phase('verify'):
+            new_refs = collect_icon_refs(data_dir)
+            problems = verify(icons, new_icons, mapping, {i for i in new_refs if 0 <= i < len(icons)})
+    except BaseException:
+        if not dry_run:
+            restore_backups(backups)
+            print("Failed, the original files were restored.")
+        raise
+    for problem in problems:
+        print(f"VERIFY: {problem}")
+    if problems:
+        restore_backups(backups)
+        print("Verification failed! The original files were restored.")
+    else:
+        remove_backups(backups)
+        print("Verification passed: all used icons kept their pixels.")
+    return not problems
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Drops unused icons from IconSet.png and remaps the icon indices of an RPG Maker game in place.')
+    parser.add_argument('-i', '--input-directory', default='www', help='Path to the RPG Maker project directory (default: www)')
+    parser.add_argument('-k', '--keep', type=int, nargs='+', default=[], metavar='INDEX', help='Icons to keep at their places (used by plugins/scripts)')
+    parser.add_argument('-n', '--dry-run', action='store_true', help="Only report, don't write anything")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented(args):
+        compact_icons(args.input_directory, args.keep, args.dry_run)
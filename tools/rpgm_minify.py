@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# This script rewrites the data JSONs of RPGM MV/MZ games minified, with sorted keys,
+# and optionally clears event pages that can never become active.
+import os, re, json, time
+from concurrent.futures import ProcessPoolExecutor
+
+from rpgm_timing import TIMINGS, add_arguments, instrumented
+
+DATA_FOLDER = os.path.join('www', 'data')
+PARSE_REPEAT = 3
+CONDITION_FLAGS = ('actorValid', 'itemValid', 'selfSwitchValid', 'switch1Valid', 'switch2Valid', 'variableValid')
+END_COMMAND = {'code': 0, 'indent': 0, 'parameters': []}
+COMMENT_CODES = (108, 408)
+RE_PAGE_CONDITION_PLUGIN = re.compile(r'PageCondition|EventCondition', re.IGNORECASE)
+
+def parse_time(text, repeat=PARSE_REPEAT):
+    """ Returns the parsed data and the best time of `repeat` parses. """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = json.loads(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return data, best
+
+def minify(data):
+    return json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+def has_conditions(page):
+    conditions = page.get('conditions') or {}
+    return any(conditions.get(flag) for flag in CONDITION_FLAGS)
+
+def has_comments(page):
+    """ Comments may hold extra page conditions read by plugins (e.g. <Page Condition>). """
+    return any(command.get('code') in COMMENT_CODES for command in page.get('list') or [])
+
+def condition_plugins(data_dir):
+    """ Names of the enabled plugins of js/plugins.js that may add event page conditions:
+        by their name or by overriding Game_Event.meetsConditions.
+    """
+    js_dir = os.path.join(data_dir, '..', 'js')
+    try:
+        with open(os.path.join(js_dir, 'plugins.js'), 'r', encoding='utf-8-sig') as f:
+            plugins_js = f.read()
+        plugins_js = plugins_js[plugins_js.find('['):plugins_js.rfind(']') + 1]
+        plugins = [p['name'] for p in json.loads(plugins_js) if p and p.get('status')]
+    except (OSError, ValueError):
+        return []
+    found = []
+    for plugin in plugins:
+        try:
+            with open(os.path.join(js_dir, 'plugins', plugin + '.js'), 'r', encoding='utf-8-sig', errors='replace') as f:
+                source = f.read()
+        except OSError:
+            source = ''
+        if RE_PAGE_CONDITION_PLUGIN.search(plugin) or 'meetsConditions' in source:
+            found.append(plugin)
+    return found
+
+def clear_shadowed_pages(pages, plugin_conditions=False):
+    """ The game activates the last page whose conditions are met, so pages before
+        the last unconditional one never run: their command lists are reduced to the
+        end command (the pages stay to keep the page indices).
+        A page with comments may have plugin conditions, so it doesn't shadow anything;
+        returns (cleared pages, indices of the pages kept because of that).
+    """
+    cleared = 0
+    last_free = max((i for i, page in enumerate(pages) if page and not has_conditions(page)), default=0)
+    last_safe = 0 if plugin_conditions else \
+        max((i for i, page in enumerate(pages[:last_free + 1]) if page and not has_conditions(page) and not has_comments(page)), default=0)
+    for page in pages[:last_safe]:
+        if page and page.get('list') != [END_COMMAND]:
+            page['list'] = [dict(END_COMMAND)]
+            if page.get('moveRoute'):
+                page['moveRoute']['list'] = [{'code': 0, 'parameters': []}]
+            cleared += 1
+    kept = [i for i, page in enumerate(pages[:last_free]) if i >= last_safe and page and page.get('list') != [END_COMMAND]]
+    return cleared, kept
+
+def drop_dead(name, data, plugin_conditions=False):
+    """ Removes structures the game can't reach; returns the number of removals
+        and the shadowed pages kept as "event id/page number".
+    """
+    removed = 0
+    kept = []
+    if re.match(r'Map\d+$', name) and isinstance(data, dict):
+        events = data.get('events') or []
+        while events and events[-1] is None:
+            events.pop()
+            removed += 1
+        for event in events:
+            if event and event.get('pages'):
+                cleared, kept_pages = clear_shadowed_pages(event['pages'], plugin_conditions)
+                removed += cleared
+                kept += [f"{event.get('id')}/{i + 1}" for i in kept_pages]
+    return removed, kept
+
+def minify_file(path, drop=False, dry_run=False, plugin_conditions=False):
+    """ Returns (path, old size, new size, old parse time, new parse time, removals, kept pages);
+        new size is None for files that aren't valid JSON.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        data, old_time = parse_time(raw.decode('utf-8-sig'))
+    except ValueError:
+        return path, len(raw), None, 0, 0, 0, []
+    name = os.path.splitext(os.path.basename(path))[0]
+    removed, kept = drop_dead(name, data, plugin_conditions) if drop else (0, [])
+    text = minify(data)
+    _, new_time = parse_time(text)
+    new_raw = text.encode('utf-8')
+    if new_raw != raw and not dry_run:
+        with open(path, 'wb') as f:
+            f.write(new_raw)
+    return path, len(raw), len(new_raw), old_time, new_time, removed, kept
+
+def minify_data(data_dir, drop=False, dry_run=False, jobs=None):
+    """ Minifies all JSONs of the data folder in a process pool. Shadowed pages that
+        comments or page condition plugins may activate are kept and reported.
+    """
+    paths = [os.path.join(data_dir, name) for name in sorted(os.listdir(data_dir)) if name.endswith('.json')]
+    plugins = condition_plugins(data_dir) if drop else []
+    if plugins:
+        print(f"Page condition plugins enabled ({', '.join(plugins)}): no event pages are cleared")
+    totals = [0, 0, 0.0, 0.0, 0]
+    n = len(paths)
+    with ProcessPoolExecutor(max_workers=jobs) as executor, TIMINGS.phase('minify'):
+        for path, old_size, new_size, old_time, new_time, removed, kept in executor.map(minify_file, paths, [drop] * n, [dry_run] * n, [bool(plugins)] * n):
+            TIMINGS.count('files read')
+            TIMINGS.count('bytes read', old_size)
+            if new_size is None:
+                print(f"Skipping invalid JSON {path}")
+                continue
+            if new_size != old_size and not dry_run:
+                TIMINGS.count('files written')
+                TIMINGS.count('bytes written', new_size)
+            if kept and not plugins:
+                print(f"Kept shadowed pages of {os.path.basename(path)} (event/page), comments may hold plugin conditions: {', '.join(kept)}")
+            for i, value in enumerate((old_size, new_size, old_time, new_time, removed)):
+                totals[i] += value
+    return totals
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Minifies RPGM MV/MZ data JSONs into canonical form.')
+    parser.add_argument('-i', '--input-directory', default=DATA_FOLDER, help=f'Path to the data directory (default: {DATA_FOLDER})')
+    parser.add_argument('-d', '--drop-dead', action='store_true', help='Also drop trailing null events and clear event pages shadowed by a later page without conditions or comments (nothing is cleared when a page condition plugin is enabled)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('-n', '--dry-run', action='store_true', help="Only report the savings, don't write anything")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented(args):
+        old_size, new_size, old_time, new_time, removed = minify_data(args.input_directory, args.drop_dead, args.dry_run, args.jobs)
+        print(f"Size: {old_size} -> {new_size} bytes ({old_size - new_size} saved)")
+        print(f"Parse time: {old_time * 1000:.1f} -> {new_time * 1000:.1f} ms")
+        if args.drop_dead:
+            print(f"Dropped/cleared {removed} dead structures")
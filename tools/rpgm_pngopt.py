@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+# This script recompresses PNG images (plain or encrypted) of RPGM MV/MZ games losslessly:
+# ancillary chunks are dropped, palette mode is used when it keeps every pixel, and a
+# result is kept only when it's smaller and decodes to the very same pixels.
+import os, io, json, hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from rpgm_strip import iter_rpgm_files, logger
+from rpgm_timing import TIMINGS, add_arguments, instrumented
+from rpgm_dec import findKey, decryptBytes, ARTENC_HEADER, PNG_HEADER
+from rpgm_enc import encryptBytes
+
+ENCRYPTED_EXTENSIONS = ('.rpgmvp', '.png_')
+SUPPORTED_MODES = ('1', 'L', 'LA', 'P', 'RGB', 'RGBA')
+CACHE_FILE = 'pngopt_cache.json'
+
+def file_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def pixels(im):
+    return im.convert('RGBA').tobytes()
+
+def to_palette(im):
+    """ Palette copy of an RGB(A) image with at most 256 colors, None otherwise.
+        Translucent entries go first so the tRNS chunk stays short.
+    """
+    import numpy as np
+    colors = im.getcolors(256)
+    if not colors:
+        return None
+    has_alpha = (im.mode == 'RGBA')
+    colors = sorted(colors, key=lambda c: (has_alpha and c[1][3] == 255, -c[0]))
+    # pixels and palette colors packed into integers, each pixel looked up by binary search
+    weights = 256 ** np.arange(len(im.mode), dtype=np.uint32)
+    packed = np.asarray(im).reshape(-1, len(im.mode)).astype(np.uint32) @ weights
+    keys = np.array([color for _, color in colors], dtype=np.uint32) @ weights
+    order = np.argsort(keys)
+    indices = order[np.searchsorted(keys[order], packed)].astype(np.uint8)
+    pal_im = Image.frombytes('P', im.size, indices.tobytes())
+    pal_im.putpalette(b''.join(bytes(color[:3]) for _, color in colors))
+    if has_alpha:
+        alphas = [color[3] for _, color in colors]
+        while alphas and alphas[-1] == 255:
+            alphas.pop()
+        if alphas:
+            pal_im.info['transparency'] = bytes(alphas)
+    return pal_im
+
+def stripped(im):
+    """ Copy of the image without its ancillary chunks (ICC profile, text, gamma, ...),
+        only the transparency is kept.
+    """
+    copy = im.copy()
+    copy.info = {'transparency': im.info['transparency']} if 'transparency' in im.info else {}
+    return copy
+
+def candidates(im):
+    """ Yields lossless variants of the image (without its ancillary chunks). """
+    yield stripped(im)
+    src = im
+    if im.mode == 'LA' or (im.mode in ('L', 'RGB') and 'transparency' in im.info):
+        src = im.convert('RGBA')
+    if src.mode == 'RGBA' and src.getextrema()[3] == (255, 255):
+        src = src.convert('RGB')
+        yield stripped(src)
+    if src.mode in ('RGB', 'RGBA'):
+        pal_im = to_palette(src)
+        if pal_im:
+            yield pal_im
+
+def optimize_png(data):
+    """ Returns the smallest pixel-identical PNG of data or None if it can't be shrunk. """
+    with Image.open(io.BytesIO(data)) as im:
+        im.load()
+    if im.mode not in SUPPORTED_MODES:
+        return None
+    results = []
+    for cand in candidates(im):
+        params = {'transparency': cand.info['transparency']} if 'transparency' in cand.info else {}
+        buf = io.BytesIO()
+        cand.save(buf, 'PNG', optimize=True, **params)
+        if buf.tell() < len(data):
+            results.append(buf.getvalue())
+    reference = None
+    for result in sorted(results, key=len):
+        reference = reference or pixels(im)
+        with Image.open(io.BytesIO(result)) as new_im:
+            if pixels(new_im) == reference:
+                return result
+    return None
+
+def optimize_file(path, key, known_hash=None, dry_run=False):
+    """ Recompresses a single image file in place.
+        Returns (path, old size, new size, hash of the final file, status).
+    """
+    data = path.read_bytes()
+    digest = file_hash(data)
+    if digest == known_hash:
+        return path, len(data), len(data), digest, 'cached'
+    encrypted = path.suffix.lower() in ENCRYPTED_EXTENSIONS
+    if encrypted:
+        if not key or data[:16] == ARTENC_HEADER[:16]:
+            return path, len(data), len(data), None, 'skipped'
+        plain = decryptBytes(data, key, True)
+    else:
+        plain = data
+    if plain[:8] != PNG_HEADER[:8]:
+        return path, len(data), len(data), None, 'skipped'
+    try:
+        new_plain = optimize_png(plain)
+    except (OSError, SyntaxError, ValueError) as e:
+        logger.info(f"Can't read {path}: {e}")
+        return path, len(data), len(data), None, 'skipped'
+    if new_plain is None:
+        return path, len(data), len(data), digest, 'kept'
+    new_data = encryptBytes(new_plain, key, data[:16]) if encrypted else new_plain
+    if not dry_run:
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_bytes(new_data)
+        os.replace(tmp_path, path)
+    return path, len(data), len(new_data), file_hash(new_data), 'optimized'
+
+def load_cache(cache_path):
+    if cache_path and os.path.isfile(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == 1:
+            return cache['entries']
+    return {}
+
+def save_cache(cache_path, entries):
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'entries': entries}, f, ensure_ascii=False)
+
+def optimize_images(project_path, key=b'', cache_path=CACHE_FILE, jobs=None, dry_run=False):
+    """ Recompresses all images of the project in a process pool; files whose hash
+        matches the cache entry from a previous run are not decoded again.
+        Returns (files optimized, bytes saved).
+    """
+    project_path = Path(project_path).absolute()
+    with TIMINGS.phase('scan'):
+        entries = load_cache(cache_path)
+        paths = [path for kind, _, path in iter_rpgm_files(project_path, all_folders=True)
+                 if kind == 'img' and path.suffix.lower() in ('.png',) + ENCRYPTED_EXTENSIONS]
+    count = saved = 0
+    new_entries = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor, TIMINGS.phase('recompress'):
+        futures = [executor.submit(optimize_file, path, key, entries.get(path.relative_to(project_path).as_posix()), dry_run)
+                   for path in paths]
+        for future in futures:
+            path, old_size, new_size, digest, status = future.result()
+            rel_path = path.relative_to(project_path).as_posix()
+            TIMINGS.count(f'files {status}')
+            TIMINGS.count('bytes read', old_size)
+            if digest:
+                new_entries[rel_path] = digest
+            if status == 'optimized':
+                count += 1
+                saved += old_size - new_size
+                TIMINGS.count('bytes written', new_size)
+                logger.info(f"{rel_path}: {old_size} -> {new_size}")
+    if cache_path and not dry_run:
+        save_cache(cache_path, new_entries)
+    return count, saved
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Losslessly recompresses PNG images (also encrypted) of an RPG Maker game in place.')
+    parser.add_argument('-i', '--input-directory', type=Path, default='www', help='Path to the RPG Maker project directory (default: www)')
+    parser.add_argument('-c', '--cache', default=CACHE_FILE, help=f'File with hashes of already processed images (default: {CACHE_FILE}, "" to disable)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('-n', '--dry-run', action='store_true', help="Only report the savings, don't write anything")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    with instrumented(args):
+        key = findKey(str(args.input_directory / 'data' / 'System.json'))
+        count, saved = optimize_images(args.input_directory, key, args.cache, args.jobs, args.dry_run)
+        print(f'{count} images recompressed, {saved} bytes saved.')
@@ -1,7 +1,10 @@
 import json, io, logging, re, sys
+from collections import deque
 from pathlib import Path
 from enum import Enum
 
+from rpgm_timing import TIMINGS, add_arguments, instrumented
+
 # Logging setup
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -53,15 +56,82 @@ animation_map = {}
 image_keep_map = {resource_type.value: set() for resource_type in ResourceTypeImage}
 audio_keep_map = {resource_type.value: set() for resource_type in ResourceTypeAudio}
 
+# Call graph nodes: ('database',), ('map', id), ('event', map id, id), ('troop', id),
+# ('all_troops',), ('ce', id) and ('switch', id) for the switches turned ON somewhere
+DATABASE_NODE = ('database',)
+ALL_TROOPS_NODE = ('all_troops',)
+
+class AssetScope:
+    """ Call graph node: resources used directly by a map, map event, troop or
+        common event and the nodes it leads to (called common events, switches
+        it turns on, battles). The innermost active scope gets the registrations.
+    """
+    active = []
+
+    def __init__(self, node):
+        self.node = node
+        self.images = set()
+        self.audio = set()
+        self.edges = set()
+
+    def __enter__(self):
+        AssetScope.active.append(self)
+        return self
+
+    def __exit__(self, *args):
+        AssetScope.active.pop()
+
+scopes = {}
+
+def get_scope(node):
+    scope = scopes.get(node)
+    if scope is None:
+        scope = scopes[node] = AssetScope(node)
+    return scope
+
 def register_image_keep(resource_name, resource_type):
     logger.debug(f"Inserting {resource_name} {resource_type}...")
     if resource_name:
         image_keep_map[resource_type.value].add(resource_name)
+        if AssetScope.active:
+            AssetScope.active[-1].images.add((resource_type.value, resource_name))
 
 def register_audio_keep(resource_name, resource_type):
     logger.debug(f"Inserting {resource_name} {resource_type}...")
     if resource_name:
         audio_keep_map[resource_type.value].add(resource_name)
+        if AssetScope.active:
+            AssetScope.active[-1].audio.add((resource_type.value, resource_name))
+
+def register_edge(node):
+    if AssetScope.active:
+        AssetScope.active[-1].edges.add(node)
+
+def reachable_nodes(roots):
+    """ Breadth-first traversal of the call graph, linear in nodes + edges. """
+    seen = set(roots)
+    queue = deque(seen)
+    while queue:
+        scope = scopes.get(queue.popleft())
+        if scope is None: continue
+        for node in scope.edges:
+            if node not in seen:
+                seen.add(node)
+                queue.append(node)
+    return seen
+
+def collect_assets(nodes):
+    """ Returns image and audio keep maps of all the given nodes. """
+    images = {resource_type.value: set() for resource_type in ResourceTypeImage}
+    audio = {resource_type.value: set() for resource_type in ResourceTypeAudio}
+    for node in nodes:
+        scope = scopes.get(node)
+        if scope is None: continue
+        for folder, name in scope.images:
+            images[folder].add(name)
+        for folder, name in scope.audio:
+            audio[folder].add(name)
+    return images, audio
 
 def parse_tileset_map(tilesets):
     logger.debug("Parsing tilesets...")
@@ -121,6 +191,24 @@ def parse_command(command, check_scripts):
         if parameters[1] == "test":
             pass
         register_image_keep(parameters[1], ResourceTypeImage.PICTURES)
+    elif code == 101:  # Show Text
+        if parameters:
+            register_image_keep(parameters[0], ResourceTypeImage.FACES)
+    elif code == 205:  # Set Movement Route
+        for move in parameters[1].get('list', []):
+            if move['code'] == 41 and move.get('parameters'):  # Change Image
+                register_image_keep(move['parameters'][0], ResourceTypeImage.CHARACTERS)
+    elif code == 117:  # Call Common Event
+        register_edge(('ce', parameters[0]))
+    elif code == 121:  # Control Switches
+        if parameters[2] == 0:  # ON
+            for switch_id in range(parameters[0], parameters[1] + 1):
+                register_edge(('switch', switch_id))
+    elif code == 301:  # Battle Processing
+        if parameters[0] == 0:
+            register_edge(('troop', parameters[1]))
+        else:  # by a variable or same as random encounters
+            register_edge(ALL_TROOPS_NODE)
     elif code == 282:  # Change Tileset
         tileset_id = parameters[0]
         if tileset_id in tileset_map:
@@ -140,26 +228,48 @@ def parse_command(command, check_scripts):
             register_image_keep(result, ResourceTypeImage.PICTURES)
             register_audio_keep(result, ResourceTypeAudio.BGS)
             register_audio_keep(result, ResourceTypeAudio.SE)
+        for ce_id in re.findall(r"reserveCommonEvent\(\s*(\d+)", parameters[0]):
+            register_edge(('ce', int(ce_id)))
+        for switch_id in re.findall(r"\$gameSwitches\.setValue\(\s*(\d+)\s*,\s*true", parameters[0]):
+            register_edge(('switch', int(switch_id)))
     elif check_scripts and code == 357:  # MZ Script
         if len(parameters) >= 4:
             pass # TODO: needs a specific parameters for each
 
-def parse_events(data, check_scripts=False):
-    logger.debug(f"Parsing common events...")
+def parse_events(data, check_scripts=False, map_id=None):
+    logger.debug(f"Parsing map events...")
     for event in data['events']:
         if not event: continue
-        for page in event['pages']:
-            image_char_index = page['image'].get('characterName', None)
-            if image_char_index:
-                register_image_keep(image_char_index, ResourceTypeImage.CHARACTERS)
-            for command in page['list']:
-                parse_command(command, check_scripts)
+        node = ('event', map_id, event['id'])
+        register_edge(node)
+        with get_scope(node):
+            for page in event['pages']:
+                image_char_index = page['image'].get('characterName', None)
+                if image_char_index:
+                    register_image_keep(image_char_index, ResourceTypeImage.CHARACTERS)
+                for command in page['list']:
+                    parse_command(command, check_scripts)
 
 def parse_common_events(data, check_scripts=False):
     logger.debug("Parsing common events...")
     for c_event in data:
         if not c_event: continue
-        [parse_command(command, check_scripts) for command in c_event['list']]
+        node = ('ce', c_event['id'])
+        if c_event.get('trigger') in (1, 2):  # autorun/parallel: runs while its switch is ON
+            get_scope(('switch', c_event['switchId'])).edges.add(node)
+        with get_scope(node):
+            [parse_command(command, check_scripts) for command in c_event['list']]
+
+def parse_troops(data, check_scripts=False):
+    logger.debug("Parsing troops...")
+    for troop in data:
+        if not troop: continue
+        node = ('troop', troop['id'])
+        get_scope(ALL_TROOPS_NODE).edges.add(node)
+        with get_scope(node):
+            for page in troop['pages']:
+                for command in page['list']:
+                    parse_command(command, check_scripts)
 
 def parse_map(data):
     register_image_keep(data["battleback1Name"], ResourceTypeImage.BATTLEBACK1)
@@ -167,6 +277,8 @@ def parse_map(data):
     register_image_keep(data["parallaxName"], ResourceTypeImage.PARALLAX)
     register_audio_keep(data["bgs"]["name"], ResourceTypeAudio.BGS)
     register_audio_keep(data["bgm"]["name"], ResourceTypeAudio.BGM)
+    for encounter in data.get("encounterList", []):
+        register_edge(('troop', encounter["troopId"]))
     tileset_id = data["tilesetId"]
     if tileset_id in tileset_map:
         for key in tileset_map[tileset_id]:
@@ -212,6 +324,9 @@ def parse_data_for_animations(data):
     logger.debug("Parsing animations...")
     for item in data:
         if not item: continue
+        for effect in item.get('effects', []):
+            if effect['code'] == 44:  # Common Event
+                register_edge(('ce', effect['dataId']))
         anim_id = item['animationId']
         if anim_id >= 1:
             for file_se in animation_map[anim_id]['se']:
@@ -219,27 +334,57 @@ def parse_data_for_animations(data):
             for file_img in animation_map[anim_id]['img']:
                 register_image_keep(file_img, ResourceTypeImage.ANIMATIONS)
 
+def build_preload_manifest(on_disk_imgs=None):
+    """ Image paths of each map and common event itself, and the common events each map
+        can reach through the call graph (called ones, switch-gated autorun/parallel ones):
+        {"maps": {"1": ["img/tilesets/Outside_A1", ...]}, "commonEvents": {...},
+         "mapCommonEvents": {"1": [3, 7]}}
+    """
+    def own_images(node):
+        images = set()
+        for folder, names in collect_assets([node])[0].items():
+            if on_disk_imgs is not None:
+                names = names & on_disk_imgs.get(folder, set())
+            images.update(f'img/{folder}/{name}' for name in names)
+        return sorted(images)
+
+    def ids(kind):
+        return sorted(node[1] for node in scopes if node[0] == kind)
+
+    return {
+        'maps': {str(i): own_images(('map', i)) for i in ids('map')},
+        'commonEvents': {str(i): own_images(('ce', i)) for i in ids('ce')},
+        'mapCommonEvents': {str(i): sorted(node[1] for node in reachable_nodes([('map', i)]) if node[0] == 'ce')
+                            for i in ids('map')},
+    }
+
+def iter_rpgm_files(project_path, all_folders=False, recursive=False):
+    """ Yields ('img'|'audio', subfolder, path) of every asset file; only the
+        known resource folders unless all_folders is set, and only their own
+        files unless recursive is set.
+    """
+    project_path = Path(project_path).absolute()
+    for kind, known in (('img', ResourceTypeImage), ('audio', ResourceTypeAudio)):
+        base_dir = project_path / kind
+        if not base_dir.is_dir(): continue
+        if all_folders:
+            subdirs = sorted(d.name for d in base_dir.iterdir() if d.is_dir())
+        else:
+            subdirs = [resource_type.value for resource_type in known]
+        for subdir in subdirs:
+            cur_dir = base_dir / subdir
+            if not cur_dir.is_dir(): continue
+            for f in (cur_dir.rglob('*') if recursive else cur_dir.iterdir()):
+                if f.is_file():
+                    yield kind, subdir, f
+
 def list_rpgm_files(project_path, json_prefix='rtp', save=False):
     logger.debug(f"Loading RPG MV/MZ data...")
     all_rtp_img = {resource_type.value: set() for resource_type in ResourceTypeImage}
     all_rtp_audio = {resource_type.value: set() for resource_type in ResourceTypeAudio}
 
-    imgdir = project_path.absolute() / 'img'
-    audiodir = project_path.absolute() / 'audio'
-
-    for subdir in all_rtp_img:
-        cur_dir = imgdir / subdir
-        if not cur_dir.is_dir(): continue
-        for f in cur_dir.iterdir():
-            if f.is_file() and f.stem not in all_rtp_img[subdir]:
-                all_rtp_img[subdir].add(f.stem)
-
-    for subdir in all_rtp_audio:
-        cur_dir = audiodir / subdir
-        if not cur_dir.is_dir(): continue
-        for f in (audiodir / subdir).iterdir():
-            if f.is_file() and f.stem not in all_rtp_audio[subdir]:
-                all_rtp_audio[subdir].add(f.stem)
+    for kind, subdir, f in iter_rpgm_files(project_path):
+        (all_rtp_img if kind == 'img' else all_rtp_audio)[subdir].add(f.stem)
 
     if save:
         with open(f'{json_prefix}_imgs_list.json', 'w', encoding='utf-8') as f:
@@ -276,13 +421,16 @@ def remove_files(remove_dict, base_path, base_remove_path):
                 new_path = rdir / filename.relative_to(base_path)
                 new_path.parent.mkdir(parents=True, exist_ok=True)
                 filename.rename(rdir / filename.relative_to(base_path))
+                TIMINGS.count('files moved')
 
-def scan_js_files(project_path, imgs_to_delete, audio_to_delete):
+def scan_js_files(project_path, imgs_to_delete, audio_to_delete, js_files=None):
     js_folder = project_path / 'js'
-    if not js_folder.is_dir():
-        return
+    if js_files is None:
+        if not js_folder.is_dir():
+            return
+        js_files = js_folder.rglob('*.js')
 
-    for js_file in js_folder.rglob('*.js'):
+    for js_file in js_files:
         try:
             with open(js_file, 'r', encoding='utf-8') as f:
                 content = f.read()
@@ -298,7 +446,60 @@ def scan_js_files(project_path, imgs_to_delete, audio_to_delete):
             logger.error(f"Error reading or processing {js_file}: {e}")
 
 
-def run_parser(project_path, exclude_folders=None, strip_only_rtp=True, check_scripts=False, test_orphans=False, print_removed=False):
+def read_json(path):
+    text = path.read_text(encoding='utf-8-sig')
+    TIMINGS.count('files read')
+    TIMINGS.count('bytes read', len(text))
+    return TIMINGS.load_json(text)
+
+def parse_project(data_path, check_scripts=False, reachable_only=False, load_json=read_json, map_files=None):
+    """ Parses the data files into the keep maps and the call graph; load_json(path)
+        and map_files allow the caller to supply already read data. """
+    # Parse game data files
+    # NOTE: Some games don't use Armors/Items/Animations/etc you can reset them
+    #      manually (to [ null ] for lists and to {} for dicts) in the JSONs beforehand.
+    with TIMINGS.phase('parse database'):
+        parse_tileset_map(load_json(data_path / "Tilesets.json"))
+        parse_animations(load_json(data_path / "Animations.json"))
+        with get_scope(DATABASE_NODE):
+            parse_system(load_json(data_path / "System.json"))
+            parse_enemies(load_json(data_path / "Enemies.json"))
+            parse_actors(load_json(data_path / "Actors.json"))
+            parse_data_for_animations(load_json(data_path / "Skills.json"))
+            parse_data_for_animations(load_json(data_path / "Items.json"))
+            parse_data_for_animations(load_json(data_path / "Weapons.json"))
+        parse_common_events(load_json(data_path / "CommonEvents.json"), check_scripts)
+        parse_troops(load_json(data_path / "Troops.json"), check_scripts)
+
+    logger.debug("Parsing map info and tiles...")
+    with TIMINGS.phase('parse maps'):
+        for map_file in (data_path.glob('Map*') if map_files is None else map_files):
+            if re.match(r'Map\d+\b', map_file.stem):
+                data = load_json(map_file)
+                if not isinstance(data, dict):
+                    logger.error(f"{data} is not a dict in {map_file.stem}")
+                    return False
+                map_id = int(map_file.stem[3:])
+                with get_scope(('map', map_id)):
+                    parse_map(data)
+                    parse_events(data, check_scripts, map_id)
+
+    if reachable_only:
+        # Only keep what the database and the maps can actually reach
+        roots = [DATABASE_NODE] + [node for node in scopes if node[0] == 'map']
+        reachable = reachable_nodes(roots)
+        dead_events = sorted(node[1] for node in scopes if node[0] == 'ce' and node not in reachable)
+        if dead_events:
+            logger.info(f"Unreachable common events: {', '.join(map(str, dead_events))}")
+        image_keep_map.clear()
+        audio_keep_map.clear()
+        reachable_images, reachable_audio = collect_assets(reachable)
+        image_keep_map.update(reachable_images)
+        audio_keep_map.update(reachable_audio)
+
+    return True
+
+def run_parser(project_path, exclude_folders=None, strip_only_rtp=True, check_scripts=False, test_orphans=False, print_removed=False, manifest_path=None, reachable_only=False):
     project_path = Path(project_path)
     if not project_path.is_dir():
         logger.error(f'Directory "{project_path}" not found, check your input path (-i parameter)')
@@ -308,33 +509,20 @@ def run_parser(project_path, exclude_folders=None, strip_only_rtp=True, check_sc
         logger.error(f'Directory "{data_path}" not found, check your input path (-i parameter)')
         return False
 
-    # Parse game data files
-    # NOTE: Some games don't use Armors/Items/Animations/etc you can reset them
-    #      manually (to [ null ] for lists and to {} for dicts) in the JSONs beforehand.
-    parse_tileset_map(json.loads((data_path / "Tilesets.json").read_text(encoding='utf-8')))
-    parse_animations(json.loads((data_path / "Animations.json").read_text(encoding='utf-8')))
-    parse_system(json.loads((data_path / "System.json").read_text(encoding='utf-8')))
-    parse_enemies(json.loads((data_path / "Enemies.json").read_text(encoding='utf-8')))
-    parse_actors(json.loads((data_path / "Actors.json").read_text(encoding='utf-8')))
-    parse_common_events(json.loads((data_path / "CommonEvents.json").read_text(encoding='utf-8')), check_scripts)
-    parse_data_for_animations(json.loads((data_path / "Skills.json").read_text(encoding='utf-8')))
-    parse_data_for_animations(json.loads((data_path / "Items.json").read_text(encoding='utf-8')))
-    parse_data_for_animations(json.loads((data_path / "Weapons.json").read_text(encoding='utf-8')))
+    if not parse_project(data_path, check_scripts, reachable_only):
+        return False
 
-    logger.debug("Parsing map info and tiles...")
-    for map_file in data_path.glob('Map*'):
-        if re.match(r'Map\d+\b', map_file.stem):
-            data = json.loads(map_file.read_text(encoding='utf-8'))
-            if not isinstance(data, dict):
-                logger.error(f"{data} is not a dict in {map_file.stem}")
-                return False
-            data.pop('data', None)
-            parse_map(data)
-            parse_events(data, check_scripts)
+    if manifest_path:
+        manifest = build_preload_manifest(list_rpgm_files(project_path)[0])
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+        logger.info(f'Preload manifest for {len(manifest["maps"])} maps saved to {manifest_path}')
+        return False
 
     # Load or generate resource removal lists
     imgs_from_rtp, audio_from_rtp = load_rtp_list()
-    imgs_to_delete, audio_to_delete = list_rpgm_files(project_path)
+    with TIMINGS.phase('list files'):
+        imgs_to_delete, audio_to_delete = list_rpgm_files(project_path)
 
     # Exclude specified folders from removal
     for folder in exclude_folders:
@@ -358,7 +546,8 @@ def run_parser(project_path, exclude_folders=None, strip_only_rtp=True, check_sc
 
     # Scan JS files for resource usage since they can access the images
     if check_scripts:
-        scan_js_files(project_path, imgs_to_delete, audio_to_delete)
+        with TIMINGS.phase('scan scripts'):
+            scan_js_files(project_path, imgs_to_delete, audio_to_delete)
 
     if test_orphans:
         print('======== Orphan references ========')
@@ -385,8 +574,9 @@ def run_parser(project_path, exclude_folders=None, strip_only_rtp=True, check_sc
         return False
 
     # Move unused resource files
-    remove_files(imgs_to_delete, project_path / 'img', project_path / 'removed' / 'img')
-    remove_files(audio_to_delete, project_path / 'audio', project_path / 'removed' / 'audio')
+    with TIMINGS.phase('move files'):
+        remove_files(imgs_to_delete, project_path / 'img', project_path / 'removed' / 'img')
+        remove_files(audio_to_delete, project_path / 'audio', project_path / 'removed' / 'audio')
 
     return True
 
@@ -415,23 +605,34 @@ f'  {self_name} -i "NewData" -g\n'
     parser.add_argument('-e', '--exclude-folders', type=comma_separated, nargs='+', default=[], help='Comma-separated list of folders to exclude from stripping', metavar='DIRECTORY,')
     parser.add_argument('-s', '--strip-only-rtp', action='store_true', help='Strip only RTP resources, otherwise everything unused')
     parser.add_argument('-c', '--check-scripts-not', action='store_true', help="Don't check script commands and .js files for resources (naive approach)")
+    parser.add_argument('-r', '--reachable-only', action='store_true', help="Don't keep resources of common events/troops no map or database entry can reach\n(common events called only from plugins will be treated as unused)")
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('-o', '--orphans-list', action='store_true', help='Find resources declared in JSONs but missing on disk')
     group.add_argument('-t', '--test-parse-jsons', action='store_true', help='Only print unused game resources to the console')
     group.add_argument('-g', '--generate-lists', action='store_true', help='Generate JSON resource lists (to dump file lists of RPGM RTP)')
     group.add_argument('-p', '--parse-jsons', action='store_true', help='Run stripping of the unused game resources')
+    group.add_argument('-m', '--preload-manifest', nargs='?', const='', default=None, metavar='FILE',
+        help='Write per-map/common event image lists for PreloadSceneImages (default: data/PreloadManifest.json)')
+    add_arguments(parser)
 
     args = parser.parse_args(args=None if sys.argv[1:] else ['--help'])
 
-    if args.generate_lists:
-        list_rpgm_files(args.input_directory, save=True)
-        print('Resource JSON files generated successfully.')
-    elif run_parser(
-            args.input_directory, 
-            args.exclude_folders, 
-            args.strip_only_rtp, 
-            not args.check_scripts_not, 
-            args.orphans_list,
-            args.test_parse_jsons):
-        print('Unused resources moved to the "removed" folder.')
+    manifest_path = args.preload_manifest
+    if manifest_path == '':
+        manifest_path = args.input_directory / 'data' / 'PreloadManifest.json'
+
+    with instrumented(args):
+        if args.generate_lists:
+            list_rpgm_files(args.input_directory, save=True)
+            print('Resource JSON files generated successfully.')
+        elif run_parser(
+                args.input_directory, 
+                args.exclude_folders, 
+                args.strip_only_rtp, 
+                not args.check_scripts_not, 
+                args.orphans_list,
+                args.test_parse_jsons,
+                manifest_path,
+                args.reachable_only):
+            print('Unused resources moved to the "removed" folder.')
 
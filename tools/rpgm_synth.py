@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# This script generates synthetic RPGM MV/MZ projects of a configurable size (maps, events,
+# messages, database, plain or encrypted assets) for testing and benchmarking the tools.
+# The same settings and seed always give the same project.
+import os, io, json, random, binascii
+from PIL import Image
+
+from rpgm_enc import encryptBytes
+
+DEFAULT_KEY = 'd41d8cd98f00b204e9800998ecf8427e'
+WORDS = ('the', 'a', 'of', 'sword', 'hero', 'village', 'dragon', 'potion', 'quest', 'king',
+         'forest', 'gold', 'magic', 'castle', 'night', 'friend', 'road', 'old', 'dark', 'light')
+IMAGE_FOLDERS = ('animations', 'battlebacks1', 'battlebacks2', 'characters', 'enemies', 'faces',
+                 'parallaxes', 'pictures', 'sv_actors', 'sv_enemies', 'system', 'tilesets', 'titles1', 'titles2')
+AUDIO_FOLDERS = ('bgm', 'bgs', 'me', 'se')
+END_COMMAND = {'code': 0, 'indent': 0, 'parameters': []}
+
+class Settings:
+    """ Scale of a synthetic project. """
+    def __init__(self, maps=10, events=30, pages=2, common_events=50, messages=10, message_lines=3, long_lines=0.3,
+                 images=10, audio=5, unused=0.2, image_size=48, encrypted=True, mz=False, seed=0, key=DEFAULT_KEY):
+        self.maps, self.events, self.pages = maps, events, pages
+        self.common_events, self.messages, self.message_lines = common_events, messages, message_lines
+        self.long_lines = long_lines  # share of 401 lines longer than fix_wrapping.MAXIMAL_LENGTH
+        self.images, self.audio, self.unused, self.image_size = images, audio, unused, image_size
+        self.encrypted, self.mz, self.seed, self.key = encrypted, mz, seed, key
+
+    def to_dict(self):
+        return dict(vars(self))
+
+def sentence(rng, words=8):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, words)))
+    return text[0].upper() + text[1:] + rng.choice('.!?')
+
+def long_sentence(rng, min_length=70, max_length=160):
+    """ Sentences of untranslated-length lines that fix_wrapping has to split. """
+    length = rng.randint(min_length, max_length)
+    text = sentence(rng)
+    while len(text) < length:
+        text += ' ' + sentence(rng)
+    return text
+
+def message(rng, settings, indent=0, face=''):
+    """ Show Text (101) with a run of 401 lines. """
+    commands = [{'code': 101, 'indent': indent, 'parameters': [face, 0, 0, 2] + (['Speaker'] if settings.mz else [])}]
+    for _ in range(rng.randint(1, settings.message_lines)):
+        text = long_sentence(rng) if rng.random() < settings.long_lines else sentence(rng)
+        commands.append({'code': 401, 'indent': indent, 'parameters': [text]})
+    return commands
+
+def command_list(rng, settings, names, messages):
+    commands = []
+    for _ in range(messages):
+        commands += message(rng, settings, face=rng.choice(names['faces']))
+        roll = rng.random()
+        if roll < 0.2:
+            commands.append({'code': 117, 'indent': 0, 'parameters': [rng.randint(1, max(settings.common_events, 1))]})
+        elif roll < 0.3:
+            commands.append({'code': 121, 'indent': 0, 'parameters': [rng.randint(1, 20)] * 2 + [0]})
+        elif roll < 0.45:
+            commands.append({'code': 231, 'indent': 0, 'parameters': [1, rng.choice(names['pictures']), 0, 0, 0, 0, 100, 100, 255, 0]})
+        elif roll < 0.55:
+            commands.append({'code': 250, 'indent': 0, 'parameters': [{'name': rng.choice(names['se']), 'volume': 90, 'pitch': 100, 'pan': 0}]})
+        elif roll < 0.65:
+            commands.append({'code': 102, 'indent': 0, 'parameters': [['Yes', 'No'], 1, 0, 2, 0]})
+            for i, choice in enumerate(('Yes', 'No')):
+                commands.append({'code': 402, 'indent': 0, 'parameters': [i, choice]})
+                commands += message(rng, settings, indent=1)
+                commands.append({'code': 0, 'indent': 1, 'parameters': []})
+            commands.append({'code': 404, 'indent': 0, 'parameters': []})
+    return commands + [dict(END_COMMAND)]
+
+def event_page(rng, settings, names, index):
+    conditions = {'actorId': 1, 'actorValid': False, 'itemId': 1, 'itemValid': False, 'selfSwitchCh': 'A',
+                  'selfSwitchValid': index > 0, 'switch1Id': 1, 'switch1Valid': False, 'switch2Id': 1,
+                  'switch2Valid': False, 'variableId': 1, 'variableValid': False, 'variableValue': 0}
+    return {
+        'conditions': conditions, 'directionFix': False,
+        'image': {'characterIndex': rng.randint(0, 7), 'characterName': rng.choice(names['characters']),
+                  'direction': 2, 'pattern': 1, 'tileId': 0},
+        'list': command_list(rng, settings, names, settings.messages),
+        'moveFrequency': 3, 'moveRoute': {'list': [{'code': 0, 'parameters': []}], 'repeat': True, 'skippable': False, 'wait': False},
+        'moveSpeed': 3, 'moveType': 0, 'priorityType': 1, 'stepAnime': False, 'through': False, 'trigger': 0, 'walkAnime': True
+    }
+
+def make_map(rng, settings, names, map_id):
+    width, height = 17 + map_id % 20, 13 + map_id % 15
+    events = [None]
+    for event_id in range(1, settings.events + 1):
+        events.append({'id': event_id, 'name': f'EV{event_id:03d}', 'note': '', 'x': rng.randrange(width), 'y': rng.randrange(height),
+                       'pages': [event_page(rng, settings, names, i) for i in range(settings.pages)]})
+    return {
+        'autoplayBgm': True, 'autoplayBgs': False, 'battleback1Name': rng.choice(names['battlebacks1']),
+        'battleback2Name': rng.choice(names['battlebacks2']), 'bgm': {'name': rng.choice(names['bgm']), 'pan': 0, 'pitch': 100, 'volume': 90},
+        'bgs': {'name': '', 'pan': 0, 'pitch': 100, 'volume': 90}, 'disableDashing': False, 'displayName': f'Map {map_id}',
+        'encounterList': [{'regionSet': [], 'troopId': 1, 'weight': 10}], 'encounterStep': 30, 'height': height, 'note': '',
+        'parallaxLoopX': False, 'parallaxLoopY': False, 'parallaxName': rng.choice(names['parallaxes']), 'parallaxShow': True,
+        'parallaxSx': 0, 'parallaxSy': 0, 'scrollType': 0, 'specifyBattleback': True, 'tilesetId': 1, 'width': width,
+        'data': [rng.choice((0, 2816, 1536, 3200)) if i < width * height else 0 for i in range(width * height * 6)],
+        'events': events
+    }
+
+def database(rng, settings, names):
+    """ Returns {file name: data} of the database files. """
+    data = {}
+    data['Actors'] = [None] + [{'id': i, 'name': f'Actor{i}', 'nickname': '', 'profile': sentence(rng), 'note': '',
+                                'characterName': rng.choice(names['characters']), 'characterIndex': i % 8,
+                                'faceName': rng.choice(names['faces']), 'faceIndex': i % 8,
+                                'battlerName': rng.choice(names['sv_actors']), 'classId': 1, 'initialLevel': 1, 'maxLevel': 99,
+                                'equips': [1, 1, 2, 3, 0], 'traits': []} for i in range(1, 5)]
+    for name in ('Items', 'Skills', 'Weapons', 'Armors', 'States'):
+        data[name] = [None] + [{'id': i, 'name': f'{name[:-1]}{i}', 'description': sentence(rng), 'iconIndex': rng.randint(64, 255),
+                                'note': '', 'effects': [], 'traits': [], 'animationId': 1} for i in range(1, 21)]
+    data['Enemies'] = [None] + [{'id': i, 'name': f'Enemy{i}', 'battlerName': rng.choice(names['enemies']), 'battlerHue': 0,
+                                 'actions': [], 'dropItems': [], 'traits': [], 'note': ''} for i in range(1, 6)]
+    data['Troops'] = [None] + [{'id': i, 'name': f'Troop{i}', 'members': [{'enemyId': i, 'x': 400, 'y': 300, 'hidden': False}],
+                                'pages': [{'conditions': {'turnEnding': False, 'turnValid': False, 'enemyValid': False, 'actorValid': False,
+                                                          'switchValid': False}, 'span': 0,
+                                           'list': command_list(rng, settings, names, 1)}]} for i in range(1, 6)]
+    data['Animations'] = [None] + [{'id': i, 'name': f'Animation{i}', 'animation1Name': rng.choice(names['animations']),
+                                    'animation1Hue': 0, 'animation2Name': '', 'animation2Hue': 0, 'frames': [[]] * 4, 'position': 1,
+                                    'timings': [{'frame': 0, 'se': {'name': rng.choice(names['se']), 'pan': 0, 'pitch': 100, 'volume': 90},
+                                                 'flashScope': 0, 'flashColor': [255, 255, 255, 255], 'flashDuration': 5}]}
+                                   for i in range(1, 11)]
+    data['Tilesets'] = [None, {'id': 1, 'name': 'Field', 'mode': 1, 'flags': [0] * 8192, 'note': '',
+                               'tilesetNames': [rng.choice(names['tilesets']) for _ in range(9)]}]
+    data['CommonEvents'] = [None] + [{'id': i, 'name': f'CE{i}', 'switchId': 1, 'trigger': 0,
+                                      'list': command_list(rng, settings, names, max(settings.messages // 2, 1))}
+                                     for i in range(1, settings.common_events + 1)]
+    data['MapInfos'] = [None] + [{'id': i, 'name': f'MAP{i:03d}', 'parentId': 0, 'order': i, 'expanded': False,
+                                  'scrollX': 0, 'scrollY': 0} for i in range(1, settings.maps + 1)]
+    system = {'gameTitle': 'Synthetic', 'currencyUnit': 'G', 'locale': 'en_US', 'versionId': settings.seed,
+              'hasEncryptedImages': settings.encrypted, 'hasEncryptedAudio': settings.encrypted,
+              'encryptionKey': settings.key, 'switches': [''] * 21, 'variables': [''] * 21,
+              'title1Name': rng.choice(names['titles1']), 'title2Name': rng.choice(names['titles2']),
+              'titleBgm': {'name': rng.choice(names['bgm']), 'pan': 0, 'pitch': 100, 'volume': 90},
+              'sounds': [{'name': rng.choice(names['se']), 'pan': 0, 'pitch': 100, 'volume': 90} for _ in range(24)],
+              'startMapId': 1, 'startX': 1, 'startY': 1, 'partyMembers': [1, 2],
+              'battleback1Name': rng.choice(names['battlebacks1']), 'battleback2Name': rng.choice(names['battlebacks2']),
+              'battlerName': rng.choice(names['sv_actors'])}
+    for name, folder in (('battleBgm', 'bgm'), ('defeatMe', 'me'), ('gameoverMe', 'me'), ('victoryMe', 'me')):
+        system[name] = {'name': rng.choice(names[folder]), 'pan': 0, 'pitch': 100, 'volume': 90}
+    for vehicle in ('airship', 'boat', 'ship'):
+        system[vehicle] = {'bgm': {'name': rng.choice(names['bgm']), 'pan': 0, 'pitch': 100, 'volume': 90},
+                           'characterIndex': 0, 'characterName': rng.choice(names['characters']), 'startMapId': 0, 'startX': 0, 'startY': 0}
+    if settings.mz:
+        system['advanced'] = {'gameId': settings.seed, 'screenWidth': 816, 'screenHeight': 624, 'uiAreaWidth': 816, 'uiAreaHeight': 624}
+        system['iconSize'] = 32
+    data['System'] = system
+    return data
+
+def png_bytes(rng, size):
+    im = Image.frombytes('RGBA', (size, size), bytes(rng.getrandbits(8) for _ in range(size * size * 4)))
+    buf = io.BytesIO()
+    im.save(buf, 'PNG', compress_level=1)
+    return buf.getvalue()
+
+def asset_names(settings):
+    """ Returns {folder: [used names]} and {folder: [all names]} of the assets. """
+    used, all_names = {}, {}
+    for folder in IMAGE_FOLDERS + AUDIO_FOLDERS:
+        count = settings.audio if folder in AUDIO_FOLDERS else settings.images
+        names = [f'{folder.capitalize()}{i:03d}' for i in range(1, count + 1)]
+        all_names[folder] = names
+        used[folder] = names[:max(1, int(len(names) * (1 - settings.unused)))]
+    return used, all_names
+
+def write_assets(root, rng, settings, all_names):
+    key = bytearray(binascii.unhexlify(settings.key))
+    ext = {'.png': '.png_', '.ogg': '.ogg_'} if settings.mz else {'.png': '.rpgmvp', '.ogg': '.rpgmvo'}
+    count = 0
+    for folder, names in all_names.items():
+        kind, plain_ext = ('audio', '.ogg') if folder in AUDIO_FOLDERS else ('img', '.png')
+        os.makedirs(os.path.join(root, kind, folder), exist_ok=True)
+        for name in names:
+            if kind == 'img':
+                data = png_bytes(rng, settings.image_size)
+            else:
+                data = b'OggS' + bytes(rng.getrandbits(8) for _ in range(2048))
+            if settings.encrypted:
+                data, file_ext = encryptBytes(data, key), ext[plain_ext]
+            else:
+                file_ext = plain_ext
+            with open(os.path.join(root, kind, folder, name + file_ext), 'wb') as f:
+                f.write(data)
+            count += 1
+    return count
+
+def generate_project(output_dir, settings=None):
+    """ Writes the project into output_dir (into output_dir/www for MV) and returns
+        the path of the folder with data/img/audio.
+    """
+    settings = settings or Settings()
+    rng = random.Random(settings.seed)
+    root = output_dir if settings.mz else os.path.join(output_dir, 'www')
+    used, all_names = asset_names(settings)
+    data_dir = os.path.join(root, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    os.makedirs(os.path.join(root, 'js'), exist_ok=True)
+
+    files = database(rng, settings, used)
+    for map_id in range(1, settings.maps + 1):
+        files[f'Map{map_id:03d}'] = make_map(rng, settings, used, map_id)
+    for name, data in files.items():
+        with open(os.path.join(data_dir, name + '.json'), 'w', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False))
+    with open(os.path.join(root, 'js', 'plugins.js'), 'w', encoding='utf-8') as f:
+        f.write('var $plugins =\n[\n];\n')
+    if not settings.mz:
+        with open(os.path.join(root, 'Game.rpgproject'), 'w', encoding='utf-8') as f:
+            f.write('RPGMV 1.6.2')
+    write_assets(root, rng, settings, all_names)
+    return root
+
+if __name__ == '__main__':
+    import argparse
+
+    defaults = Settings()
+    parser = argparse.ArgumentParser(description='Generates a deterministic synthetic RPG Maker MV/MZ project.')
+    parser.add_argument('output_dir', help='Directory of the new project')
+    for name, value in defaults.to_dict().items():
+        if isinstance(value, bool):
+            flag = f'--no-{name.replace("_", "-")}' if value else f'--{name.replace("_", "-")}'
+            parser.add_argument(flag, dest=name, action='store_false' if value else 'store_true')
+        else:
+            parser.add_argument(f'--{name.replace("_", "-")}', type=type(value), default=value, help=f'(default: {value})')
+    args = parser.parse_args()
+
+    settings = Settings(**{name: getattr(args, name) for name in defaults.to_dict()})
+    print(f"Project written to {generate_project(args.output_dir, settings)}")
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# This script extracts message texts (101/401/102/402/405) of RPGM MV/MZ games
+# into a flat table and injects the edited table back into the data files.
+import os, re, csv, json, hashlib
+from rpgm_timing import TIMINGS, add_arguments, instrumented
+
+DATA_FOLDER = os.path.join('www', 'data')
+INDEX_FILE = 'texts.csv'
+COLUMNS = ['id', 'file', 'event', 'page', 'index', 'item', 'code', 'source', 'text']
+
+# code -> index of the translatable parameter (102 holds a list of choices)
+TEXT_PARAMETERS = {
+    101: 4,   # Show Text (MZ speaker name)
+    401: 0,   # Show Text line
+    102: 0,   # Show Choices
+    402: 1,   # When [Choice]
+    405: 0,   # Show Scrolling Text line
+}
+
+def string_id(file, event, page, index, item):
+    """ Stable ID of a string: it only depends on its location. """
+    return hashlib.sha1(f'{file}:{event}:{page}:{index}:{item}'.encode('utf-8')).hexdigest()[:12]
+
+def text_hash(text):
+    """ Hash of the extracted text, checked on injection. """
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+def iter_lists(file, data):
+    """ Yields (event, page, command list) of a data file. """
+    if re.match(r'Map\d+$', file):
+        for event in data.get('events', []):
+            if not event: continue
+            for page_i, page in enumerate(event['pages']):
+                if page and page.get('list'):
+                    yield event['id'], page_i, page['list']
+    elif file == 'CommonEvents':
+        for c_event in data:
+            if c_event and c_event.get('list'):
+                yield c_event['id'], 0, c_event['list']
+    elif file == 'Troops':
+        for troop in data:
+            if not troop: continue
+            for page_i, page in enumerate(troop['pages']):
+                if page and page.get('list'):
+                    yield troop['id'], page_i, page['list']
+
+def iter_texts(file, data):
+    """ Yields (event, page, command index, item, code, text) of every message string. """
+    for event, page, commands in iter_lists(file, data):
+        for index, command in enumerate(commands):
+            param = TEXT_PARAMETERS.get(command['code'])
+            if param is None or len(command['parameters']) <= param:
+                continue
+            value = command['parameters'][param]
+            if command['code'] == 102:
+                for item, choice in enumerate(value):
+                    if isinstance(choice, str):
+                        yield event, page, index, item, 102, choice
+            elif isinstance(value, str) and value:
+                yield event, page, index, 0, command['code'], value
+
+def data_files(data_dir):
+    for name in sorted(os.listdir(data_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext == '.json' and (re.match(r'Map\d+$', stem) or stem in ('CommonEvents', 'Troops')):
+            yield stem, os.path.join(data_dir, name)
+
+def extract(data_dir, index_path=INDEX_FILE):
+    """ Writes all message strings into a CSV table in one pass over the data files,
+        holding only one parsed file in memory at a time.
+    """
+    count = 0
+    with open(index_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for file, path in data_files(data_dir):
+            with open(path, 'r', encoding='utf-8-sig') as jf:
+                data = TIMINGS.load_json(jf.read())
+            TIMINGS.count('files read')
+            for event, page, index, item, code, text in iter_texts(file, data):
+                writer.writerow([string_id(file, event, page, index, item), file, event, page, index, item, code, text_hash(text), text])
+                count += 1
+    return count
+
+def load_index(index_path=INDEX_FILE):
+    """ Reads the table into {file: {id: (code, source hash, text)}}. """
+    index = {}
+    with open(index_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        if 'source' not in reader.fieldnames:
+            print(f"{index_path} has no source column, the texts can't be checked against the data files (extract it again)")
+        for row in reader:
+            index.setdefault(row['file'], {})[row['id']] = (int(row['code']), row.get('source'), row['text'])
+    return index
+
+def inject(data_dir, index_path=INDEX_FILE):
+    """ Writes the table texts back, rewriting only the files with changed strings.
+        A string is only replaced while the data file still has the extracted text at
+        its location, the others (e.g. lines moved by fix_wrapping) are reported.
+    """
+    changed_files = 0
+    mismatches = 0
+    index = load_index(index_path)
+    for file, entries in index.items():
+        path = os.path.join(data_dir, file + '.json')
+        if not os.path.isfile(path):
+            print(f"Skipping missing file {path}")
+            continue
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            data = TIMINGS.load_json(f.read())
+        TIMINGS.count('files read')
+        is_modified = False
+        found = set()
+
+        def replace(values, i, code, event, page, index_i, item):
+            nonlocal is_modified, mismatches
+            string = string_id(file, event, page, index_i, item)
+            entry = entries.get(string)
+            if not entry:
+                return
+            found.add(string)
+            where = f"{file} event {event} page {page} at {index_i}" + (f" choice {item}" if code == 102 else '')
+            if entry[0] != code:
+                print(f"Command mismatch in {where}, skipping")
+                mismatches += 1
+            elif values[i] == entry[2]:
+                pass
+            elif entry[1] and text_hash(values[i]) != entry[1]:
+                print(f"Text changed since extraction in {where}, skipping: {values[i]!r}")
+                mismatches += 1
+            else:
+                values[i] = entry[2]
+                is_modified = True
+
+        for event, page, commands in iter_lists(file, data):
+            for index_i, command in enumerate(commands):
+                param = TEXT_PARAMETERS.get(command['code'])
+                if param is None or len(command['parameters']) <= param:
+                    continue
+                if command['code'] == 102:
+                    choices = command['parameters'][param]
+                    for item in range(len(choices)):
+                        replace(choices, item, 102, event, page, index_i, item)
+                else:
+                    replace(command['parameters'], param, command['code'], event, page, index_i, 0)
+        for string in entries.keys() - found:
+            print(f"String {string} of {file} not found, skipping")
+            mismatches += 1
+        if is_modified:
+            with open(path, 'w', encoding='utf-8-sig') as f:
+                TIMINGS.count('chars written', f.write(json.dumps(data, ensure_ascii=False)))
+            TIMINGS.count('files written')
+            changed_files += 1
+    if mismatches:
+        print(f"{mismatches} strings were not injected, the data files changed since extraction")
+    return changed_files
+
+if __name__ == '__main__':
+    import argparse, sys
+
+    parser = argparse.ArgumentParser(description='Extracts/injects RPGM MV/MZ message texts to/from a CSV table.')
+    parser.add_argument('-i', '--input-directory', default=DATA_FOLDER, help=f'Path to the data directory (default: {DATA_FOLDER})')
+    parser.add_argument('-f', '--file', default=INDEX_FILE, help=f'Text table file (default: {INDEX_FILE})')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('-x', '--extract', action='store_true', help='Extract texts into the table')
+    group.add_argument('-r', '--reinject', action='store_true', help='Write the table texts back into the data files')
+    add_arguments(parser)
+    args = parser.parse_args(args=None if sys.argv[1:] else ['--help'])
+
+    with instrumented(args):
+        if args.extract:
+            print(f"Extracted {extract(args.input_directory, args.file)} strings to {args.file}")
+        else:
+            print(f"Updated {inject(args.input_directory, args.file)} data files")
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Common instrumentation of the tools: --timings prints per-phase wall/CPU times and counters
+# (files, bytes, JSON parsing, ...), --profile runs the tool under cProfile, and Progress
+# prints rate-limited progress lines instead of one console write per file.
+import os, sys, time, json
+from contextlib import contextmanager
+
+PROGRESS_INTERVAL = 0.25  # seconds between progress lines
+PROFILE_LINES = 30
+
+class Timings:
+    """ Per-phase wall/CPU times and named counters; counting costs a flag check while disabled. """
+    def __init__(self):
+        self.enabled = False
+        self.phases = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, [0.0, 0.0, 0])
+            entry[0] += time.perf_counter() - wall
+            entry[1] += time.process_time() - cpu
+            entry[2] += 1
+
+    def count(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def read_bytes(self, path):
+        """ Reads a file, counting it. """
+        with open(path, 'rb') as f:
+            data = f.read()
+        if self.enabled:
+            self.count('files read')
+            self.count('bytes read', len(data))
+        return data
+
+    def write_bytes(self, path, data):
+        """ Writes a file, counting it. """
+        with open(path, 'wb') as f:
+            f.write(data)
+        if self.enabled:
+            self.count('files written')
+            self.count('bytes written', len(data))
+
+    def load_json(self, text):
+        """ json.loads, counting the parsed size and time. """
+        if not self.enabled:
+            return json.loads(text)
+        start = time.perf_counter()
+        data = json.loads(text)
+        self.count('JSON parse s', time.perf_counter() - start)
+        self.count('JSON parsed chars', len(text))
+        return data
+
+    def report(self, file=sys.stderr):
+        if self.phases:
+            print(f"{'phase':<32}{'wall s':>10}{'cpu s':>10}{'calls':>8}", file=file)
+            for name, (wall, cpu, calls) in self.phases.items():
+                print(f"{name:<32}{wall:>10.3f}{cpu:>10.3f}{calls:>8}", file=file)
+        for name, value in self.counters.items():
+            print(f"{name:<32}{value:>10.3f}" if isinstance(value, float) else f"{name:<32}{value:>10}", file=file)
+
+TIMINGS = Timings()
+
+class Progress:
+    """ Single console line updated at most every `interval` seconds. """
+    def __init__(self, interval=PROGRESS_INTERVAL, file=None, width=80):
+        self.interval = interval
+        self.file = file or sys.stdout
+        self.width = width
+        self.last = 0.0
+        self.shown = False
+
+    def update(self, text):
+        now = time.monotonic()
+        if now - self.last < self.interval:
+            return
+        self.last = now
+        self.shown = True
+        text = text if len(text) < self.width else text[:32] + '...' + text[-(self.width - 36):]
+        print(' ' + text.ljust(self.width - 1) + '\r', end='', file=self.file, flush=True)
+
+    def done(self):
+        if self.shown:
+            print(' ' * self.width + '\r', end='', file=self.file, flush=True)
+            self.shown = False
+
+def add_arguments(parser):
+    parser.add_argument('--timings', action='store_true', help='Print per-phase times and I/O counters at the end')
+    parser.add_argument('--profile', nargs='?', const='', default=None, metavar='FILE', help='Run under cProfile, print the top functions or save the stats to FILE (the next argument that is not an option)')
+
+def pop_arguments(argv=None):
+    """ Removes --timings/--profile [FILE] from argv (sys.argv by default) for the tools
+        without argparse; returns an object with timings and profile attributes. Like
+        argparse in the other tools, --profile takes the next argument as FILE unless it
+        is an option (or an existing directory, the game), --profile=FILE works too.
+    """
+    argv = sys.argv if argv is None else argv
+    class Options: timings = False; profile = None
+    options = Options()
+    i = 1
+    while i < len(argv):
+        if argv[i] == '--timings':
+            options.timings = True
+            argv.pop(i)
+        elif argv[i] == '--profile':
+            argv.pop(i)
+            options.profile = argv.pop(i) if i < len(argv) and not argv[i].startswith('-') and not os.path.isdir(argv[i]) else ''
+        elif argv[i].startswith('--profile='):
+            options.profile = argv.pop(i)[len('--profile='):]
+        else:
+            i += 1
+    return options
+
+@contextmanager
+def instrumented(options):
+    """ Runs the body with the options of add_arguments/pop_arguments applied. """
+    TIMINGS.enabled = bool(getattr(options, 'timings', False))
+    profile_path = getattr(options, 'profile', None)
+    if profile_path and os.path.isdir(profile_path):
+        sys.exit(f"--profile {profile_path}: is a directory, put the game directory before --profile")
+    profiler = None
+    if profile_path is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield TIMINGS
+    finally:
+        if profiler:
+            profiler.disable()
+            if profile_path:
+                profiler.dump_stats(profile_path)
+                print(f"Profile saved to {profile_path}", file=sys.stderr)
+            else:
+                import pstats
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        if TIMINGS.enabled:
+            TIMINGS.report()
+            print(f"{'total':<32}{time.perf_counter() - wall:>10.3f}{time.process_time() - cpu:>10.3f}", file=sys.stderr)
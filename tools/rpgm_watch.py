@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+# This script watches a game during translation and re-runs the tools only on what changed:
+# edited map/common event JSONs are re-wrapped (fix_wrapping), the unused asset report of
+# rpgm_strip is updated from just the edited maps, edited PNG/OGG/M4A files are encrypted
+# again (rpgm_enc) and run_server.py is told to drop its cached copies of all of them.
+# Changes come from inotify on Linux, elsewhere the folders are polled.
+import os, re, sys, json, time, codecs, select, struct, urllib.parse, urllib.request
+from pathlib import Path
+
+import rpgm_enc, rpgm_strip, fix_wrapping
+
+DEBOUNCE = 0.2       # seconds without new changes before a batch is processed
+POLL_INTERVAL = 0.5  # seconds between scans of the polling watcher
+WATCHED_FOLDERS = ('data', 'img', 'audio')
+ACTIONS = ('wrap', 'strip', 'encrypt')
+SERVER_URL = 'http://127.0.0.1:8000'
+INVALIDATE_PATH = '/__invalidate'
+RE_EVENT_FILE = re.compile(r'(?:Map\d+|CommonEvents)\.json$')
+RE_MAP_FILE = re.compile(r'Map(\d+)\.json$')
+
+# inotify(7) flags
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+class InotifyWatcher:
+    """ Recursive watch of folders through the inotify calls of libc (Linux only). """
+    def __init__(self, folders):
+        import ctypes, ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}  # watch descriptor -> directory
+        for folder in folders:
+            self.add_tree(folder)
+
+    def add_tree(self, path):
+        """ Watches a directory tree, returns the files already in it. """
+        found = set()
+        for dir_path, dirs, files in os.walk(path):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), WATCH_MASK)
+            if wd >= 0:
+                self.dirs[wd] = dir_path
+            found.update(os.path.join(dir_path, f) for f in files)
+        return found
+
+    def read(self, timeout=None):
+        """ Returns the paths changed within timeout seconds (None: waits for a change). """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+            name = data[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + length].rstrip(b'\0')
+            pos += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                print("Warning: too many changes at once, some were lost (save the files again)")
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+            dir_path = self.dirs.get(wd)
+            if dir_path is None or not name:
+                continue
+            path = os.path.join(dir_path, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed |= self.add_tree(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM):
+                changed.add(path)
+        return changed
+
+class PollingWatcher:
+    """ Finds changed files by comparing the (mtime, size) of all files between scans. """
+    def __init__(self, folders, interval=POLL_INTERVAL):
+        self.folders = folders
+        self.interval = interval
+        self.files = self.scan()
+
+    def scan(self):
+        files = {}
+        for folder in self.folders:
+            for dir_path, dirs, names in os.walk(folder):
+                for name in names:
+                    path = os.path.join(dir_path, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files[path] = (st.st_mtime_ns, st.st_size)
+        return files
+
+    def read(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        files = self.scan()
+        changed = {path for path, state in files.items() if self.files.get(path) != state}
+        changed |= self.files.keys() - files.keys()
+        self.files = files
+        return changed
+
+def make_watcher(folders, polling=False):
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError) as e:
+            print(f"inotify is not available ({e}), polling the folders instead")
+    return PollingWatcher(folders)
+
+def read_json(path):
+    """ Returns the parsed file and whether it had a BOM. """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return json.loads(raw.decode('utf-8-sig')), raw.startswith(codecs.BOM_UTF8)
+
+def file_state(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+class WatchSession:
+    """ Keeps what the actions need between changes (wrapping profile and caches, the
+        strip call graph, files on disk) and processes batches of changed paths.
+    """
+    def __init__(self, game_dir, actions=ACTIONS, server=SERVER_URL, check_scripts=True,
+                 profiles=fix_wrapping.PROFILES_FILE, profile_name=None, report_path=None):
+        self.game_dir = os.path.abspath(game_dir)
+        www_dir = os.path.join(self.game_dir, 'www')
+        self.root = www_dir if os.path.isdir(os.path.join(www_dir, 'data')) else self.game_dir
+        self.data_path = Path(self.root) / 'data'
+        self.actions = actions
+        self.server = server
+        self.check_scripts = check_scripts
+        self.report_path = report_path
+        self.written = {}  # path -> (mtime, size) of the files written by the session itself
+        system, _ = read_json(self.data_path / 'System.json')
+        self.key = rpgm_enc.findKey(str(self.data_path / 'System.json'))
+        self.mz = 'advanced' in system
+        if 'wrap' in actions:
+            self.profile = fix_wrapping.get_profile(self.game_dir, profiles, profile_name)
+            self.measure = fix_wrapping.MessageMeasure(self.profile, *fix_wrapping.load_game_names(
+                self.game_dir, os.path.relpath(self.data_path, self.game_dir))).__enter__()
+            try:
+                self.measure.width('Ag')  # fails now rather than on every saved file
+            except Exception as e:
+                raise RuntimeError(f"Can't measure text for wrapping ({type(e).__name__}: {e}), drop 'wrap' from --actions") from e
+            self.wrap_cache = fix_wrapping.WrapCache()
+            self.wrap_namespace = self.wrap_cache.namespace(self.profile, self.measure)
+        if 'strip' in actions:
+            self.on_disk = {}  # (kind, folder) -> {stem: file names}
+            for kind, folder, f in rpgm_strip.iter_rpgm_files(self.root):
+                self.update_asset(str(f), True)
+            self.parse_all()
+            self.unused = self.find_unused()
+            print(f"{sum(map(len, self.unused.values()))} unused assets")
+            self.save_report()
+
+    def update_asset(self, path, exists):
+        """ Adds or removes a file of the known resource folders. """
+        parts = os.path.relpath(path, self.root).replace(os.sep, '/').split('/')
+        if len(parts) != 3 or parts[1] not in (rpgm_strip.image_keep_map if parts[0] == 'img' else rpgm_strip.audio_keep_map):
+            return
+        stems = self.on_disk.setdefault((parts[0], parts[1]), {})
+        stem = os.path.splitext(parts[2])[0]
+        if exists:
+            stems.setdefault(stem, set()).add(parts[2])
+        elif parts[2] in stems.get(stem, ()):
+            stems[stem].discard(parts[2])
+            if not stems[stem]:
+                del stems[stem]
+
+    def parse_all(self):
+        """ Rebuilds the call graph of rpgm_strip from all the data files. """
+        rpgm_strip.scopes.clear()
+        rpgm_strip.tileset_map.clear()
+        rpgm_strip.animation_map.clear()
+        for keep_map in (rpgm_strip.image_keep_map, rpgm_strip.audio_keep_map):
+            for names in keep_map.values():
+                names.clear()
+        rpgm_strip.parse_project(self.data_path, self.check_scripts, load_json=lambda path: read_json(path)[0])
+
+    def parse_map(self, map_id, data):
+        """ Replaces the call graph nodes of one map and its events. """
+        for node in [node for node in rpgm_strip.scopes if node[0] in ('map', 'event') and node[1] == map_id]:
+            del rpgm_strip.scopes[node]
+        with rpgm_strip.get_scope(('map', map_id)):
+            rpgm_strip.parse_map(data)
+            rpgm_strip.parse_events(data, self.check_scripts, map_id)
+
+    def find_unused(self):
+        """ Returns {'img/<folder>' or 'audio/<folder>': stems} nothing refers to. """
+        images, audio = rpgm_strip.collect_assets(list(rpgm_strip.scopes))
+        used = {'img': images, 'audio': audio}
+        return {f'{kind}/{folder}': set(stems) - used[kind].get(folder, set())
+                for (kind, folder), stems in self.on_disk.items()}
+
+    def save_report(self):
+        if self.report_path:
+            with open(self.report_path, 'w', encoding='utf-8') as f:
+                json.dump({folder: sorted(stems) for folder, stems in sorted(self.unused.items()) if stems}, f, indent=1)
+
+    def is_own_write(self, path):
+        state = self.written.pop(path, None)
+        return state is not None and state == file_state(path)
+
+    def write(self, path, data):
+        with open(path, 'wb') as f:
+            f.write(data)
+        self.written[path] = file_state(path)
+
+    def wrap(self, path, name, data, bom):
+        if fix_wrapping.wrap_data(name, data, self.profile, self.measure, self.wrap_cache, self.wrap_namespace):
+            text = json.dumps(data, ensure_ascii=False)
+            self.write(path, (codecs.BOM_UTF8 if bom else b'') + text.encode('utf-8'))
+            return True
+        return False
+
+    def encrypt(self, path):
+        enc_path = rpgm_enc.makeFilename(path, self.mz) or path + '_'
+        with open(path, 'rb') as f:
+            self.write(enc_path, rpgm_enc.encryptBytes(f.read(), self.key))
+        if 'strip' in self.actions:
+            self.update_asset(enc_path, True)
+        return enc_path
+
+    def invalidate(self, paths):
+        """ Tells run_server.py to forget the paths; a server that isn't running is fine. """
+        if not self.server or not paths:
+            return
+        url_paths = ['/' + os.path.relpath(path, self.root).replace(os.sep, '/') for path in sorted(paths)]
+        for i in range(0, len(url_paths), 50):
+            query = urllib.parse.urlencode([('path', p) for p in url_paths[i:i + 50]])
+            try:
+                urllib.request.urlopen(f"{self.server}{INVALIDATE_PATH}?{query}", timeout=0.5).read()
+            except OSError:
+                return
+
+    def process_file(self, path, log, touched):
+        """ Runs the actions for one changed path; returns True if the whole call graph
+            has to be parsed again (a database file changed).
+        """
+        rel = os.path.relpath(path, self.root).replace(os.sep, '/')
+        parts = rel.split('/')
+        exists = os.path.isfile(path)
+        if parts[0] == 'data' and len(parts) == 2 and rel.endswith('.json'):
+            if not exists:
+                return True
+            try:
+                data, bom = read_json(path)
+            except ValueError as e:
+                log.append(f"{rel}: {e}")  # saved halfway, the next save brings it back
+                return False
+            if 'wrap' in self.actions and RE_EVENT_FILE.match(parts[1]) and self.wrap(path, parts[1], data, bom):
+                log.append(f"{rel}: wrapped")
+            if 'strip' in self.actions:
+                map_match = RE_MAP_FILE.match(parts[1])
+                if map_match and isinstance(data, dict) and 'events' in data:
+                    self.parse_map(int(map_match.group(1)), data)
+                elif parts[1] != 'MapInfos.json':
+                    return True
+        elif parts[0] in ('img', 'audio') and len(parts) >= 3:
+            if 'strip' in self.actions:
+                self.update_asset(path, exists)
+            if 'encrypt' in self.actions and exists and self.key and rpgm_enc.isEncryptableFile(path):
+                touched.add(self.encrypt(path))
+                log.append(f"{rel}: encrypted")
+        return False
+
+    def process(self, changed):
+        """ Runs the actions for a batch of changed paths, returns the log lines. """
+        log = []
+        touched = set()
+        reparse = False
+        for path in sorted(changed):
+            if self.is_own_write(path):
+                continue
+            touched.add(path)
+            try:
+                reparse |= self.process_file(path, log, touched)
+            except Exception as e:
+                log.append(f"{os.path.relpath(path, self.root)}: {e!r}")
+        if 'strip' in self.actions and touched:
+            if reparse:
+                self.parse_all()
+            unused = self.find_unused()
+            for folder in sorted(unused.keys() | self.unused.keys()):
+                new, old = unused.get(folder, set()), self.unused.get(folder, set())
+                if new - old:
+                    log.append(f"now unused in {folder}: {', '.join(sorted(new - old))}")
+                if old - new:
+                    log.append(f"now used in {folder}: {', '.join(sorted(old - new))}")
+            self.unused = unused
+            self.save_report()
+        self.invalidate(touched)
+        return log
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Re-wraps, re-encrypts and updates the strip report of the changed files of an RPG Maker MV/MZ game.')
+    parser.add_argument('game_dir', nargs='?', default='.', help='Game directory (with www for MV, default: current)')
+    parser.add_argument('-a', '--actions', nargs='+', choices=ACTIONS, default=list(ACTIONS), help='What to do with changed files (default: all)')
+    parser.add_argument('-s', '--server', default=SERVER_URL, help=f'run_server.py to invalidate the changed paths at (default: {SERVER_URL}, "" for none)')
+    parser.add_argument('-r', '--report', help='Keep the unused assets in this JSON file')
+    parser.add_argument('-c', '--check-scripts-not', action='store_true', help="Don't check script commands for resources")
+    parser.add_argument('-p', '--profiles', default=fix_wrapping.PROFILES_FILE, help=f'Wrapping profiles JSON file (default: {fix_wrapping.PROFILES_FILE})')
+    parser.add_argument('-n', '--profile-name', help='Wrapping profile to use instead of matching by folder name')
+    parser.add_argument('-d', '--debounce', type=float, default=DEBOUNCE, help=f'Seconds to wait for more changes (default: {DEBOUNCE})')
+    parser.add_argument('--poll', action='store_true', help='Poll the folders instead of using inotify')
+    parser.add_argument('--portable-measure', action='store_true', help='Measure with Pillow instead of Windows GDI (always used off Windows)')
+    args = parser.parse_args()
+    fix_wrapping.PORTABLE_MEASURE = args.portable_measure or sys.platform != 'win32'
+
+    try:
+        session = WatchSession(args.game_dir, args.actions, args.server.rstrip('/'), not args.check_scripts_not,
+                               args.profiles, args.profile_name, args.report)
+    except RuntimeError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    watcher = make_watcher([os.path.join(session.root, folder) for folder in WATCHED_FOLDERS], args.poll)
+    print(f"Watching {session.root} ({type(watcher).__name__}), Ctrl+C to stop")
+    pending = set()
+    try:
+        while True:
+            changed = watcher.read(args.debounce if pending else None)
+            if changed:
+                pending |= changed
+                continue
+            if pending:
+                start = time.perf_counter()
+                log = session.process(pending)
+                pending = set()
+                if log:
+                    print(f"[{time.strftime('%H:%M:%S')}] " + f"\n{' ' * 11}".join(log) +
+                          f" ({(time.perf_counter() - start) * 1000:.0f} ms)")
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
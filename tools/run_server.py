@@ -1,25 +1,269 @@
 # -*- coding:utf-8 -*-
-from pathlib import Path
 from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 import webbrowser
 import threading
-from sys import argv
-from os.path import realpath
-from os import chdir
-from time import sleep
+from os.path import realpath, relpath, exists, join, isfile, isdir, splitext, dirname
+from os import chdir, listdir, stat, fstat, sep, curdir, pardir
+from time import sleep, perf_counter
+from math import ceil
+from email.utils import formatdate, parsedate_to_datetime
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.client import HTTPMessage
+from urllib.parse import unquote, urlsplit, parse_qs
+from collections import OrderedDict, deque
+import argparse, asyncio, binascii, io, json, mimetypes, posixpath, re, socket, gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 RUN_IN_BROWSER = False
+MAX_CONNECTIONS = 256
 
-PATHS = {}
-_wdir = '.'
-command_line = (len(argv) > 1)
-if command_line:
-    _wdir = realpath(argv[1].strip('"'))
-    chdir(_wdir)
+parser = argparse.ArgumentParser(description='Runs local HTTP server from a folder.')
+parser.add_argument('directory', nargs='?', default='.', help='Folder to serve (default: current)')
+parser.add_argument('-d', '--decrypt', action='store_true',
+    help='Serve encrypted images/audio as plain files, decrypting them on request')
+parser.add_argument('-z', '--compress', action='store_true',
+    help='Serve text assets (data/*.json, js/*.js, ...) compressed from a memory cache')
+parser.add_argument('-e', '--engine', choices=('threads', 'asyncio'), default='threads',
+    help='Thread per connection (default) or a single asyncio loop with sendfile')
+parser.add_argument('-c', '--max-connections', type=int, default=MAX_CONNECTIONS,
+    help=f'Connections served at once by the asyncio engine (default: {MAX_CONNECTIONS})')
+args = parser.parse_args()
+_wdir = realpath(args.directory.strip('"'))
+chdir(_wdir)
 
-for path in Path(_wdir).glob("**/*"):
-    name = str(path.resolve())
-    PATHS[name.lower()] = name
+class PathResolver(object):
+    """ Case-insensitive path lookup that lists each directory only when
+        a request first goes through it and re-lists it when its mtime changes.
+    """
+    def __init__(self, root):
+        self.root = realpath(root)
+        self.dirs = {} # directory -> (mtime_ns, {lowercase name: name})
+
+    def listing(self, dir_path):
+        try:
+            mtime = stat(dir_path).st_mtime_ns
+        except OSError:
+            return None
+        cached = self.dirs.get(dir_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            names = {name.lower(): name for name in listdir(dir_path)}
+        except OSError:
+            return None
+        self.dirs[dir_path] = (mtime, names)
+        return names
+
+    def resolve(self, path):
+        if exists(path):
+            return path
+        rel_path = relpath(path, self.root)
+        if rel_path.startswith('..'):
+            return path
+        current = self.root
+        for part in rel_path.split(sep):
+            if part in ('', '.'): continue
+            names = self.listing(current)
+            name = names.get(part.lower()) if names else None
+            if name is None:
+                return path
+            current = join(current, name)
+        return current
+
+PATHS = PathResolver(_wdir)
+
+RE_ENC_KEY_CUE = re.compile(r'encryptionKey"\s*:\s*"([^"]+)"')
+RE_ENC_FLAGS = re.compile(rb'("hasEncrypted(?:Images|Audio)"\s*:\s*)true')
+PNG_HEADER = b'\x89PNG\r\n\x1a\n\0\0\0\rIHDR'
+ENC_HEADER_LENGTH = 16
+# plain extension -> extensions of its encrypted versions (MV, MZ)
+ENCRYPTED_EXTENSIONS = {
+    '.png': ('.rpgmvp', '.png_'),
+    '.ogg': ('.rpgmvo', '.ogg_'),
+    '.m4a': ('.rpgmvm', '.m4a_'),
+}
+HOT_CACHE_SIZE = 64 * 1024 * 1024
+SMALL_FILE_SIZE = 256 * 1024
+
+def find_key(root):
+    for sys_json in (join(root, 'data', 'System.json'), join(root, 'www', 'data', 'System.json')):
+        if not isfile(sys_json): continue
+        with open(sys_json, 'r', encoding='utf-8-sig') as f:
+            key = RE_ENC_KEY_CUE.search(f.read())
+        if key:
+            return bytes(binascii.unhexlify(key.group(1)))
+    return b''
+
+def xor(source, key):
+    if not key:
+        return source
+    l = len(key)
+    return bytes(source[i] ^ key[i % l] for i in range(len(source)))
+
+class LRUCache(object):
+    """ Thread-safe LRU mapping limited by the total length of its values. """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def discard(self, predicate):
+        """ Removes the entries whose keys match; returns how many. """
+        with self.lock:
+            keys = [key for key in self.items if predicate(key)]
+            for key in keys:
+                self.size -= len(self.items.pop(key))
+            return len(keys)
+
+    def put(self, key, value):
+        if len(value) > self.max_size:
+            return
+        with self.lock:
+            old = self.items.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.items[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                _, old = self.items.popitem(last=False)
+                self.size -= len(old)
+
+class DecryptedFile(object):
+    """ Seekable view of an encrypted file as its plain content: the decrypted
+        header followed by the rest of the file as is.
+    """
+    def __init__(self, f, header):
+        self.f = f
+        self.header = header
+        self.pos = 0
+
+    def seek(self, pos):
+        self.pos = pos
+        self.f.seek(ENC_HEADER_LENGTH + max(pos, len(self.header)))
+
+    def read(self, size=-1):
+        data = b''
+        if self.pos < len(self.header):
+            end = len(self.header) if size < 0 else min(len(self.header), self.pos + size)
+            data = self.header[self.pos:end]
+            self.pos = end
+            if size >= 0:
+                size -= len(data)
+                if size == 0:
+                    return data
+            self.f.seek(ENC_HEADER_LENGTH + len(self.header))
+        rest = self.f.read(size)
+        self.pos += len(rest)
+        return data + rest
+
+    def close(self):
+        self.f.close()
+
+class Decryptor(object):
+    """ Finds encrypted counterparts of plain asset paths and opens them decrypted,
+        keeping the decrypted headers and small files of hot assets in memory.
+    """
+    def __init__(self, key):
+        self.key = key
+        self.cache = LRUCache(HOT_CACHE_SIZE)
+
+    def find_encrypted(self, path):
+        base, ext = splitext(path)
+        for enc_ext in ENCRYPTED_EXTENSIONS.get(ext.lower(), ()):
+            enc_path = PATHS.resolve(base + enc_ext)
+            if isfile(enc_path):
+                return enc_path
+        return None
+
+    def open(self, enc_path, is_png, info=None):
+        """ Returns (file object, plain size, encrypted file stat). """
+        f = open(enc_path, 'rb')
+        try:
+            fs = fstat(f.fileno())
+            size = fs.st_size - ENC_HEADER_LENGTH
+            key = (enc_path, fs.st_mtime_ns)
+            cached = self.cache.get(key)
+            if info is not None:
+                info['cache'] = 'miss' if cached is None else 'hit'
+            if cached is not None:
+                if len(cached) == size: # small file kept whole
+                    f.close()
+                    return io.BytesIO(cached), size, fs
+                return DecryptedFile(f, cached), size, fs
+            f.seek(ENC_HEADER_LENGTH)
+            header = f.read(ENC_HEADER_LENGTH)
+            header = xor(header, self.key) if self.key or not is_png else PNG_HEADER
+            if size <= SMALL_FILE_SIZE:
+                data = header + f.read()
+                f.close()
+                self.cache.put(key, data)
+                return io.BytesIO(data), size, fs
+            self.cache.put(key, header)
+            return DecryptedFile(f, header), size, fs
+        except:
+            f.close()
+            raise
+
+DECRYPTOR = Decryptor(find_key(_wdir)) if args.decrypt else None
+
+COMPRESS_EXTENSIONS = ('.json', '.js', '.html', '.css', '.txt', '.csv', '.svg')
+COMPRESS_MIN_SIZE = 512
+COMPRESS_CACHE_SIZE = 128 * 1024 * 1024
+
+class Compressor(object):
+    """ Compresses text assets once per file version and keeps the results
+        in memory, keyed by path, mtime and encoding.
+    """
+    def __init__(self):
+        self.cache = LRUCache(COMPRESS_CACHE_SIZE)
+        self.encodings = (['br'] if brotli else []) + ['gzip']
+
+    def is_compressible(self, path):
+        return path.lower().endswith(COMPRESS_EXTENSIONS)
+
+    def negotiate(self, size, headers):
+        """ Returns the best encoding both sides support or None. """
+        if size < COMPRESS_MIN_SIZE:
+            return None
+        accepted = {}
+        for item in headers.get('Accept-Encoding', '').split(','):
+            name, _, params = item.strip().partition(';')
+            q = 1.0
+            if params.strip().startswith('q='):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    pass
+            accepted[name.strip().lower()] = q
+        for encoding in self.encodings:
+            if accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def compress(self, path, fs, f, encoding, info=None):
+        key = (path, fs.st_mtime_ns, fs.st_size, encoding)
+        data = self.cache.get(key)
+        if info is not None:
+            info['cache'] = 'miss' if data is None else 'hit'
+        if data is None:
+            data = f.read()
+            data = brotli.compress(data) if encoding == 'br' else gzip.compress(data, 9)
+            self.cache.put(key, data)
+        return data
+
+COMPRESSOR = Compressor() if args.compress else None
 
 MAIN_IP = "127.0.0.1"
 MAIN_PORT = 8000
@@ -28,22 +272,491 @@ BROWSER_PATH = 'c:/Program Files/Mozilla Firefox/firefox.exe -private "%s"'
 
 print(f"Running server from: {_wdir} at http://{MAIN_IP}:{MAIN_PORT}")
 
+KEEP_ALIVE_TIMEOUT = 15
+CHUNK_SIZE = 256 * 1024
+
 class DualStackServer(ThreadingHTTPServer):
+    def __init__(self, server_address, *args, **kwargs):
+        if ':' in server_address[0]:
+            self.address_family = socket.AF_INET6
+        super().__init__(server_address, *args, **kwargs)
+
     def server_bind(self):
+        if self.address_family == socket.AF_INET6:
+            try: # accept IPv4 connections too
+                self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+            except Exception:
+                pass
+        return super().server_bind()
+
+RE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+class FileRange(object):
+    """ Read-only view of length bytes of an open file from its current position. """
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+def make_etag(fs):
+    return f'"{fs.st_size:x}-{fs.st_mtime_ns:x}"'
+
+def parse_range(header, size):
+    """ Returns (start, end) of a single byte range, None if there is none
+        and False if it can't be satisfied.
+    """
+    match = RE_RANGE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == '':
+        return None
+    if match.group(1) == '': # suffix range: the last N bytes
+        length = int(match.group(2))
+        return (max(0, size - length), size - 1) if length else False
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+def is_not_modified(headers, etag, fs):
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        return if_none_match.strip() == '*' or etag in [t.strip() for t in if_none_match.split(',')]
+    if_modified_since = headers.get('If-Modified-Since')
+    if if_modified_since:
         try:
-            self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
-        except Exception:
+            return int(fs.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
             pass
-        return super().server_bind()
+    return False
+
+def guess_type(path):
+    ext = splitext(path)[1].lower()
+    return (SimpleHTTPRequestHandler.extensions_map.get(ext) or
+        mimetypes.guess_type(path)[0] or 'application/octet-stream')
+
+def open_source(path, info=None):
+    """ Returns (file object, size, stat, etag) of the content for a path
+        or None if there is no such file.
+    """
+    if not isfile(path):
+        enc_path = DECRYPTOR.find_encrypted(path) if DECRYPTOR and not path.endswith('/') else None
+        if not enc_path:
+            return None
+        f, size, fs = DECRYPTOR.open(enc_path, path.lower().endswith('.png'), info)
+        return f, size, fs, make_etag(fs)[:-1] + '-dec"'
+    f = open(path, 'rb')
+    fs = fstat(f.fileno())
+    if DECRYPTOR and path.endswith('System.json'):
+        # Let the engine request the plain asset names
+        data = RE_ENC_FLAGS.sub(rb'\1false', f.read())
+        f.close()
+        return io.BytesIO(data), len(data), fs, make_etag(fs)[:-1] + '-dec"'
+    return f, fs.st_size, fs, make_etag(fs)
+
+def build_response(path, headers, info=None):
+    """ Prepares a file response with strong validators (ETag/Last-Modified -> 304)
+        and single byte ranges (206).
+        Returns (status, [(header, value)], body or None) or None if the path
+        isn't a file (directories, 404s). Memory cache use goes into info['cache'].
+    """
+    if path.endswith('/'):
+        return None
+    try:
+        source = open_source(path, info)
+    except OSError:
+        source = None
+    if source is None:
+        return None
+    f, size, fs, etag = source
+    try:
+        encoding = None
+        vary = []
+        if COMPRESSOR and COMPRESSOR.is_compressible(path):
+            vary = [("Vary", "Accept-Encoding")]
+            if not headers.get('Range'):
+                encoding = COMPRESSOR.negotiate(size, headers)
+        if encoding:
+            etag = etag[:-1] + '-' + encoding + '"'
+        if is_not_modified(headers, etag, fs):
+            f.close()
+            if info is not None:
+                info['cache'] = 'client'
+            return 304, [("ETag", etag)] + vary, None
+
+        if encoding:
+            data = COMPRESSOR.compress(path, fs, f, encoding, info)
+            f.close()
+            return 200, vary + [
+                ("Content-type", guess_type(path)),
+                ("Content-Encoding", encoding),
+                ("Content-Length", str(len(data))),
+                ("ETag", etag),
+                ("Last-Modified", formatdate(fs.st_mtime, usegmt=True)),
+                ("Cache-Control", "no-cache"),
+            ], FileRange(io.BytesIO(data), len(data))
+
+        byte_range = parse_range(headers.get('Range'), size)
+        if_range = headers.get('If-Range')
+        if byte_range is not None and if_range and if_range.strip() != etag:
+            byte_range = None
+        if byte_range is False:
+            f.close()
+            return 416, [("Content-Range", f"bytes */{size}"), ("Content-Length", "0")], None
+
+        response_headers = list(vary)
+        if byte_range:
+            start, end = byte_range
+            status = 206
+            response_headers.append(("Content-Range", f"bytes {start}-{end}/{size}"))
+            f.seek(start)
+            length = end - start + 1
+        else:
+            status = 200
+            length = size
+        response_headers += [
+            ("Content-type", guess_type(path)),
+            ("Content-Length", str(length)),
+            ("Accept-Ranges", "bytes"),
+            ("ETag", etag),
+            ("Last-Modified", formatdate(fs.st_mtime, usegmt=True)),
+            ("Cache-Control", "no-cache"),
+        ]
+        return status, response_headers, FileRange(f, length)
+    except:
+        f.close()
+        raise
+
+ACCESS_LOG_SIZE = 20000
+STATS_PATH = '/__stats'
+
+def percentile(values, p):
+    """ Nearest-rank percentile of sorted values. """
+    if not values:
+        return None
+    return values[max(0, ceil(p / 100 * len(values)) - 1)]
+
+class AccessLog(object):
+    """ Ring buffer of the latest requests with their timings; requests that
+        carry a Referer get the time since that page was served.
+    """
+    def __init__(self, size=ACCESS_LOG_SIZE):
+        self.entries = deque(maxlen=size)
+        self.pages = {} # page path -> time it was served
+        self.lock = threading.Lock()
+
+    def record(self, url_path, status, sent, ttfb, total, cache, referer, start):
+        path = unquote(url_path.split('?', 1)[0])
+        entry = {
+            'path': path,
+            'status': status,
+            'bytes': sent,
+            'ttfb_ms': round(ttfb * 1000, 3),
+            'total_ms': round(total * 1000, 3),
+            'cache': cache,
+        }
+        with self.lock:
+            if path.endswith(('/', '.html')):
+                self.pages[path] = start
+            if referer:
+                page = urlsplit(referer).path
+                if page in self.pages:
+                    entry['referer'] = page
+                    entry['since_page_ms'] = round((start - self.pages[page]) * 1000, 3)
+            self.entries.append(entry)
+
+    def summary(self, last=0):
+        """ Counts, bytes, cache use and time percentiles per folder and per extension. """
+        with self.lock:
+            entries = list(self.entries)
+        groups = {'folders': {}, 'extensions': {}}
+        for entry in entries:
+            folder = posixpath.dirname(entry['path']) or '/'
+            ext = splitext(entry['path'])[1].lower() or '(none)'
+            for group, name in (('folders', folder), ('extensions', ext)):
+                stat = groups[group].setdefault(name, {'count': 0, 'bytes': 0, 'cache': {}, 'total': [], 'ttfb': []})
+                stat['count'] += 1
+                stat['bytes'] += entry['bytes']
+                cache = entry['cache'] or 'none'
+                stat['cache'][cache] = stat['cache'].get(cache, 0) + 1
+                stat['total'].append(entry['total_ms'])
+                stat['ttfb'].append(entry['ttfb_ms'])
+        for group in groups.values():
+            for stat in group.values():
+                for name in ('total', 'ttfb'):
+                    values = sorted(stat.pop(name))
+                    stat[name + '_ms'] = {f'p{p}': percentile(values, p) for p in (50, 90, 99)}
+                    stat[name + '_ms']['max'] = values[-1]
+        result = {'requests': len(entries), **groups}
+        if last:
+            result['last'] = entries[-last:]
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.pages.clear()
+
+ACCESS_LOG = AccessLog()
+
+def stats_response(url_path):
+    """ /__stats: JSON summary; ?last=N adds the last N requests, ?reset=1 clears the log. """
+    query = parse_qs(urlsplit(url_path).query)
+    if query.get('reset', ['0'])[0] not in ('0', ''):
+        ACCESS_LOG.clear()
+    try:
+        last = int(query.get('last', ['0'])[0])
+    except ValueError:
+        last = 0
+    data = json.dumps(ACCESS_LOG.summary(last), indent=1).encode('utf-8')
+    return 200, [
+        ("Content-type", "application/json"),
+        ("Content-Length", str(len(data))),
+        ("Cache-Control", "no-store"),
+    ], FileRange(io.BytesIO(data), len(data))
+
+def is_stats_request(url_path):
+    return url_path == STATS_PATH or url_path.startswith(STATS_PATH + '?')
+
+INVALIDATE_PATH = '/__invalidate'
+
+def cache_paths(path):
+    """ The path and its plain/encrypted counterparts the caches may key it by. """
+    base, ext = splitext(path)
+    paths = {path}
+    for plain_ext, enc_exts in ENCRYPTED_EXTENSIONS.items():
+        if ext.lower() == plain_ext:
+            paths.update(base + enc_ext for enc_ext in enc_exts)
+        elif ext.lower() in enc_exts:
+            paths.add(base + plain_ext)
+    return paths
+
+def invalidate_response(url_path):
+    """ /__invalidate?path=/data/Map001.json&path=...: drops the memory cache entries and
+        directory listings of the paths (for tools rewriting files faster than mtimes change).
+    """
+    paths = set()
+    for path in parse_qs(urlsplit(url_path).query).get('path', []):
+        paths |= cache_paths(translate_url_path(path))
+    count = 0
+    for cache in (DECRYPTOR and DECRYPTOR.cache, COMPRESSOR and COMPRESSOR.cache):
+        if cache:
+            count += cache.discard(lambda key: key[0] in paths)
+    for path in paths:
+        count += PATHS.dirs.pop(dirname(path), None) is not None
+    data = json.dumps({'paths': len(paths), 'invalidated': count}).encode('utf-8')
+    return 200, [
+        ("Content-type", "application/json"),
+        ("Content-Length", str(len(data))),
+        ("Cache-Control", "no-store"),
+    ], FileRange(io.BytesIO(data), len(data))
+
+def is_invalidate_request(url_path):
+    return url_path == INVALIDATE_PATH or url_path.startswith(INVALIDATE_PATH + '?')
 
 class Handler(SimpleHTTPRequestHandler):
+    # Persistent connections: every response has a known Content-Length
+    protocol_version = "HTTP/1.1"
+
     def translate_path(self, path):
         path = super().translate_path(path)
-        return PATHS.get(path.lower(), path)
+        return PATHS.resolve(path)
+
+    def send_response(self, code, message=None):
+        self.status_code = code
+        super().send_response(code, message)
+
+    def send_head(self):
+        """ Serves files through build_response; directories go the default way. """
+        self.cache_info = {}
+        if is_stats_request(self.path):
+            response = stats_response(self.path)
+        elif is_invalidate_request(self.path):
+            response = invalidate_response(self.path)
+        else:
+            response = build_response(self.translate_path(self.path), self.headers, self.cache_info)
+        if response is None:
+            body = super().send_head()
+        else:
+            status, headers, body = response
+            self.send_response(status)
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+        self.first_byte_time = perf_counter()
+        self.body_length = body.remaining if isinstance(body, FileRange) else 0
+        return body
+
+    def timed(self, method):
+        start = perf_counter()
+        self.status_code = None
+        self.first_byte_time = None
+        self.body_length = 0
+        self.cache_info = {}
+        method()
+        if is_stats_request(self.path) or is_invalidate_request(self.path):
+            return
+        end = perf_counter()
+        ACCESS_LOG.record(self.path, self.status_code, self.body_length if self.command == 'GET' else 0,
+            (self.first_byte_time or end) - start, end - start,
+            self.cache_info.get('cache'), self.headers.get('Referer'), start)
+
+    def do_GET(self):
+        self.timed(super().do_GET)
+
+    def do_HEAD(self):
+        self.timed(super().do_HEAD)
+
+def translate_url_path(url_path):
+    """ Same mapping of URL paths to files as SimpleHTTPRequestHandler.translate_path. """
+    path = url_path.split('?', 1)[0].split('#', 1)[0]
+    trailing_slash = path.rstrip().endswith('/')
+    path = posixpath.normpath(unquote(path, errors='surrogatepass'))
+    result = _wdir
+    for word in filter(None, path.split('/')):
+        if dirname(word) or word in (curdir, pardir):
+            continue
+        result = join(result, word)
+    if trailing_slash:
+        result += '/'
+    return PATHS.resolve(result)
+
+class AsyncServer(object):
+    """ Asyncio HTTP/1.1 file server: files go out with loop.sendfile (zero-copy
+        where the OS supports it), everything else is written in chunks waiting
+        for the socket to drain, and at most max_connections clients are served
+        at once. Building responses (stat, open, decryption, compression) and
+        reading non-sendfile bodies run in the default executor, so a cache miss
+        doesn't hold up the other clients.
+    """
+    def __init__(self, host, port, max_connections=MAX_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.slots = None
+
+    async def send_body(self, writer, body):
+        if isinstance(body, FileRange) and isinstance(body.f, io.BufferedReader):
+            await writer.drain()
+            sent = await asyncio.get_running_loop().sendfile(
+                writer.transport, body.f, body.f.tell(), body.remaining)
+            body.remaining -= sent
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            data = await loop.run_in_executor(None, body.read, CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+
+    async def respond(self, writer, status, headers, body=None, keep_alive=True):
+        """ Sends a response; returns the time the headers went out. """
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Date: {formatdate(usegmt=True)}"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        if not keep_alive:
+            lines.append("Connection: close")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        first_byte_time = perf_counter()
+        if body is not None:
+            try:
+                await self.send_body(writer, body)
+            finally:
+                body.close()
+        await writer.drain()
+        return first_byte_time
+
+    @staticmethod
+    def file_response(url_path, headers, info):
+        path = translate_url_path(url_path)
+        if isdir(path) and not path.endswith('/'):
+            location = url_path.split('?', 1)[0] + '/'
+            return 301, [("Location", location), ("Content-Length", "0")], None
+        if isdir(path):
+            path = join(path, 'index.html')
+        return build_response(path, headers, info)
+
+    async def handle_request(self, writer, method, url_path, headers, keep_alive):
+        start = perf_counter()
+        info = {}
+        if method not in ('GET', 'HEAD'):
+            await self.respond(writer, 501, [("Content-Length", "0")], keep_alive=keep_alive)
+            return
+        if is_stats_request(url_path):
+            await self.respond(writer, *stats_response(url_path), keep_alive)
+            return
+        if is_invalidate_request(url_path):
+            await self.respond(writer, *invalidate_response(url_path), keep_alive)
+            return
+        response = await asyncio.get_running_loop().run_in_executor(
+            None, self.file_response, url_path, headers, info)
+        if response is None:
+            response = 404, [("Content-Length", "0")], None
+        status, response_headers, body = response
+        if method == 'HEAD' and body is not None:
+            body.close()
+            body = None
+        sent = body.remaining if body is not None else 0
+        first_byte_time = await self.respond(writer, status, response_headers, body, keep_alive)
+        end = perf_counter()
+        ACCESS_LOG.record(url_path, status, sent, first_byte_time - start, end - start,
+            info.get('cache'), headers.get('Referer'), start)
+
+    async def handle(self, reader, writer):
+        async with self.slots:
+            try:
+                while True:
+                    try:
+                        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+                    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                        break
+                    request_line, _, header_bytes = head.partition(b'\r\n')
+                    try:
+                        method, url_path, version = request_line.decode('latin-1').split()
+                    except ValueError:
+                        await self.respond(writer, 400, [("Content-Length", "0")], keep_alive=False)
+                        break
+                    headers = BytesParser(_class=HTTPMessage).parsebytes(header_bytes)
+                    connection = headers.get('Connection', '').lower()
+                    keep_alive = (connection != 'close') if version == 'HTTP/1.1' else (connection == 'keep-alive')
+                    content_length = int(headers.get('Content-Length') or 0)
+                    if content_length:
+                        await reader.readexactly(content_length)
+                    await self.handle_request(writer, method, url_path, headers, keep_alive)
+                    if not keep_alive:
+                        break
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            except Exception as e:
+                print(f"Error serving {writer.get_extra_info('peername')}: {e!r}")
+            finally:
+                writer.close()
+
+    async def serve(self):
+        self.slots = asyncio.Semaphore(self.max_connections)
+        server = await asyncio.start_server(self.handle, self.host, self.port, backlog=self.max_connections)
+        async with server:
+            await server.serve_forever()
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
 
 
 def main(server_class=DualStackServer, handler_class=Handler):
-    server = DualStackServer((MAIN_IP, MAIN_PORT), Handler)
+    if args.engine == 'asyncio':
+        server = AsyncServer(MAIN_IP, MAIN_PORT, args.max_connections)
+    else:
+        server = server_class((MAIN_IP, MAIN_PORT), handler_class)
     thread = threading.Thread(target = server.serve_forever)
     thread.daemon = True
     thread.start()
@@ -53,9 +766,9 @@ def main(server_class=DualStackServer, handler_class=Handler):
     try:
         while 1: sleep(1)
     except KeyboardInterrupt:
-        server.shutdown()
+        if args.engine != 'asyncio':
+            server.shutdown()
 
 
 if __name__ == '__main__':
     main()
-
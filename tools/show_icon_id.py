@@ -1,8 +1,16 @@
-import FreeSimpleGUI as sg
 import PIL.Image
-import PIL.ImageDraw
 import io
 import os
+import re
+import json
+import hashlib
+
+ICONSET_PATH = os.path.join('img', 'system', 'IconSet.png')
+ICON_SIZE = 32
+ICONS_PER_ROW = 16  # fixed in rpg_core.js/rmmz_core.js: x = iconIndex % 16
+ICON_SIZE_PLUGIN_PARAMS = [('YEP_CoreEngine', 'Icon Width', 'Icon Height')]
+RE_ICON_CODE = re.compile(r'\\\\I\[(\d+)\]', re.IGNORECASE)  # \I[n] escaped as in the JSON text
+RE_ICON_INDEX = re.compile(r'("iconIndex"\s*:\s*)(\d+)')
 
 def convert_to_bytes(img):
     """Convert PIL image to bytes for PySimpleGUI"""
@@ -10,13 +18,11 @@ def convert_to_bytes(img):
     img.save(bio, format='PNG')
     return bio.getvalue()
 
-def draw_icon_border_on_image(sheet, icon_x, icon_y, color='red', width=2):
-    """Draw a border around an icon at the specified grid position directly on the image"""
-    x = icon_x * ICON_SIZE
-    y = icon_y * ICON_SIZE
-    draw = PIL.ImageDraw.Draw(sheet)
-    draw.rectangle([x, y, x + ICON_SIZE, y + ICON_SIZE], outline=color, width=width)
-    return sheet
+def icon_rectangle(icon_x, icon_y, icon_width=ICON_SIZE, icon_height=ICON_SIZE):
+    """Top left and bottom right graph coordinates of an icon at the specified grid position"""
+    x = icon_x * icon_width
+    y = icon_y * icon_height
+    return (x, y), (x + icon_width, y + icon_height)
 
 def load_iconset(path):
     try:
@@ -24,15 +30,100 @@ def load_iconset(path):
     except:
         return None
 
-def main():
-    global ICON_SIZE
-    ICON_SIZE = 32
-    ICONS_PER_ROW = 16
-    ICONS_PER_COLUMN = 16
-    TOTAL_ICONS = ICONS_PER_ROW * ICONS_PER_COLUMN
+def read_icon_geometry(data_dir):
+    """Icon width and height from the game's System.json (MZ) or plugin settings"""
+    try:
+        with open(os.path.join(data_dir, 'System.json'), 'r', encoding='utf-8-sig') as f:
+            size = json.load(f).get('iconSize')  # MZ only
+            if size: return int(size), int(size)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(data_dir, '..', 'js', 'plugins.js'), 'r', encoding='utf-8-sig') as f:
+            plugins_js = f.read()
+        plugins_js = plugins_js[plugins_js.find('['):plugins_js.rfind(']') + 1]
+        plugins = {p['name']: p for p in json.loads(plugins_js) if p and p.get('status')}
+    except (OSError, ValueError):
+        return ICON_SIZE, ICON_SIZE
+    for plugin, width_param, height_param in ICON_SIZE_PLUGIN_PARAMS:
+        params = plugins.get(plugin, {}).get('parameters', {})
+        width, height = params.get(width_param, ''), params.get(height_param, '')
+        if width.isdigit() and height.isdigit():
+            return int(width), int(height)
+    return ICON_SIZE, ICON_SIZE
+
+class IconSheet:
+    """Icons of a sheet sliced into an (N, height, width, RGBA) array; icon N sits at
+    column N % 16 and row N // 16 like in the game (needs NumPy, unlike the viewer)"""
+    def __init__(self, sheet, icon_width=ICON_SIZE, icon_height=ICON_SIZE):
+        import numpy as np
+        self.icon_width, self.icon_height = icon_width, icon_height
+        pixels = np.asarray(sheet.convert('RGBA'))
+        rows = pixels.shape[0] // icon_height
+        grid = np.zeros((rows * icon_height, ICONS_PER_ROW * icon_width, 4), dtype=np.uint8)
+        width = min(grid.shape[1], pixels.shape[1])
+        grid[:, :width] = pixels[:rows * icon_height, :width]
+        self.tiles = grid.reshape(rows, icon_height, ICONS_PER_ROW, icon_width, 4).swapaxes(1, 2).reshape(-1, icon_height, icon_width, 4)
+        self.blank = ~self.tiles[..., 3].any(axis=(1, 2))
+        self.hashes = average_hash(self.tiles)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def exact_hash(self, index):
+        return hashlib.blake2b(self.tiles[index].tobytes(), digest_size=8).hexdigest()
+
+    def find(self, image, limit=3):
+        """Returns [(icon index, hash distance, is exact)] of the icons closest to the image"""
+        import numpy as np
+        image = image.convert('RGBA')
+        if image.size != (self.icon_width, self.icon_height):
+            image = image.resize((self.icon_width, self.icon_height), PIL.Image.LANCZOS)
+        query = np.asarray(image)[np.newaxis]
+        exact = (self.tiles == query).all(axis=(1, 2, 3))
+        distances = (self.hashes != average_hash(query)).sum(axis=1)
+        if query[..., 3].any():
+            distances[self.blank] = distances.max(initial=0) + 1
+        order = np.lexsort((distances, ~exact))[:limit]
+        return [(int(i), int(distances[i]), bool(exact[i])) for i in order]
+
+    def is_blank(self, indices):
+        """Mask of the indices that point to transparent icons or outside of the sheet"""
+        import numpy as np
+        indices = np.asarray(indices, dtype=np.int64)
+        inside = (indices >= 0) & (indices < len(self))
+        return ~inside | self.blank[np.where(inside, indices, 0)]
 
-    # Default path for RPG Maker MV IconSet
-    default_path = os.path.join('.', 'www', 'img', 'system', 'IconSet.png')
+def average_hash(tiles):
+    """64-bit average hashes of (N, height, width, RGBA) tiles as an (N, 64) bool array"""
+    import numpy as np
+    gray = tiles[..., :3].astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    gray *= tiles[..., 3] / 255.0
+    n, height, width = gray.shape
+    if height < 8 or width < 8:  # icons smaller than the hash: repeat their pixels
+        gray = gray.repeat(-(-8 // height), axis=1).repeat(-(-8 // width), axis=2)
+        height, width = gray.shape[1:]
+    bh, bw = height // 8, width // 8
+    small = gray[:, :bh * 8, :bw * 8].reshape(n, 8, bh, 8, bw).mean(axis=(2, 4))
+    return (small > small.mean(axis=(1, 2), keepdims=True)).reshape(n, 64)
+
+def collect_icon_refs(data_dir):
+    """Icon indices used by iconIndex values (in any data file) and message codes (\\I[n])
+    as {index: [file names]}"""
+    refs = {}
+    for name in sorted(os.listdir(data_dir)):
+        stem, ext = os.path.splitext(name)
+        if ext != '.json': continue
+        with open(os.path.join(data_dir, name), 'r', encoding='utf-8-sig') as f:
+            text = f.read()
+        used = {int(n) for n in RE_ICON_CODE.findall(text)}
+        used.update(int(n) for _, n in RE_ICON_INDEX.findall(text))
+        for index in used:
+            refs.setdefault(index, []).append(stem)
+    return refs
+
+def show_viewer(default_path, icon_width=ICON_SIZE, icon_height=ICON_SIZE):
+    import FreeSimpleGUI as sg
 
     # Try to load the default path first
     sheet = None
@@ -64,15 +155,13 @@ def main():
             sg.popup_error(f'Error: Could not load {icon_path}')
             return
 
+    TOTAL_ICONS = ICONS_PER_ROW * (sheet.height // icon_height)
     current_icon = 0
     current_x = current_y = 0
 
     screen_height = sg.Window.get_screen_size()[1]
     max_height = min(sheet.height, screen_height - 200)
 
-    # Pre-render the red square on the initial icon
-    sheet_with_border = draw_icon_border_on_image(sheet.copy(), current_x, current_y)
-
     layout = [
         [sg.Column([
             [sg.Graph(
@@ -94,14 +183,13 @@ def main():
     graph = window['-GRAPH-']
     column = window['-COL-']
 
-    # Display the initial pre-rendered image (with the red square)
-    graph.draw_image(data=convert_to_bytes(sheet_with_border), location=(0, 0))
+    # The sheet is encoded only once, the red square is a separate figure on top of it
+    graph.draw_image(data=convert_to_bytes(sheet), location=(0, 0))
+    square = graph.draw_rectangle(*icon_rectangle(current_x, current_y, icon_width, icon_height), line_color='red', line_width=2)
 
     def update_image_with_square(icon_x, icon_y):
-        """Update the image using the pre-rendered square and draw it at the new position"""
-        graph.erase()
-        updated_image = draw_icon_border_on_image(sheet.copy(), icon_x, icon_y)
-        graph.draw_image(data=convert_to_bytes(updated_image), location=(0, 0))
+        """Move the red square to the new position"""
+        graph.relocate_figure(square, *icon_rectangle(icon_x, icon_y, icon_width, icon_height)[0])
 
     while True:
         event, values = window.read()
@@ -115,10 +203,10 @@ def main():
             x, y = values['-GRAPH-']
 
             # Determine the icon grid position from absolute coordinates
-            icon_x = int(x) // ICON_SIZE
-            icon_y = int(y) // ICON_SIZE
+            icon_x = int(x) // icon_width
+            icon_y = int(y) // icon_height
 
-            if 0 <= icon_x < ICONS_PER_ROW and 0 <= icon_y < sheet.height // ICON_SIZE:
+            if 0 <= icon_x < ICONS_PER_ROW and 0 <= icon_y < sheet.height // icon_height:
                 current_icon = icon_y * ICONS_PER_ROW + icon_x
                 current_x, current_y = icon_x, icon_y
 
@@ -135,12 +223,53 @@ def main():
         current_x = current_icon % ICONS_PER_ROW
         current_y = current_icon // ICONS_PER_ROW
 
-        # Move the pre-rendered image with a red square if the position changes
+        # Move the red square if the position changes
         if (old_x, old_y) != (current_x, current_y):
             update_image_with_square(current_x, current_y)
             window['-CURRENT-'].update(str(current_icon))
 
     window.close()
 
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Shows ids of the icons on an RPG Maker IconSet.png; with any option it works without the GUI.')
+    parser.add_argument('game_dir', nargs='?', default='www', help='Path to the RPG Maker project directory (default: www)')
+    parser.add_argument('-s', '--sheet', help='Path to the decrypted IconSet (default: <game_dir>/img/system/IconSet.png)')
+    parser.add_argument('-z', '--icon-size', metavar='WxH', help='Icon size (default: from System.json/plugins.js or 32x32)')
+    parser.add_argument('-f', '--find', nargs='+', metavar='PNG', help='Print the icon indices matching the images')
+    parser.add_argument('-b', '--blank-refs', action='store_true', help='Print the icon indices used in the data files which point to blank icons')
+    parser.add_argument('-x', '--index', metavar='FILE', help='Write a JSON index of the icons with their hashes')
+    args = parser.parse_args()
+
+    sheet_path = args.sheet or os.path.join(args.game_dir, ICONSET_PATH)
+    if args.icon_size:
+        icon_width, icon_height = (int(n) for n in args.icon_size.lower().split('x'))
+    else:
+        icon_width, icon_height = read_icon_geometry(os.path.join(args.game_dir, 'data'))
+    if not (args.find or args.blank_refs or args.index):
+        show_viewer(sheet_path, icon_width, icon_height)
+        return
+
+    import numpy as np
+    sheet = load_iconset(sheet_path)
+    if sheet is None:
+        print(f'Error: Could not load {sheet_path}')
+        return
+    icons = IconSheet(sheet, icon_width, icon_height)
+    print(f'{sheet_path}: {len(icons)} icons of {icon_width}x{icon_height}, {int(icons.blank.sum())} blank')
+    for path in args.find or []:
+        matches = icons.find(PIL.Image.open(path))
+        print(f'{path}: ' + ', '.join(f'{i} ({"exact" if exact else f"distance {d}"})' for i, d, exact in matches))
+    if args.blank_refs:
+        refs = collect_icon_refs(os.path.join(args.game_dir, 'data'))
+        indices = sorted(refs)
+        for index in np.asarray(indices)[icons.is_blank(indices)] if indices else []:
+            print(f'Icon {index} is blank or missing, used in: {", ".join(refs[index])}')
+    if args.index:
+        with open(args.index, 'w', encoding='utf-8') as f:
+            json.dump([{'index': i, 'blank': bool(icons.blank[i]), 'hash': icons.exact_hash(i),
+                        'ahash': f'{int(np.packbits(icons.hashes[i]).view(">u8")[0]):016x}'} for i in range(len(icons))], f, indent=1)
+
 if __name__ == '__main__':
     main()
\ No newline at end of file